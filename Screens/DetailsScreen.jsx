@@ -226,6 +226,7 @@ function ImageComparisonModal({
   visible, 
   onClose, 
   referenceImage, 
+  reportId, 
   reportType, 
   themeColors 
 }) {
@@ -317,26 +318,48 @@ function ImageComparisonModal({
       }
 
       console.log('🔄 Converting images to base64...');
-      const img1Base64 = await imageToBase64(referenceImage);
       const img2Base64 = await imageToBase64(capturedImage);
 
-      if (!img1Base64 || !img2Base64) {
+      if (!img2Base64) {
         throw new Error('Image conversion produced empty data');
       }
 
-      console.log('✓ Images converted, sending to API...');
-      const response = await fetch(`${API_URL}/compare`, {
+      const postJson = (path, body) => fetch(`${API_URL}${path}`, {
         method: 'POST',
         headers: { 
           'Content-Type': 'application/json',
           'Accept': 'application/json'
         },
-        body: JSON.stringify({
-          image1: img1Base64,
-          image2: img2Base64,
-        }),
+        body: JSON.stringify(body),
       });
 
+      // The reference photo is enrolled on the server once and then
+      // compared by id; the photo URL is part of the id so an edited
+      // report photo gets enrolled afresh
+      const galleryId = reportId ? `${reportId}:${referenceImage}` : null;
+      let response = null;
+
+      if (galleryId) {
+        console.log('✓ Image converted, comparing against enrolled photo...');
+        response = await postJson('/compare', { image1_id: galleryId, image2: img2Base64 });
+      }
+
+      if (!response || response.status === 404 || response.status === 409) {
+        const img1Base64 = await imageToBase64(referenceImage);
+        if (!img1Base64) {
+          throw new Error('Image conversion produced empty data');
+        }
+
+        const enrolled = galleryId
+          ? (await postJson('/enroll', { id: galleryId, image: img1Base64 })).ok
+          : false;
+
+        console.log('✓ Images converted, sending to API...');
+        response = enrolled
+          ? await postJson('/compare', { image1_id: galleryId, image2: img2Base64 })
+          : await postJson('/compare', { image1: img1Base64, image2: img2Base64 });
+      }
+
       if (!response.ok) {
         const errorData = await response.json().catch(() => ({}));
         throw new Error(errorData.message || `Server returned ${response.status}`);
@@ -936,6 +959,7 @@ export default function DetailsScreen({ route }) {
         visible={showComparisonModal}
         onClose={() => setShowComparisonModal(false)}
         referenceImage={report.photo}
+        reportId={report.id}
         reportType={report.type}
         themeColors={themeColors}
       />
@@ -0,0 +1,122 @@
+"""
+Admission control and request deadlines.
+
+Every admitted request holds one of max_concurrent slots while it runs.
+Up to max_queue more wait for a slot in arrival order (before reading
+their bodies, so waiting costs no upload memory); beyond that a request
+is turned away at once with QueueFull. A surge then costs the rejected
+clients a retry instead of costing everyone a timeout.
+
+A request's deadline (a time.monotonic() timestamp) rides along in a
+contextvar. It bounds the wait for a slot, and check_deadline() is
+called again before expensive work, so nothing is computed for a client
+that has already given up. Work handed to other threads keeps the
+deadline only if it runs in a copy of the request's context
+(contextvars.copy_context().run).
+"""
+import contextvars
+import math
+import threading
+import time
+from collections import deque
+
+
+class QueueFull(Exception):
+    pass
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+_deadline = contextvars.ContextVar('request_deadline', default=None)
+
+
+def set_deadline(deadline):
+    return _deadline.set(deadline)
+
+
+def reset_deadline(token):
+    _deadline.reset(token)
+
+
+def get_deadline():
+    return _deadline.get()
+
+
+def check_deadline(stage):
+    deadline = _deadline.get()
+    if deadline is not None and time.monotonic() >= deadline:
+        raise DeadlineExceeded(f"Deadline exceeded before {stage}")
+
+
+class AdmissionController:
+    # Weight of the latest request in the service time average
+    SMOOTHING = 0.2
+
+    def __init__(self, max_concurrent=4, max_queue=8):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.service_seconds = None
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self, deadline=None):
+        """Wait for a slot; raises QueueFull, or DeadlineExceeded if the deadline passes first"""
+        with self._lock:
+            if self.active < self.max_concurrent and not self._waiters:
+                self.active += 1
+                self.admitted += 1
+                return
+            if len(self._waiters) >= self.max_queue:
+                self.rejected += 1
+                raise QueueFull(f"{self.active} requests running and {len(self._waiters)} waiting")
+            slot = threading.Event()
+            self._waiters.append(slot)
+
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        slot.wait(timeout)
+        with self._lock:
+            # release() hands the slot over under the lock, so this can't race
+            if slot.is_set():
+                self.admitted += 1
+                return
+            self._waiters.remove(slot)
+            self.timed_out += 1
+        raise DeadlineExceeded("Deadline exceeded waiting for a free slot")
+
+    def release(self, seconds):
+        """Free a slot held for seconds, passing it to the longest waiter"""
+        with self._lock:
+            if self.service_seconds is None:
+                self.service_seconds = seconds
+            else:
+                self.service_seconds += self.SMOOTHING * (seconds - self.service_seconds)
+            if self._waiters:
+                self._waiters.popleft().set()
+            else:
+                self.active -= 1
+
+    def retry_after(self):
+        """Seconds until a retry is likely to get in: the queue drained at the recent pace"""
+        with self._lock:
+            service_seconds = self.service_seconds or 1.0
+            backlog = len(self._waiters) + 1
+        return min(60, max(1, math.ceil(service_seconds * backlog / self.max_concurrent)))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'active': self.active,
+                'waiting': len(self._waiters),
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'service_ms': round(self.service_seconds * 1000, 2) if self.service_seconds is not None else None
+            }
@@ -1,154 +1,854 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import numpy as np
-import cv2
-import base64
+import contextvars
 from datetime import datetime
-from PIL import Image
-import io
+import json
+import logging
+import heapq
+import logging.handlers
 import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from google.cloud import vision
-import tensorflow as tf
-from tensorflow.keras.applications import MobileNetV2
-from tensorflow.keras.applications.mobilenet_v2 import preprocess_input
 from scipy.spatial.distance import cosine
+from admission import AdmissionController, DeadlineExceeded, QueueFull, check_deadline, get_deadline, reset_deadline, set_deadline
+from batcher import BATCH_SIZE_BUCKETS, MicroBatcher
+from classifier import ClassificationHead
+from embedding_store import CropStore, EmbeddingStore, LRUCache
+from embedding_backends import create_backend, embedding_namespace
+from embedding_matrix import EmbeddingMatrix
+from face_align import crop_faces, face_key
+from face_backends import VISION_KEY_FILE, create_face_backend, face_backend_order
+from fake_vision import FakeVisionClient
+from gallery import Gallery, StaleEnrollment, faces_from_json, faces_to_json
+from image_decode import DecodedImages, image_size
+from landmarks import MIN_COMMON_LANDMARKS, landmark_similarity, mean_distance, normalize_points, one_vs_many
+from metrics import Registry, timer
+from model_loader import IMAGE_SIZE, ModelLoader, ModelNotReady, export_model, prepare_image, preprocess_input
+from perceptual_hash import HashIndex, dhash, hamming_distance, to_hex
+from uploads import Upload, UploadError, as_bytes
+from vector_index import VectorIndex
+from video_scan import batches, sample_frames
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
 
 
 app = Flask(__name__)
 
 
+# Levelled logging: LOG_LEVEL (shared with gunicorn) =warning drops the
+# per-request lines under load, =debug adds the step-by-step ones. Once
+# init_worker() has run, records are written by a background thread, so
+# request threads never wait on stdout.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'info').upper()
+log = logging.getLogger('backend')
+log.setLevel(LOG_LEVEL)
+log.propagate = False
+log_handler = logging.StreamHandler(sys.stdout)
+log_handler.setFormatter(logging.Formatter('%(asctime)s [%(process)d] %(levelname)s %(message)s'))
+log.addHandler(log_handler)
+log_listener = None
+
+
+def start_log_listener():
+    """Queue log records to a writer thread (threads don't survive fork, so per process)"""
+    global log_listener
+    if log_listener is not None:
+        return
+    log_queue = queue.SimpleQueue()
+    log_listener = logging.handlers.QueueListener(log_queue, log_handler)
+    log.removeHandler(log_handler)
+    log.addHandler(logging.handlers.QueueHandler(log_queue))
+    log_listener.start()
+
+
+# Prometheus-style metrics for this process, served on /metrics.
+# RESPONSE_TIMINGS=0 leaves the per-request stage breakdown out of
+# analysis_details.
+metrics = Registry()
+STAGE_SECONDS = metrics.histogram('backend_stage_seconds', 'Wall time per pipeline stage', ['stage'])
+REQUEST_SECONDS = metrics.histogram('backend_request_seconds', 'Request wall time per endpoint', ['endpoint'])
+REQUESTS_TOTAL = metrics.counter('backend_requests_total', 'Requests per endpoint and status code', ['endpoint', 'status'])
+ADMISSION_REJECTED_TOTAL = metrics.counter('backend_admission_rejected_total', 'Requests turned away with 429, queue full', ['endpoint'])
+DEADLINE_EXCEEDED_TOTAL = metrics.counter('backend_deadline_exceeded_total', 'Requests dropped with 503 after their deadline', ['endpoint', 'stage'])
+FAST_PATH_TOTAL = metrics.counter('backend_fast_path_total', 'Requests answered from image hashes alone', ['endpoint', 'kind'])
+RESPONSE_TIMINGS = os.environ.get('RESPONSE_TIMINGS', '1') != '0'
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, with response serialisation timed"""
+    
+    def dumps(self, obj, **kwargs):
+        with timer(STAGE_SECONDS, stage='serialize'):
+            return super().dumps(obj, **kwargs)
+
+
+app.json = TimedJSONProvider(app)
+
+# Reject oversized bodies before they're buffered
+MAX_UPLOAD_MB = int(os.environ.get('MAX_UPLOAD_MB', '32'))
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_MB * 1024 * 1024
+
+
 CORS(app, resources={
     r"/*": {
         "origins": "*",
-        "methods": ["GET", "POST", "OPTIONS"],
-        "allow_headers": ["Content-Type"]
+        "methods": ["GET", "POST", "DELETE", "OPTIONS"],
+        "allow_headers": ["Content-Type", "X-Request-Timeout-Ms"],
+        "expose_headers": ["Retry-After"]
     }
 })
 
 
-# Initialize Google Vision
-print("🔄 Initializing Google Vision API...")
+# Google Vision and MobileNetV2 are created per serving process.
+# Neither a gRPC channel nor the TensorFlow runtime survives fork(), so
+# TensorFlow is only imported lazily (model_loader.py, classifier.py):
+# under gunicorn the master never loads it and each worker calls
+# init_worker() after forking.
 vision_client = None
-try:
-    # UPDATED: Use the backup service account key
-    os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = './service-account-key-backup.json'
-    if os.path.exists('./service-account-key-backup.json'):
-        vision_client = vision.ImageAnnotatorClient()
-        print("✓ Google Vision API initialized")
+
+# VISION_CLIENT=fake answers Vision requests offline with fake_vision.py:
+# synthetic (or FAKE_VISION_RESPONSES canned) faces and labels after an
+# injected delay, with injected call/image failure rates, for load tests
+VISION_CLIENT = os.environ.get('VISION_CLIENT', 'google')
+FAKE_VISION_LATENCY_MS = float(os.environ.get('FAKE_VISION_LATENCY_MS', '300'))
+FAKE_VISION_JITTER_MS = float(os.environ.get('FAKE_VISION_JITTER_MS', '50'))
+FAKE_VISION_PER_IMAGE_MS = float(os.environ.get('FAKE_VISION_PER_IMAGE_MS', '20'))
+FAKE_VISION_ERROR_RATE = float(os.environ.get('FAKE_VISION_ERROR_RATE', '0'))
+FAKE_VISION_IMAGE_ERROR_RATE = float(os.environ.get('FAKE_VISION_IMAGE_ERROR_RATE', '0'))
+FAKE_VISION_FACE_RATE = float(os.environ.get('FAKE_VISION_FACE_RATE', '1'))
+FAKE_VISION_RESPONSES = os.environ.get('FAKE_VISION_RESPONSES')
+FAKE_VISION_SEED = int(os.environ.get('FAKE_VISION_SEED', '0'))
+
+# MODEL_LOADING=background binds the port immediately and loads the model
+# in a thread (/health reports loading until it's warmed up); eager blocks
+# startup until it's ready. MODEL_PATH loads a SavedModel or .keras file
+# from local disk instead of resolving the ImageNet weights.
+# EMBEDDING_BACKEND picks keras (default), tflite or onnx; the latter two
+# need MODEL_PATH pointing at a model converted with backend_tools.py.
+MODEL_LOADING = os.environ.get('MODEL_LOADING', 'background')
+MODEL_PATH = os.environ.get('MODEL_PATH')
+MODEL_WAIT_SECONDS = float(os.environ.get('MODEL_WAIT_SECONDS', '30'))
+EMBEDDING_BACKEND = os.environ.get('EMBEDDING_BACKEND', 'keras')
+model_loader = ModelLoader(lambda: create_backend(EMBEDDING_BACKEND, MODEL_PATH))
+
+# FACE_BACKEND=local detects faces and landmarks with OpenCV on the CPU
+# (FACE_DETECTOR_MODEL: YuNet ONNX file, fetched into models/ by
+# backend_tools.py fetch-face-model; else the Haar cascades, which find
+# too few landmarks for the landmark score); FACE_BACKEND=vision
+# sends them to Google Vision instead. The default, auto, keeps Vision
+# when its credentials are there and uses OpenCV otherwise. If the chosen
+# backend can't be set up, the other one is used.
+FACE_BACKEND = os.environ.get('FACE_BACKEND', 'auto')
+FACE_DETECTOR_MODEL = os.environ.get('FACE_DETECTOR_MODEL')
+face_backend = None
+face_backend_checked = False
+face_backend_errors = {}
+face_backend_lock = threading.Lock()
+
+# Endpoints that can't do anything useful without the model
+MODEL_ENDPOINTS = {'analyze_image', 'compare_images', 'compare_many', 'enroll_image', 'match_faces', 'scan_video', 'index_report', 'search_reports_by_image'}
+
+
+# /detect and /analyze label images locally with the ImageNet head of the
+# shared MobileNetV2 (classifier.py), from the same embedding /compare
+# uses. CLASSIFIER_HEAD is an .npz from `backend_tools.py export-head`;
+# without it the head comes from Keras' ImageNet weights.
+# DETECT_BACKEND=vision keeps /detect on Vision LABEL_DETECTION.
+CLASSIFIER_HEAD = os.environ.get('CLASSIFIER_HEAD')
+DETECT_BACKEND = os.environ.get('DETECT_BACKEND', 'local')
+LABEL_TOP_K = int(os.environ.get('LABEL_TOP_K', '5'))
+LABEL_MIN_SCORE = float(os.environ.get('LABEL_MIN_SCORE', '0.05'))
+classifier = None
+classifier_checked = False
+classifier_lock = threading.Lock()
+
+
+# Admission control (admission.py) for every endpoint that runs the model:
+# ADMISSION_MAX_CONCURRENT run at once per worker, up to
+# ADMISSION_MAX_QUEUE more wait and the rest get 429 with Retry-After.
+# A request's deadline is the client's X-Request-Timeout-Ms, capped at
+# REQUEST_TIMEOUT_MS; once it passes, queued or not-yet-computed work is
+# dropped with 503.
+ADMISSION_ENDPOINTS = {
+    'analyze_image', 'compare_images', 'compare_many', 'detect_objects', 'enroll_image', 'index_report',
+    'match_faces', 'scan_video', 'search_reports_by_image'
+}
+ADMISSION_MAX_CONCURRENT = int(os.environ.get('ADMISSION_MAX_CONCURRENT', '4'))
+ADMISSION_MAX_QUEUE = int(os.environ.get('ADMISSION_MAX_QUEUE', '8'))
+REQUEST_TIMEOUT_MS = float(os.environ.get('REQUEST_TIMEOUT_MS', '30000'))
+admission = AdmissionController(ADMISSION_MAX_CONCURRENT, ADMISSION_MAX_QUEUE)
+
+
+def init_vision_client():
+    """Initialize Google Vision"""
+    global vision_client
+    if VISION_CLIENT == 'fake':
+        vision_client = FakeVisionClient(
+            latency_ms=FAKE_VISION_LATENCY_MS,
+            jitter_ms=FAKE_VISION_JITTER_MS,
+            per_image_ms=FAKE_VISION_PER_IMAGE_MS,
+            error_rate=FAKE_VISION_ERROR_RATE,
+            image_error_rate=FAKE_VISION_IMAGE_ERROR_RATE,
+            face_rate=FAKE_VISION_FACE_RATE,
+            responses_path=FAKE_VISION_RESPONSES,
+            seed=FAKE_VISION_SEED
+        )
+        log.info(f"✓ Fake Vision client ({FAKE_VISION_LATENCY_MS:.0f}ms, {FAKE_VISION_ERROR_RATE:.0%} errors)")
+        return vision_client
+    
+    log.info("🔄 Initializing Google Vision API...")
+    try:
+        # UPDATED: Use the backup service account key
+        os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = VISION_KEY_FILE
+        if os.path.exists(VISION_KEY_FILE):
+            vision_client = vision.ImageAnnotatorClient()
+            log.info("✓ Google Vision API initialized")
+        else:
+            log.warning("⚠️ Service account key file not found")
+    except Exception as e:
+        log.warning(f"⚠️ Google Vision unavailable: {e}")
+    return vision_client
+
+
+def init_face_backend():
+    """Set up the face detection backend, falling back to the other one"""
+    global face_backend, face_backend_checked
+    face_backend_checked = True
+    for name in face_backend_order(FACE_BACKEND):
+        try:
+            face_backend = create_face_backend(name, vision_client, FACE_DETECTOR_MODEL, min_side=DECODE_MIN_SIDE)
+        except Exception as e:
+            face_backend_errors[name] = str(e)
+            log.warning(f"⚠️ Face backend '{name}' unavailable: {e}")
+            continue
+        log.info(f"✓ Face backend: {face_backend.label}")
+        if not face_backend.landmark_score:
+            log.warning(
+                f"⚠️ {face_backend.label} finds too few landmarks for the landmark score: faces are "
+                f"compared on their crops alone. Run 'python backend_tools.py fetch-face-model' for YuNet's landmarks."
+            )
+        return face_backend
+    log.error("❌ No face detection backend: face comparisons fall back to the object path")
+    return None
+
+
+def get_face_backend():
+    """The face backend, set up on first use if init_worker() didn't run"""
+    if not face_backend_checked:
+        with face_backend_lock:
+            if not face_backend_checked:
+                init_face_backend()
+    if face_backend is None:
+        raise RuntimeError("No face detection backend available")
+    return face_backend
+
+
+def init_classifier():
+    """Load the classification head for local labels"""
+    global classifier, classifier_checked
+    classifier_checked = True
+    try:
+        if CLASSIFIER_HEAD:
+            classifier = ClassificationHead.load(CLASSIFIER_HEAD)
+        else:
+            classifier = ClassificationHead.from_keras()
+        log.info(f"✓ Classification head: {len(classifier.labels)} labels ({CLASSIFIER_HEAD or 'imagenet'})")
+    except Exception as e:
+        log.warning(f"⚠️ Classification head unavailable: {e}")
+    return classifier
+
+
+def get_classifier():
+    """The classification head, loaded on first use if the model loader didn't"""
+    if not classifier_checked:
+        with classifier_lock:
+            if not classifier_checked:
+                init_classifier()
+    if classifier is None:
+        raise RuntimeError("No classification head available")
+    return classifier
+
+
+def use_local_labels():
+    """
+    Whether /detect labels locally: Vision stays the fallback while the
+    model is still loading, or for good if there's no head
+    """
+    if DETECT_BACKEND != 'local' or (vision_client and not model_loader.ready):
+        return False
+    try:
+        get_classifier()
+        return True
+    except RuntimeError:
+        return False
+
+
+def face_detection_status():
+    """What /health reports about face detection"""
+    return {
+        'requested': FACE_BACKEND,
+        'backend': face_backend.name if face_backend else None,
+        'detector': face_backend.label if face_backend else None,
+        'landmark_score': bool(face_backend and face_backend.landmark_score),
+        'errors': face_backend_errors
+    }
+
+
+def face_method(landmarks_used, crops='face crop'):
+    """analysis_details method of a face comparison, naming only the scores that went into it"""
+    if landmarks_used:
+        return f'HYBRID: {face_backend.label} Landmarks (40%) + TensorFlow aligned {crops} (60%)'
+    return f'TensorFlow aligned {crops} (100%); {face_backend.label} detection, too few landmarks for the landmark score'
+
+
+def face_detection_is_remote():
+    try:
+        return get_face_backend().remote
+    except RuntimeError:
+        return False
+
+
+def load_feature_extractor():
+    """Load and warm up MobileNetV2 in this thread"""
+    log.info(f"📦 Loading MobileNetV2 ({EMBEDDING_BACKEND}: {MODEL_PATH or 'imagenet'})...")
+    model_loader.load()
+    if model_loader.ready:
+        status = model_loader.status()
+        log.info(f"✓ MobileNetV2 ready (load {status['load_seconds']}s, warm-up {status['warmup_seconds']}s)")
+    else:
+        log.error(f"❌ MobileNetV2 failed to load: {model_loader.error}")
+    if DETECT_BACKEND == 'local' and not classifier_checked:
+        with classifier_lock:
+            if not classifier_checked:
+                init_classifier()
+
+
+def init_worker():
+    """Per-process setup: call after fork, before serving requests"""
+    start_log_listener()
+    init_vision_client()
+    init_face_backend()
+    if MODEL_LOADING == 'eager':
+        load_feature_extractor()
     else:
-        print("⚠️ Service account key file not found")
-except Exception as e:
-    print(f"⚠️ Google Vision unavailable: {e}")
+        threading.Thread(target=load_feature_extractor, name='model-loader', daemon=True).start()
+
+
+def shutdown_worker():
+    """Let in-flight comparisons finish before the process exits"""
+    compare_executor.shutdown(wait=True)
+    if log_listener is not None:
+        log_listener.stop()
+
+
+def create_app():
+    """
+    WSGI app factory.
+    Cheap on purpose: it runs in the gunicorn master when preload_app is
+    on, so model loading is left to init_worker().
+    """
+    return app
 
 
-# Load MobileNetV2
-print("📦 Loading MobileNetV2...")
-feature_extractor = MobileNetV2(weights='imagenet', include_top=False, pooling='avg')
-print("✓ MobileNetV2 loaded")
+# Embedding cache: the same reference photo gets compared over and over
+EMBEDDING_CACHE_DIR = os.environ.get(
+    'EMBEDDING_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'embedding_cache')
+)
+EMBEDDING_CACHE_SIZE = int(os.environ.get('EMBEDDING_CACHE_SIZE', '1024'))
+COMPARE_MANY_MAX_CANDIDATES = int(os.environ.get('COMPARE_MANY_MAX_CANDIDATES', '100'))
+# Faces of a crowd photo matched per /match_faces request (largest first)
+CROWD_MAX_FACES = int(os.environ.get('CROWD_MAX_FACES', '50'))
+# /scan_video: clips are streamed to a temporary file, then sampled at
+# VIDEO_SAMPLE_FPS with frames within VIDEO_DEDUP_DISTANCE dHash bits of
+# the last kept one skipped; at most VIDEO_MAX_FRAMES are embedded
+VIDEO_MAX_UPLOAD_MB = int(os.environ.get('VIDEO_MAX_UPLOAD_MB', '512'))
+VIDEO_SAMPLE_FPS = float(os.environ.get('VIDEO_SAMPLE_FPS', '2'))
+VIDEO_DEDUP_DISTANCE = int(os.environ.get('VIDEO_DEDUP_DISTANCE', '6'))
+VIDEO_MAX_FRAMES = int(os.environ.get('VIDEO_MAX_FRAMES', '1800'))
+EMBEDDING_NAMESPACE = embedding_namespace(EMBEDDING_BACKEND, MODEL_PATH)
+embedding_store = EmbeddingStore(EMBEDDING_CACHE_DIR, capacity=EMBEDDING_CACHE_SIZE, namespace=EMBEDDING_NAMESPACE)
+log.info(f"✓ Embedding cache: {embedding_store.directory}")
+
+# The face path embeds aligned face crops, not the whole photo. Crops
+# don't depend on the embedding model, so they're shared by all backends.
+face_embedding_store = EmbeddingStore(
+    EMBEDDING_CACHE_DIR, capacity=EMBEDDING_CACHE_SIZE, namespace=EMBEDDING_NAMESPACE + '-face'
+)
+face_crop_store = CropStore(EMBEDDING_CACHE_DIR)
+
+# Enrolled report photos, compared by id instead of re-uploaded
+gallery = Gallery(os.path.join(EMBEDDING_CACHE_DIR, 'gallery'))
+# Their whole-frame embeddings, memory-mapped and shared by every worker
+GALLERY_MATRIX_DTYPE = os.environ.get('GALLERY_MATRIX_DTYPE', 'float16')
+gallery_matrix = EmbeddingMatrix(
+    os.path.join(EMBEDDING_CACHE_DIR, 'gallery', EMBEDDING_NAMESPACE + '.emb'),
+    model=EMBEDDING_NAMESPACE, dtype=GALLERY_MATRIX_DTYPE
+)
+# ... and the embeddings of their largest face, for crowd photo matching
+gallery_face_matrix = EmbeddingMatrix(
+    os.path.join(EMBEDDING_CACHE_DIR, 'gallery', EMBEDDING_NAMESPACE + '-face.emb'),
+    model=EMBEDDING_NAMESPACE + '-face', dtype=GALLERY_MATRIX_DTYPE
+)
+log.info(f"✓ Gallery matrix: {len(gallery_matrix)} photos ({gallery_matrix.dtype.name})")
+
+# Fast path: identical uploads (same content hash) get a verdict without
+# detection or embedding. dHashes within PHASH_DUPLICATE_DISTANCE bits only
+# flag a near-duplicate once the face or embedding score has matched: a
+# 64-bit dHash puts many unrelated photos that close. PHASH_FAST_PATH=0
+# (or fast_path=false on a request) skips both.
+PHASH_FAST_PATH = os.environ.get('PHASH_FAST_PATH', '1') != '0'
+PHASH_DUPLICATE_DISTANCE = int(os.environ.get('PHASH_DUPLICATE_DISTANCE', '4'))
+# Enrolled photos' dHashes, for finding duplicates across the gallery
+gallery_hashes = HashIndex(
+    os.path.join(EMBEDDING_CACHE_DIR, 'gallery', 'phash.log'), max_distance=PHASH_DUPLICATE_DISTANCE
+)
+
+
+# Search index over the gallery matrix: photos enrolled with /enroll and
+# reports registered with /search/index are one collection, searched by
+# /search (and its old name /gallery/search)
+SEARCH_IVF_THRESHOLD = int(os.environ.get('SEARCH_IVF_THRESHOLD', '5000'))
+SEARCH_N_PROBE = int(os.environ.get('SEARCH_N_PROBE', '8'))
+SEARCH_REPORTS_FILE = os.path.join(EMBEDDING_CACHE_DIR, 'search_reports.json')
+search_index = VectorIndex(gallery_matrix, ivf_threshold=SEARCH_IVF_THRESHOLD, n_probe=SEARCH_N_PROBE)
+# Which photo each /search/index report is, kept outside any one model's
+# matrix so reindex.py --gallery can put the reports back after a model change
+indexed_reports = Gallery(os.path.join(EMBEDDING_CACHE_DIR, 'search_reports'))
+
+
+def migrate_search_reports():
+    """Move reports from the old per-process report -> image_id file into the report registry and gallery matrix"""
+    if not os.path.exists(SEARCH_REPORTS_FILE):
+        return
+    with open(SEARCH_REPORTS_FILE) as f:
+        reports = json.load(f)
+    ids, vectors = [], []
+    for report_id, image_id in reports.items():
+        if indexed_reports.get(report_id) is None:
+            indexed_reports.put({'id': report_id, 'image_id': image_id})
+        features = embedding_store.get(image_id)
+        if features is not None and report_id not in search_index:
+            ids.append(report_id)
+            vectors.append(features)
+    if ids:
+        gallery_matrix.append(ids, vectors)
+    try:
+        os.replace(SEARCH_REPORTS_FILE, SEARCH_REPORTS_FILE + '.migrated')
+    except OSError:
+        pass
+    log.info(f"✓ Migrated {len(ids)} reports from {SEARCH_REPORTS_FILE}")
+
+
+migrate_search_reports()
+log.info(f"✓ Search index: {len(search_index)} reports ({search_index.mode})")
+
+
+# Detected faces per image content hash, so no photo is detected twice
+# (VISION_CACHE_SIZE is the old name of FACE_CACHE_SIZE)
+FACE_CACHE_SIZE = int(os.environ.get('FACE_CACHE_SIZE', os.environ.get('VISION_CACHE_SIZE', '512')))
+face_cache = LRUCache(FACE_CACHE_SIZE)
+
+
+def detect_faces(images_data, keys=None, known=None, decoded=None):
+    """
+    Face detection for several images with the configured face backend.
+    Uncached images go to the backend together (one batch_annotate_images
+    call for Vision); the local detector runs on the request's decodes.
+    Returns one list of Face tuples per image. `known` can hold faces
+    already on record (enrolled photos) per image.
+    """
+    backend = get_face_backend()
+    if keys is None:
+        keys = [embedding_store.key(image_data) for image_data in images_data]
+    if known is None:
+        known = [None] * len(images_data)
+    faces = [k if k is not None else face_cache.get(key) for k, key in zip(known, keys)]
+    
+    missing = [i for i, f in enumerate(faces) if f is None]
+    if missing:
+        check_deadline('face detection')
+        with timer(STAGE_SECONDS, stage='vision' if backend.remote else 'face_detect'):
+            if backend.remote:
+                results = backend.detect([images_data[i] for i in missing])
+            else:
+                decoded = request_decodes(decoded)
+                results = []
+                for i in missing:
+                    img, (width, _) = decoded.get(keys[i], images_data[i])
+                    results.append(backend.detect_image(img, scale=width / img.shape[1]))
+        
+        for i, result in zip(missing, results):
+            faces[i] = result if result is not None else []
+            # Don't remember failures, the next request should retry them
+            if result is not None:
+                face_cache.put(keys[i], result)
+    
+    return faces
+
+
+# Bounded pool for running the Vision and TensorFlow branches of /compare
+# side by side
+COMPARE_WORKERS = int(os.environ.get('COMPARE_WORKERS', '4'))
+compare_executor = ThreadPoolExecutor(max_workers=COMPARE_WORKERS, thread_name_prefix='compare')
+
+
+def submit_stage(fn, *args):
+    """Run fn(*args) on compare_executor in a copy of this context, so the request's deadline goes along"""
+    return compare_executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+def elapsed_ms(start):
+    return round((time.perf_counter() - start) * 1000, 2)
+
+
+def record_stage(timings, stage, start):
+    """Record a stage that began at `start` in the stage histogram and in timings (ms)"""
+    seconds = time.perf_counter() - start
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings[stage] = round(seconds * 1000, 2)
+
+
+def timed(timings, stage, fn, *args):
+    """Run fn(*args) and record its wall time as a stage"""
+    start = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        record_stage(timings, stage, start)
+
+
+def timing_details(timings):
+    """analysis_details entries for the per-request stage breakdown"""
+    return {'timings_ms': timings} if RESPONSE_TIMINGS else {}
+
+
+# Uploads are decoded at reduced resolution: the model only ever sees
+# 224x224, so JPEGs are scaled down in libjpeg while keeping at least
+# DECODE_MIN_SIDE pixels on the short side (0 decodes at full size)
+DECODE_MIN_SIDE = int(os.environ.get('DECODE_MIN_SIDE', '448'))
+
+
+def request_decodes(decoded=None):
+    """
+    The request's DecodedImages (a new one if it has none), so hashing,
+    face detection, crops and embedding share one decode of each upload.
+    Every decode's time goes to the stage histogram.
+    """
+    if decoded is not None:
+        return decoded
+    return DecodedImages(DECODE_MIN_SIDE, on_decode=lambda seconds: STAGE_SECONDS.observe(seconds, stage='decode'))
+
+
+def decode_report(decoded):
+    """
+    Decode cost of this request: how many decodes it made and the largest
+    pixel buffer among them, against the largest a full-resolution decode
+    would have allocated
+    """
+    stats = decoded.stats
+    peak_full_res_bytes = stats.get('peak_full_res_bytes', 0)
+    peak_decoded_bytes = stats.get('peak_decoded_bytes', 0)
+    return {
+        'images_decoded': stats.get('images', 0),
+        'peak_full_res_bytes': peak_full_res_bytes,
+        'peak_decoded_bytes': peak_decoded_bytes,
+        'peak_saved_bytes': peak_full_res_bytes - peak_decoded_bytes,
+        'decode_ms': round(stats.get('seconds', 0.0) * 1000, 2)
+    }
+
+
+def run_model(batch):
+    """One forward pass; only ever called from the micro-batcher thread"""
+    model = model_loader.get(timeout=MODEL_WAIT_SECONDS)
+    with timer(STAGE_SECONDS, stage='model'):
+        return model.predict(batch, verbose=0)
+
+
+# Concurrent requests' images are merged into shared forward passes
+BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', '32'))
+BATCH_MAX_WAIT_MS = float(os.environ.get('BATCH_MAX_WAIT_MS', '5'))
+BATCH_SIZE = metrics.histogram('backend_batcher_batch_size', 'Images per forward pass', buckets=BATCH_SIZE_BUCKETS)
+BATCH_WAIT_SECONDS = metrics.histogram('backend_batcher_wait_seconds', 'Time a submission waited for its forward pass')
+
+
+def record_batch(batch_size, waits):
+    BATCH_SIZE.observe(batch_size)
+    for wait in waits:
+        BATCH_WAIT_SECONDS.observe(wait)
+
+
+inference_batcher = MicroBatcher(
+    run_model, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS, on_batch=record_batch
+)
+
+
+def extract_features_batch(img_arrays):
+    """Extract deep learning features for several images in one forward pass"""
+    check_deadline('the forward pass')
+    with timer(STAGE_SECONDS, stage='extract_features'):
+        batch = np.stack([prepare_image(img) for img in img_arrays])
+        batch_preprocessed = preprocess_input(batch)
+        features = inference_batcher(batch_preprocessed, get_deadline())
+        return features.reshape(len(img_arrays), -1)
 
 
 def extract_features(img_array):
     """Extract deep learning features"""
-    img_resized = cv2.resize(img_array, (224, 224))
-    img_rgb = cv2.cvtColor(img_resized, cv2.COLOR_BGR2RGB)
-    img_expanded = np.expand_dims(img_rgb, axis=0)
-    img_preprocessed = preprocess_input(img_expanded)
-    features = feature_extractor.predict(img_preprocessed, verbose=0)
-    return features.flatten()
+    return extract_features_batch([img_array])[0]
+
+
+def get_features(image_data, decoded=None, key=None):
+    """
+    Cached feature extraction keyed by image content.
+    A hit skips decode, resize and the model call entirely.
+    """
+    key = embedding_store.key(image_data) if key is None else key
+    features = embedding_store.get(key)
+    
+    if features is None:
+        img, _ = request_decodes(decoded).get(key, image_data)
+        features = extract_features(img)
+        embedding_store.put(key, features)
+    
+    return features
+
+
+def get_features_many(images_data, decoded=None, keys=None):
+    """
+    Cached feature extraction for a list of images.
+    Every cache miss is decoded and embedded together in a single batch.
+    Enrolled images can be passed as None with their key in `keys`.
+    """
+    if keys is None:
+        keys = [embedding_store.key(image_data) for image_data in images_data]
+    features = [embedding_store.get(key) for key in keys]
+    
+    missing = [i for i, f in enumerate(features) if f is None]
+    if missing:
+        if any(images_data[i] is None for i in missing):
+            raise StaleEnrollment("Enrolled image has no embedding for the current model, enroll it again")
+        decoded = request_decodes(decoded)
+        imgs = [decoded.get(keys[i], images_data[i])[0] for i in missing]
+        batch_features = extract_features_batch(imgs)
+        for i, f in zip(missing, batch_features):
+            features[i] = f
+            embedding_store.put(keys[i], f)
+    
+    return keys, features
+
+
+def get_faces_features(images_data, image_keys, faces, face_indices, decoded=None):
+    """
+    Cached embeddings of the faces at face_indices[i] in each image.
+    Missing crops are aligned from the request's decode of their image,
+    then every missing embedding goes through the model in a single batch.
+    Returns a list of embeddings per image.
+    """
+    backend_name = get_face_backend().name
+    keys = [
+        [face_key(image_key, backend_name, index) for index in indices]
+        for image_key, indices in zip(image_keys, face_indices)
+    ]
+    features = [[face_embedding_store.get(key) for key in image_face_keys] for image_face_keys in keys]
+    
+    crops, slots = [], []
+    for i, indices in enumerate(face_indices):
+        missing = [n for n, f in enumerate(features[i]) if f is None]
+        if not missing:
+            continue
+        cached = {n: face_crop_store.get(keys[i][n]) for n in missing}
+        to_align = [n for n in missing if cached[n] is None]
+        if to_align:
+            if images_data[i] is None:
+                raise StaleEnrollment("Enrolled face has no crop for the current face backend, enroll it again")
+            aligned = crop_faces(
+                images_data[i], [faces[i][indices[n]] for n in to_align], DECODE_MIN_SIDE,
+                request_decodes(decoded), image_keys[i]
+            )
+            for n, crop in zip(to_align, aligned):
+                face_crop_store.put(keys[i][n], crop)
+                cached[n] = crop
+        for n in missing:
+            crops.append(cached[n])
+            slots.append((i, n))
+    
+    if crops:
+        batch_features = extract_features_batch(crops)
+        for (i, n), f in zip(slots, batch_features):
+            features[i][n] = f
+            face_embedding_store.put(keys[i][n], f)
+    
+    return features
+
+
+def get_face_features(images_data, image_keys, faces, decoded=None):
+    """Cached embeddings of the largest face in each image"""
+    return [
+        image_features[0]
+        for image_features in get_faces_features(images_data, image_keys, faces, [[0]] * len(images_data), decoded)
+    ]
+
+
+def cosine_similarities(probe, candidates):
+    """Cosine similarity of one vector against each row of a matrix"""
+    probe = np.asarray(probe, dtype=np.float64)
+    candidates = np.asarray(candidates, dtype=np.float64)
+    norms = np.linalg.norm(candidates, axis=1) * np.linalg.norm(probe)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        similarities = (candidates @ probe) / norms
+    return np.nan_to_num(similarities)
+
+
+def image_hash(image_data, key=None, decoded=None):
+    """dHash of an upload from the request's decode of it, or None if it doesn't decode"""
+    key = embedding_store.key(image_data) if key is None else key
+    try:
+        return dhash(request_decodes(decoded).get(key, image_data)[0])
+    except Exception:
+        return None
+
+
+def duplicate_distance(images_data, image_keys, enrolled=None, decoded=None):
+    """
+    dHash distance between the two images: 0 without decoding anything for
+    identical bytes, None when either can't be hashed (or an enrolled
+    photo predates hashing)
+    """
+    if image_keys[0] == image_keys[1]:
+        return 0
+    if enrolled:
+        hash1 = int(enrolled['phash'], 16) if enrolled.get('phash') else None
+    else:
+        hash1 = image_hash(images_data[0], image_keys[0], decoded)
+    hash2 = image_hash(images_data[1], image_keys[1], decoded) if hash1 is not None else None
+    if hash2 is None:
+        return None
+    return hamming_distance(hash1, hash2)
+
+
+def near_duplicate_details(distance, is_match):
+    """
+    The dHash hint for a scored comparison: near_duplicate only when the
+    hashes are close AND the face or embedding score agrees, since unrelated
+    photos with similar layouts land within a few bits of each other
+    """
+    if distance is None:
+        return {}
+    return {
+        'hash_distance': distance,
+        'near_duplicate': bool(is_match) and distance <= PHASH_DUPLICATE_DISTANCE
+    }
+
+
+def classify_image(faces, features):
+    """
+    /detect's primary_type and detected items for an image, from its faces
+    and the classification head applied to its whole-frame embedding
+    """
+    prediction = get_classifier().predict([features], LABEL_TOP_K, LABEL_MIN_SCORE)[0]
+    detected_items = {'faces': [], 'pets': [], 'objects': [], 'labels': []}
+    
+    if faces:
+        detected_items['faces'] = [{'count': len(faces), 'confidence': float(faces[0].confidence * 100)}]
+    
+    for name, score, is_animal in prediction['labels']:
+        confidence = float(score * 100)
+        if is_animal:
+            detected_items['pets'].append({'type': name, 'confidence': confidence})
+        else:
+            detected_items['objects'].append({'type': name, 'confidence': confidence})
+        detected_items['labels'].append({'name': name, 'confidence': confidence})
+    
+    # Most of the probability on animal classes, not just one animal label
+    # somewhere in the top few
+    is_pet = prediction['animal_score'] >= 0.5
+    primary_type = 'human_face' if faces else 'pet' if is_pet else 'object'
+    return primary_type, detected_items, prediction['animal_score']
+
+
+def object_confidence(similarity):
+    """Map a cosine similarity to the object/pet match verdict and confidence band"""
+    similarity_percentage = max(0, min(100, similarity * 100))
+    
+    distance = 1 - similarity
+    is_match = distance < 0.35
+    
+    if distance < 0.20:
+        confidence_level = 'very_high'
+        confidence_description = 'Very similar'
+    elif distance < 0.35:
+        confidence_level = 'high'
+        confidence_description = 'Similar'
+    else:
+        confidence_level = 'low'
+        confidence_description = 'Different'
+    
+    return similarity_percentage, is_match, confidence_level, confidence_description
+
+
+def face_confidence(similarity):
+    """(is match, confidence level, description) for a hybrid face score"""
+    is_match = similarity > 65  # Lenient threshold
+    
+    if similarity > 85:
+        return is_match, 'very_high', 'Same person (95%+ confidence)'
+    elif similarity > 65:
+        return is_match, 'high', 'Same person (85%+ confidence)'
+    elif similarity > 50:
+        return is_match, 'medium', 'Possibly same person (70%+ confidence)'
+    else:
+        return is_match, 'low', 'Different people'
 
 
-def compare_faces_hybrid(img1, img2, img1_data, img2_data):
+def compare_faces_hybrid(size1, size2, faces1, faces2, features1, features2):
     """
     HYBRID FACE COMPARISON:
-    Combines Google Vision landmarks + TensorFlow deep learning
+    Combines face landmarks (local or Google Vision) + TensorFlow deep learning
+    Detected faces and embeddings are computed concurrently by the
+    caller and passed in; features are None if the embedding failed.
+    size1/size2 are the full-resolution (width, height) the landmark
+    coordinates are in, which they are normalised by. The last value
+    returned says whether the landmark score went into the result.
     """
     scores = []
     weights = []
     
-    img1_height, img1_width = img1.shape[:2]
-    img2_height, img2_width = img2.shape[:2]
-    
     # ================================================================
-    # METHOD 1: Google Vision Landmarks (40% weight)
+    # METHOD 1: Face Landmarks (40% weight)
     # ================================================================
-    if vision_client:
+    if faces1 and faces2:
         try:
-            print("   🔍 Google Vision landmarks...")
-            
-            image1 = vision.Image(content=img1_data)
-            image2 = vision.Image(content=img2_data)
+            log.debug("   🔍 Face landmarks...")
             
-            features = [vision.Feature(type_=vision.Feature.Type.FACE_DETECTION)]
+            face1 = faces1[0]
+            face2 = faces2[0]
             
-            request1 = vision.AnnotateImageRequest(image=image1, features=features)
-            request2 = vision.AnnotateImageRequest(image=image2, features=features)
+            # Fixed-order landmark arrays, normalised by image size
+            points1 = normalize_points(face1.points, size1)
+            points2 = normalize_points(face2.points, size2)
             
-            response1 = vision_client.batch_annotate_images(requests=[request1])
-            response2 = vision_client.batch_annotate_images(requests=[request2])
+            avg_dist, common = mean_distance(points1, face1.mask, points2, face2.mask)
             
-            faces1 = response1.responses[0].face_annotations
-            faces2 = response2.responses[0].face_annotations
-            
-            if len(faces1) > 0 and len(faces2) > 0:
-                face1 = faces1[0]
-                face2 = faces2[0]
-                
-                # Extract landmarks
-                landmarks1 = {}
-                landmarks2 = {}
-                
-                for landmark in face1.landmarks:
-                    pos = landmark.position
-                    landmarks1[int(landmark.type_)] = (
-                        float(pos.x) / img1_width,
-                        float(pos.y) / img1_height,
-                        float(pos.z) / max(img1_width, img1_height) if hasattr(pos, 'z') else 0.0
-                    )
-                
-                for landmark in face2.landmarks:
-                    pos = landmark.position
-                    landmarks2[int(landmark.type_)] = (
-                        float(pos.x) / img2_width,
-                        float(pos.y) / img2_height,
-                        float(pos.z) / max(img2_width, img2_height) if hasattr(pos, 'z') else 0.0
-                    )
+            if common >= MIN_COMMON_LANDMARKS:
+                landmark_sim = landmark_similarity(avg_dist)
                 
-                common = set(landmarks1.keys()) & set(landmarks2.keys())
-                
-                if len(common) >= 5:
-                    distances = []
-                    for lm_type in common:
-                        x1, y1, z1 = landmarks1[lm_type]
-                        x2, y2, z2 = landmarks2[lm_type]
-                        dist = np.sqrt((x2 - x1)**2 + (y2 - y1)**2 + (z2 - z1)**2)
-                        distances.append(dist)
-                    
-                    avg_dist = np.mean(distances)
-                    
-                    # Convert to similarity (very lenient)
-                    if avg_dist < 0.08:
-                        landmark_sim = 100 - (avg_dist * 800)
-                    elif avg_dist < 0.15:
-                        landmark_sim = 85 - (avg_dist * 400)
-                    elif avg_dist < 0.25:
-                        landmark_sim = 70 - (avg_dist * 200)
-                    else:
-                        landmark_sim = max(0, 50 - (avg_dist * 100))
-                    
-                    scores.append(landmark_sim)
-                    weights.append(0.40)  # 40% weight
-                    print(f"      Landmark score: {landmark_sim:.2f}%")
+                scores.append(landmark_sim)
+                weights.append(0.40)  # 40% weight
+                log.debug(f"      Landmark score: {landmark_sim:.2f}%")
         except Exception as e:
-            print(f"      Landmark comparison skipped: {e}")
+            log.warning(f"      Landmark comparison skipped: {e}")
     
     # ================================================================
     # METHOD 2: TensorFlow Deep Learning on Full Face (60% weight)
     # ================================================================
-    try:
-        print("   🧠 TensorFlow deep learning...")
-        
-        features1 = extract_features(img1)
-        features2 = extract_features(img2)
+    if features1 is not None and features2 is not None:
+        log.debug("   🧠 TensorFlow deep learning...")
         
         # Cosine similarity
         similarity = 1 - cosine(features1, features2)
@@ -156,51 +856,200 @@ def compare_faces_hybrid(img1, img2, img1_data, img2_data):
         
         scores.append(deep_learning_score)
         weights.append(0.60)  # 60% weight
-        print(f"      Deep learning score: {deep_learning_score:.2f}%")
-        
-    except Exception as e:
-        print(f"      Deep learning failed: {e}")
+        log.debug(f"      Deep learning score: {deep_learning_score:.2f}%")
     
     # ================================================================
     # WEIGHTED ENSEMBLE
     # ================================================================
     if not scores:
-        return 0.0, 'error', 'Failed to compare images'
+        return 0.0, 'error', 'Failed to compare images', False, False
     
     final_similarity = np.average(scores, weights=weights[:len(scores)])
     
-    # Determine confidence
-    is_match = final_similarity > 65  # Lenient threshold
+    is_match, confidence_level, confidence_description = face_confidence(final_similarity)
     
-    if final_similarity > 85:
-        confidence_level = 'very_high'
-        confidence_description = 'Same person (95%+ confidence)'
-    elif final_similarity > 65:
-        confidence_level = 'high'
-        confidence_description = 'Same person (85%+ confidence)'
-    elif final_similarity > 50:
-        confidence_level = 'medium'
-        confidence_description = 'Possibly same person (70%+ confidence)'
-    else:
-        confidence_level = 'low'
-        confidence_description = 'Different people'
+    log.debug(f"   ✅ Final score: {final_similarity:.2f}% (ensemble of {len(scores)} methods)")
+    
+    return final_similarity, confidence_level, confidence_description, is_match, 0.40 in weights
+
+
+def score_faces(reference_face, reference_size, reference_features, faces, size, features):
+    """
+    compare_faces_hybrid() of one reference face against every face of a
+    photo, in one vectorized step. Returns (similarity, landmark
+    similarity, deep learning similarity) arrays; landmark similarity is
+    NaN where too few landmarks are shared, and the deep learning score
+    then stands alone.
+    """
+    deep = np.clip(cosine_similarities(reference_features, features) * 100, 0, 100)
+    landmark, _ = one_vs_many(
+        normalize_points(reference_face.points, reference_size), reference_face.mask,
+        normalize_points(np.stack([face.points for face in faces]), size), np.stack([face.mask for face in faces])
+    )
+    similarity = np.where(np.isnan(landmark), deep, 0.40 * landmark + 0.60 * deep)
+    return similarity, landmark, deep
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request(response):
+    endpoint = request.endpoint or 'unknown'
+    REQUESTS_TOTAL.inc(endpoint=endpoint, status=str(response.status_code))
+    REQUEST_SECONDS.observe(time.perf_counter() - g.request_start, endpoint=endpoint)
+    return response
+
+
+@app.before_request
+def require_model():
+    """Fail fast with 503 while the model is still loading"""
+    if request.method == 'OPTIONS' or request.endpoint not in MODEL_ENDPOINTS:
+        return None
+    # Nobody started a load (e.g. imported without init_worker): load lazily
+    if model_loader.state in ('not_loaded', 'ready'):
+        return None
+    
+    return model_unavailable_response()
+
+
+def model_unavailable_response():
+    response = jsonify({
+        "error": f"Model {model_loader.state}, try again shortly",
+        "status": "error",
+        "model": model_loader.state
+    })
+    response.headers['Retry-After'] = '5'
+    return response, 503
+
+
+@app.before_request
+def admit_request():
+    """Take an admission slot, or turn the request away before its body is read"""
+    if request.method == 'OPTIONS' or request.endpoint not in ADMISSION_ENDPOINTS:
+        return None
+    
+    timeout_ms = REQUEST_TIMEOUT_MS
+    try:
+        timeout_ms = min(timeout_ms, float(request.headers.get('X-Request-Timeout-Ms', timeout_ms)))
+    except ValueError:
+        pass
+    deadline = time.monotonic() + timeout_ms / 1000
     
-    print(f"   ✅ Final score: {final_similarity:.2f}% (ensemble of {len(scores)} methods)")
+    try:
+        admission.acquire(deadline)
+    except QueueFull as e:
+        ADMISSION_REJECTED_TOTAL.inc(endpoint=request.endpoint)
+        log.warning(f"🚦 Rejected {request.endpoint}: {e}")
+        return overloaded_response("Server busy, try again shortly", 429)
+    except DeadlineExceeded as e:
+        DEADLINE_EXCEEDED_TOTAL.inc(endpoint=request.endpoint, stage='queue')
+        log.warning(f"⏱️ {request.endpoint}: {e}")
+        return overloaded_response(str(e), 503)
     
-    return final_similarity, confidence_level, confidence_description, is_match
+    g.admitted_at = time.monotonic()
+    g.deadline_token = set_deadline(deadline)
+    return None
+
+
+@app.teardown_request
+def release_admission(exc=None):
+    if g.get('admitted_at') is not None:
+        admission.release(time.monotonic() - g.admitted_at)
+        reset_deadline(g.deadline_token)
+        g.admitted_at = None
+
+
+def overloaded_response(message, status):
+    response = jsonify({"error": message, "status": "error"})
+    response.headers['Retry-After'] = str(admission.retry_after())
+    return response, status
+
+
+def deadline_response(e):
+    """503 for an admitted request whose deadline passed before its work was done"""
+    DEADLINE_EXCEEDED_TOTAL.inc(endpoint=request.endpoint, stage='work')
+    log.warning(f"⏱️ {request.endpoint}: {e}")
+    return overloaded_response(str(e), 503)
+
+
+@app.errorhandler(ModelNotReady)
+def model_not_ready(e):
+    """503 for a request that reached the model before it loaded (or after it failed to)"""
+    log.warning(f"⏳ {request.endpoint}: {e}")
+    return model_unavailable_response()
+
+
+@app.errorhandler(RequestEntityTooLarge)
+def upload_too_large(e):
+    """413 for a body over the endpoint's limit (MAX_UPLOAD_MB, or VIDEO_MAX_UPLOAD_MB for /scan_video)"""
+    limit_mb = (request.max_content_length or 0) // (1024 * 1024)
+    return jsonify({"error": f"Upload larger than {limit_mb} MB", "status": "error"}), 413
 
 
 @app.route('/health', methods=['GET'])
 def health_check():
+    model_status = model_loader.status()
     return jsonify({
-        'status': 'healthy',
+        'status': 'healthy' if model_loader.ready else model_status['state'],
+        'model': dict(model_status, source=MODEL_PATH or 'imagenet', backend=EMBEDDING_BACKEND),
         'message': 'HYBRID Face Recognition API',
         'timestamp': datetime.now().isoformat(),
-        'google_vision': 'enabled' if vision_client else 'disabled',
+        'google_vision': ('fake' if VISION_CLIENT == 'fake' else 'enabled') if vision_client else 'disabled',
         'tensorflow': 'enabled',
         'accuracy': '98%+ (hybrid ensemble)',
-        'version': '3.0 - Hybrid Face Matching'
-    }), 200
+        'version': '3.0 - Hybrid Face Matching',
+        'embedding_cache': embedding_store.stats(),
+        'face_embedding_cache': face_embedding_store.stats(),
+        'face_backend': face_backend.label if face_backend else ('failed' if face_backend_checked else 'not_loaded'),
+        'face_detection': face_detection_status(),
+        'face_cache': face_cache.stats(),
+        'detect_backend': DETECT_BACKEND,
+        'classifier': {
+            'source': CLASSIFIER_HEAD or 'imagenet',
+            'state': ('ready' if classifier else 'unavailable') if classifier_checked else 'not_loaded'
+        },
+        'gallery_matrix': gallery_matrix.stats(),
+        'gallery_face_matrix': gallery_face_matrix.stats(),
+        'gallery_hashes': len(gallery_hashes),
+        'search_index': search_index.stats(),
+        'inference_batcher': inference_batcher.stats(),
+        'admission': admission.stats()
+    }), 200 if model_loader.ready else 503
+
+
+CACHES = {'embedding': embedding_store, 'face_embedding': face_embedding_store, 'face': face_cache}
+metrics.counter_callback(
+    'backend_cache_hits_total', 'Cache hits',
+    lambda: {(name,): cache.stats()['hits'] for name, cache in CACHES.items()}, ['cache']
+)
+metrics.counter_callback(
+    'backend_cache_misses_total', 'Cache misses',
+    lambda: {(name,): cache.stats()['misses'] for name, cache in CACHES.items()}, ['cache']
+)
+metrics.counter_callback(
+    'backend_cache_write_errors_total', 'Embeddings that could not be persisted to disk',
+    lambda: {(name,): CACHES[name].stats()['write_errors'] for name in ('embedding', 'face_embedding')}, ['cache']
+)
+metrics.gauge_callback('backend_model_ready', '1 once the embedding model is warmed up', lambda: int(model_loader.ready))
+metrics.gauge_callback('backend_batcher_queue_depth', 'Images waiting for a forward pass', lambda: inference_batcher.stats()['queue_depth'])
+metrics.counter_callback('backend_batcher_batches_total', 'Forward passes run', lambda: inference_batcher.stats()['batches'])
+metrics.counter_callback('backend_batcher_rows_total', 'Images embedded', lambda: inference_batcher.stats()['rows'])
+metrics.counter_callback('backend_batcher_expired_total', 'Submissions dropped at the model after their deadline', lambda: inference_batcher.stats()['expired'])
+metrics.gauge_callback('backend_admission_active', 'Requests holding an admission slot', lambda: admission.stats()['active'])
+metrics.gauge_callback('backend_admission_waiting', 'Requests waiting for an admission slot', lambda: admission.stats()['waiting'])
+metrics.gauge_callback('backend_gallery_photos', 'Enrolled photos in the gallery matrix', lambda: len(gallery_matrix))
+metrics.gauge_callback('backend_gallery_faces', 'Enrolled faces in the gallery face matrix', lambda: len(gallery_face_matrix))
+metrics.gauge_callback('backend_gallery_hashes', 'Enrolled photos in the perceptual hash index', lambda: len(gallery_hashes))
+metrics.gauge_callback('backend_search_index_reports', 'Reports in the search index', lambda: len(search_index))
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus text exposition of this worker's metrics"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 
 @app.route('/detect', methods=['POST', 'OPTIONS'])
@@ -208,16 +1057,47 @@ def detect_objects():
     if request.method == 'OPTIONS':
         return jsonify({'status': 'ok'}), 200
     
-    if not vision_client:
-        return jsonify({"error": "Google Vision not available", "status": "error"}), 500
-    
+    request_start = time.perf_counter()
     try:
-        data = request.get_json()
-        if not data or 'image' not in data:
+        upload = Upload(request, raw_field='image')
+        image_data = upload.image('image')
+        if image_data is None:
             return jsonify({"error": "Missing image data", "status": "error"}), 400
         
-        image_data = base64.b64decode(data['image'])
-        image = vision.Image(content=image_data)
+        # Labels from the local head; the embedding is cached for /compare
+        timings = {}
+        if use_local_labels():
+            key = embedding_store.key(image_data)
+            decoded = request_decodes()
+            faces = []
+            try:
+                faces = timed(timings, 'faces', detect_faces, [image_data], [key], None, decoded)[0]
+            except TimeoutError:
+                raise
+            except Exception as e:
+                log.warning(f"⚠️ Face detection skipped: {e}")
+            _, (features,) = timed(timings, 'embed', get_features_many, [image_data], decoded, [key])
+            check_deadline('classification')
+            start = time.perf_counter()
+            primary_type, detected_items, animal_score = classify_image(faces, features)
+            record_stage(timings, 'classify', start)
+            timings['total'] = elapsed_ms(request_start)
+            
+            return jsonify({
+                'status': 'success',
+                'primary_type': primary_type,
+                'detected': detected_items,
+                'analysis_details': {
+                    'method': f'MobileNetV2 ImageNet head + {face_backend.label if face_backend else "no"} face detection',
+                    'animal_score': round(animal_score, 4),
+                    **timing_details(timings)
+                }
+            }), 200
+        
+        if not vision_client:
+            return jsonify({"error": "Google Vision not available", "status": "error"}), 500
+        
+        image = vision.Image(content=as_bytes(image_data))
         
         features = [
             vision.Feature(type_=vision.Feature.Type.FACE_DETECTION),
@@ -225,7 +1105,9 @@ def detect_objects():
         ]
         
         request_obj = vision.AnnotateImageRequest(image=image, features=features)
+        start = time.perf_counter()
         response = vision_client.batch_annotate_images(requests=[request_obj])
+        record_stage(timings, 'vision', start)
         result = response.responses[0]
         
         detected_items = {'faces': [], 'pets': [], 'objects': [], 'labels': []}
@@ -249,14 +1131,164 @@ def detect_objects():
                 detected_items['labels'].append({'name': label.description, 'confidence': confidence})
         
         primary_type = 'human_face' if detected_items['faces'] else 'pet' if detected_items['pets'] else 'object'
+        timings['total'] = elapsed_ms(request_start)
+        
+        return jsonify({
+            'status': 'success',
+            'primary_type': primary_type,
+            'detected': detected_items,
+            'analysis_details': timing_details(timings)
+        }), 200
+        
+    except UploadError as e:
+        return jsonify({"error": str(e), "status": "error"}), 400
+        
+    except TimeoutError as e:
+        return deadline_response(e)
+        
+    except (HTTPException, ModelNotReady):
+        raise
+        
+    except Exception as e:
+        return jsonify({"error": str(e), "status": "error"}), 500
+
+
+@app.route('/analyze', methods=['POST', 'OPTIONS'])
+def analyze_image():
+    """
+    DETECT + COMPARE IN ONE REQUEST
+    Labels 'image' like /detect (local faces and classification head) and,
+    given 'reference' or an enrolled 'reference_id', compares the two like
+    /compare. Labels and the comparison come from the same forward pass,
+    so the client makes one round trip instead of two.
+    """
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 'ok'}), 200
+    
+    request_start = time.perf_counter()
+    try:
+        upload = Upload(request, raw_field='image')
+        image_data = upload.image('image')
+        if image_data is None:
+            return jsonify({"error": "Missing image data", "status": "error"}), 400
+        
+        enrolled = None
+        if upload.get('reference_id') is not None:
+            enrolled = gallery.get(str(upload.get('reference_id')))
+            if enrolled is None:
+                return jsonify({"error": "Unknown reference_id", "status": "error"}), 404
+        reference_data = upload.image('reference') if enrolled is None else None
+        
+        timings = {}
+        decoded = request_decodes()
+        images_data = [image_data]
+        image_keys = [embedding_store.key(image_data)]
+        known_faces = [None]
+        if enrolled:
+            images_data.append(None)
+            image_keys.append(enrolled['image_id'])
+            known_faces.append(faces_from_json(enrolled['faces']))
+        elif reference_data is not None:
+            images_data.append(reference_data)
+            image_keys.append(embedding_store.key(reference_data))
+            known_faces.append(None)
+        
+        # One detection call and one batched forward pass for both images
+        faces_future = submit_stage(
+            timed, timings, 'faces', detect_faces, images_data, image_keys, known_faces, decoded
+        )
+        _, features = timed(timings, 'embed', get_features_many, images_data, decoded, image_keys)
+        try:
+            faces = faces_future.result()
+        except TimeoutError:
+            raise
+        except Exception as e:
+            log.warning(f"⚠️ Face detection skipped: {e}")
+            faces = [[] for _ in images_data]
+        
+        check_deadline('classification')
+        start = time.perf_counter()
+        primary_type, detected_items, animal_score = classify_image(faces[0], features[0])
+        record_stage(timings, 'classify', start)
+        
+        comparison = None
+        if len(images_data) > 1:
+            if faces[0] and faces[1]:
+                # Reference first, as image1 of /compare
+                reference_features, image_features = timed(
+                    timings, 'embed_faces', get_face_features, images_data[::-1], image_keys[::-1],
+                    faces[::-1], decoded
+                )
+                reference_size = (enrolled['width'], enrolled['height']) if enrolled else image_size(reference_data)
+                size = image_size(image_data)
+                if reference_size is None or size is None:
+                    return jsonify({"error": "Could not decode images", "status": "error"}), 400
+                
+                check_deadline('scoring')
+                start = time.perf_counter()
+                similarity, confidence_level, confidence_description, is_match, landmarks_used = compare_faces_hybrid(
+                    reference_size, size, faces[1], faces[0], reference_features, image_features
+                )
+                record_stage(timings, 'score', start)
+                comparison = {
+                    'similarity': float(np.round(similarity, 2)),
+                    'match': bool(is_match),
+                    'confidence_level': str(confidence_level),
+                    'message': f"{'MATCH - Same person' if is_match else 'NO MATCH - Different people'} ({similarity:.1f}%)",
+                    'interpretation': confidence_description,
+                    'method': face_method(landmarks_used),
+                    'comparison_type': 'face_recognition'
+                }
+            else:
+                check_deadline('scoring')
+                start = time.perf_counter()
+                similarity = 1 - cosine(features[1], features[0])
+                similarity_percentage, is_match, confidence_level, confidence_description = object_confidence(similarity)
+                record_stage(timings, 'score', start)
+                comparison = {
+                    'similarity': float(np.round(similarity_percentage, 2)),
+                    'match': bool(is_match),
+                    'confidence_level': str(confidence_level),
+                    'message': f"{'MATCH' if is_match else 'NO MATCH'} - {confidence_description}",
+                    'interpretation': confidence_description,
+                    'method': 'MobileNetV2 Deep Learning',
+                    'comparison_type': 'object_pet_comparison'
+                }
+            log.info(f"✅ ANALYZE: {primary_type}, {comparison['similarity']:.2f}%")
+        else:
+            log.info(f"✅ ANALYZE: {primary_type}")
+        
+        timings['total'] = elapsed_ms(request_start)
         
         return jsonify({
             'status': 'success',
             'primary_type': primary_type,
-            'detected': detected_items
+            'detected': detected_items,
+            'comparison': comparison,
+            'analysis_details': {
+                'method': f'MobileNetV2 ImageNet head + {face_backend.label if face_backend else "no"} face detection',
+                'animal_score': round(animal_score, 4),
+                'reference': 'enrolled' if enrolled else 'image' if reference_data is not None else None,
+                **timing_details(timings),
+                'decode': decode_report(decoded)
+            },
+            'analysis_type': 'analysis'
         }), 200
         
+    except UploadError as e:
+        return jsonify({"error": str(e), "status": "error"}), 400
+        
+    except StaleEnrollment as e:
+        return jsonify({"error": str(e), "status": "error"}), 409
+        
+    except TimeoutError as e:
+        return deadline_response(e)
+        
+    except (HTTPException, ModelNotReady):
+        raise
+        
     except Exception as e:
+        log.exception(f"❌ ANALYZE FAILED: {str(e)}")
         return jsonify({"error": str(e), "status": "error"}), 500
 
 
@@ -265,87 +1297,148 @@ def compare_images():
     """
     HYBRID FACE COMPARISON v3.0
     Combines Google Vision landmarks + TensorFlow deep learning
+    image1 can be replaced by image1_id, the id of an enrolled photo.
     """
     if request.method == 'OPTIONS':
         return jsonify({'status': 'ok'}), 200
     
     try:
-        print("=" * 70)
-        print("🚀 HYBRID FACE COMPARISON v3.0")
-        data = request.get_json()
+        log.debug("🚀 HYBRID FACE COMPARISON v3.0")
+        request_start = time.perf_counter()
+        upload = Upload(request)
         
-        if not data or 'image1' not in data or 'image2' not in data:
-            return jsonify({"error": "Missing image data", "status": "error"}), 400
+        # An enrolled photo brings its embeddings, size and faces along
+        enrolled = None
+        if upload.get('image1_id') is not None:
+            enrolled = gallery.get(str(upload.get('image1_id')))
+            if enrolled is None:
+                return jsonify({"error": "Unknown image1_id, enroll it first", "status": "error"}), 404
         
         # Decode
-        image1_data = base64.b64decode(data['image1'])
-        image2_data = base64.b64decode(data['image2'])
-        
-        print(f"📥 Images: {len(image1_data)} bytes, {len(image2_data)} bytes")
+        image1_data = upload.image('image1') if enrolled is None else None
+        image2_data = upload.image('image2')
         
-        nparr1 = np.frombuffer(image1_data, np.uint8)
-        nparr2 = np.frombuffer(image2_data, np.uint8)
-        
-        img1 = cv2.imdecode(nparr1, cv2.IMREAD_COLOR)
-        img2 = cv2.imdecode(nparr2, cv2.IMREAD_COLOR)
+        if (image1_data is None and enrolled is None) or image2_data is None:
+            return jsonify({"error": "Missing image data", "status": "error"}), 400
+
+        images_data = [image1_data, image2_data]
         
-        if img1 is None:
-            pil_img1 = Image.open(io.BytesIO(image1_data)).convert('RGB')
-            img1 = cv2.cvtColor(np.array(pil_img1), cv2.COLOR_RGB2BGR)
+        if enrolled:
+            log.debug(f"📥 Images: enrolled {enrolled['id']}, {len(image2_data)} bytes")
+        else:
+            log.debug(f"📥 Images: {len(image1_data)} bytes, {len(image2_data)} bytes")
         
-        if img2 is None:
-            pil_img2 = Image.open(io.BytesIO(image2_data)).convert('RGB')
-            img2 = cv2.cvtColor(np.array(pil_img2), cv2.COLOR_RGB2BGR)
+        timings = {}
+        decoded = request_decodes()
+        image_keys = [
+            enrolled['image_id'] if enrolled else embedding_store.key(image1_data),
+            embedding_store.key(image2_data)
+        ]
         
-        if img1 is None or img2 is None:
-            return jsonify({"error": "Could not decode images", "status": "error"}), 400
+        # Identical bytes are the same photo: answered from the content hash
+        # before any detection or embedding. A dHash near-duplicate is only a
+        # hint, reported once the face or embedding score confirms the match
+        distance = None
+        if upload.flag('fast_path', PHASH_FAST_PATH):
+            if image_keys[0] == image_keys[1]:
+                timings['total'] = elapsed_ms(request_start)
+                FAST_PATH_TOTAL.inc(endpoint='compare_images', kind='exact')
+                log.info("⚡ RESULT: 100.00% | MATCH (identical photo)")
+                
+                return jsonify({
+                    'similarity': 100.0,
+                    'match': True,
+                    'confidence_level': 'very_high',
+                    'message': "MATCH - Identical photo (100.0%)",
+                    'fast_path': True,
+                    'analysis_details': {
+                        'interpretation': 'Same photo',
+                        'method': 'Content hash',
+                        'hash_distance': 0,
+                        **timing_details(timings)
+                    },
+                    'status': 'success',
+                    'analysis_type': 'duplicate_detection',
+                    'comparison_type': 'duplicate_detection'
+                }), 200
+            distance = timed(timings, 'phash', duplicate_distance, images_data, image_keys, enrolled, decoded)
         
-        print(f"📐 Dimensions: {img1.shape[:2]}, {img2.shape[:2]}")
+        # Faces are embedded as aligned crops, everything else as the whole
+        # frame. Local detection takes milliseconds, so the embedding waits
+        # for it; a remote detector is a network round trip, so the whole
+        # frames are embedded meanwhile in case there are no faces.
+        known_faces = [faces_from_json(enrolled['faces']) if enrolled else None, None]
+        faces_future = submit_stage(
+            timed, timings, 'faces', detect_faces, images_data, image_keys, known_faces, decoded
+        )
+        embed_future = None
+        if face_detection_is_remote():
+            embed_future = submit_stage(
+                timed, timings, 'embed', get_features_many, images_data, decoded, image_keys
+            )
         
-        # Check if faces detected
+        # Check if faces detected (one detection call for both images;
+        # the faces are reused for the landmark comparison)
         has_faces = False
-        if vision_client:
-            try:
-                image1 = vision.Image(content=image1_data)
-                image2 = vision.Image(content=image2_data)
-                
-                features = [vision.Feature(type_=vision.Feature.Type.FACE_DETECTION)]
-                
-                request1 = vision.AnnotateImageRequest(image=image1, features=features)
-                request2 = vision.AnnotateImageRequest(image=image2, features=features)
-                
-                response1 = vision_client.batch_annotate_images(requests=[request1])
-                response2 = vision_client.batch_annotate_images(requests=[request2])
-                
-                faces1 = response1.responses[0].face_annotations
-                faces2 = response2.responses[0].face_annotations
-                
-                has_faces = len(faces1) > 0 and len(faces2) > 0
-                print(f"👤 Faces detected: {len(faces1)}, {len(faces2)}")
-            except:
-                pass
+        faces1, faces2 = [], []
+        try:
+            faces1, faces2 = faces_future.result()
+            
+            has_faces = len(faces1) > 0 and len(faces2) > 0
+            log.debug(f"👤 Faces detected: {len(faces1)}, {len(faces2)}")
+        except TimeoutError:
+            raise
+        except Exception as e:
+            log.warning(f"⚠️ Face detection skipped: {e}")
         
         if has_faces:
-            print("\n🧬 Using HYBRID face comparison (landmarks + deep learning)")
+            log.debug("🧬 Using HYBRID face comparison (landmarks + deep learning)")
+            
+            try:
+                features1, features2 = timed(
+                    timings, 'embed_faces', get_face_features, images_data, image_keys, [faces1, faces2], decoded
+                )
+            except (StaleEnrollment, TimeoutError):
+                raise
+            except Exception as e:
+                log.warning(f"      Deep learning failed: {e}")
+                features1 = features2 = None
+            
+            # Landmarks are in full-resolution pixel coordinates; the size
+            # comes from the image header, so no pixels are decoded here
+            size1 = (enrolled['width'], enrolled['height']) if enrolled else image_size(image1_data)
+            size2 = image_size(image2_data)
             
-            similarity, confidence_level, confidence_description, is_match = compare_faces_hybrid(
-                img1, img2, image1_data, image2_data
+            if size1 is None or size2 is None:
+                return jsonify({"error": "Could not decode images", "status": "error"}), 400
+            
+            log.debug(f"📐 Dimensions: {size1}, {size2}")
+            
+            check_deadline('scoring')
+            start = time.perf_counter()
+            similarity, confidence_level, confidence_description, is_match, landmarks_used = compare_faces_hybrid(
+                size1, size2, faces1, faces2, features1, features2
             )
+            record_stage(timings, 'score', start)
+            timings['total'] = elapsed_ms(request_start)
             
-            print(f"\n✅ RESULT: {similarity:.2f}% | {'MATCH' if is_match else 'NO MATCH'}")
-            print(f"   {confidence_description}")
-            print("=" * 70)
+            log.info(f"✅ RESULT: {similarity:.2f}% | {'MATCH' if is_match else 'NO MATCH'}")
+            log.debug(f"   {confidence_description}")
             
             return jsonify({
                 'similarity': float(np.round(similarity, 2)),
                 'match': bool(is_match),
                 'confidence_level': str(confidence_level),
                 'message': f"{'MATCH - Same person' if is_match else 'NO MATCH - Different people'} ({similarity:.1f}%)",
+                'fast_path': False,
                 'analysis_details': {
                     'interpretation': confidence_description,
-                    'method': 'HYBRID: Google Vision Landmarks (40%) + TensorFlow (60%)',
+                    'method': face_method(landmarks_used),
                     'model_accuracy': '98%+ (ensemble)',
-                    'version': '3.0'
+                    'version': '3.0',
+                    **near_duplicate_details(distance, is_match),
+                    **timing_details(timings),
+                    'decode': decode_report(decoded)
                 },
                 'status': 'success',
                 'analysis_type': 'face_recognition',
@@ -354,61 +1447,779 @@ def compare_images():
         
         else:
             # Objects/pets
-            print("\n📦 Using TensorFlow for objects/animals")
+            log.debug("📦 Using TensorFlow for objects/animals")
             
-            features1 = extract_features(img1)
-            features2 = extract_features(img2)
+            # Cached embeddings skip decoding altogether
+            if embed_future is None:
+                _, (features1, features2) = timed(
+                    timings, 'embed', get_features_many, images_data, decoded, image_keys
+                )
+            else:
+                _, (features1, features2) = embed_future.result()
             
+            check_deadline('scoring')
+            start = time.perf_counter()
             similarity = 1 - cosine(features1, features2)
-            similarity_percentage = max(0, min(100, similarity * 100))
-            
-            distance = 1 - similarity
-            is_match = distance < 0.35
+            similarity_percentage, is_match, confidence_level, confidence_description = object_confidence(similarity)
+            record_stage(timings, 'score', start)
+            timings['total'] = elapsed_ms(request_start)
             
-            if distance < 0.20:
-                confidence_level = 'very_high'
-                confidence_description = 'Very similar'
-            elif distance < 0.35:
-                confidence_level = 'high'
-                confidence_description = 'Similar'
-            else:
-                confidence_level = 'low'
-                confidence_description = 'Different'
-            
-            print(f"\n✅ RESULT: {similarity_percentage:.2f}%")
-            print("=" * 70)
+            log.info(f"✅ RESULT: {similarity_percentage:.2f}%")
             
             return jsonify({
                 'similarity': float(np.round(similarity_percentage, 2)),
                 'match': bool(is_match),
                 'confidence_level': str(confidence_level),
                 'message': f"{'MATCH' if is_match else 'NO MATCH'} - {confidence_description}",
+                'fast_path': False,
                 'analysis_details': {
                     'interpretation': confidence_description,
                     'method': 'MobileNetV2 Deep Learning',
-                    'model_accuracy': '95%+'
+                    'model_accuracy': '95%+',
+                    **near_duplicate_details(distance, is_match),
+                    **timing_details(timings),
+                    'decode': decode_report(decoded)
                 },
                 'status': 'success',
                 'analysis_type': 'object_pet_comparison',
                 'comparison_type': 'object_pet_comparison'
             }), 200
         
+    except UploadError as e:
+        return jsonify({"error": str(e), "status": "error"}), 400
+        
+    except StaleEnrollment as e:
+        return jsonify({"error": str(e), "status": "error"}), 409
+        
+    except TimeoutError as e:
+        return deadline_response(e)
+        
+    except (HTTPException, ModelNotReady):
+        raise
+        
+    except Exception as e:
+        log.exception(f"❌ FAILED: {str(e)}")
+        return jsonify({"error": str(e), "status": "error"}), 500
+
+
+@app.route('/compare_many', methods=['POST', 'OPTIONS'])
+def compare_many():
+    """
+    ONE-TO-MANY COMPARISON
+    Embeds the probe and every candidate in a single MobileNetV2 batch and
+    returns candidates ranked by similarity.
+    Candidates can be base64 images ('candidates') or the image_id of an
+    already-embedded image ('candidate_ids').
+    """
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 'ok'}), 200
+    
+    try:
+        upload = Upload(request, raw_field='probe')
+        probe_data = upload.image('probe')
+        
+        if probe_data is None:
+            return jsonify({"error": "Missing probe image", "status": "error"}), 400
+        
+        candidates = upload.images('candidates')
+        candidate_ids = upload.values('candidate_ids')
+        
+        if not candidates and not candidate_ids:
+            return jsonify({"error": "Missing candidates", "status": "error"}), 400
+        
+        if len(candidates) + len(candidate_ids) > COMPARE_MANY_MAX_CANDIDATES:
+            return jsonify({
+                "error": f"Too many candidates (max {COMPARE_MANY_MAX_CANDIDATES})",
+                "status": "error"
+            }), 400
+        
+        log.debug(f"🔎 Compare many: 1 probe vs {len(candidates)} images + {len(candidate_ids)} ids")
+        
+        # Probe and inline candidates share one forward pass
+        images_data = [probe_data] + candidates
+        decoded = request_decodes()
+        keys, features = get_features_many(images_data, decoded)
+        check_deadline('scoring')
+        probe_features = features[0]
+        
+        entries = [
+            {'index': i, 'image_id': key, 'features': f}
+            for i, (key, f) in enumerate(zip(keys[1:], features[1:]))
+        ]
+        
+        missing_ids = []
+        for image_id in candidate_ids:
+            f = embedding_store.get(image_id)
+            if f is None:
+                missing_ids.append(image_id)
+            else:
+                entries.append({'image_id': image_id, 'features': f})
+        
+        results = []
+        if entries:
+            similarities = cosine_similarities(probe_features, [e['features'] for e in entries])
+            
+            for entry, similarity in zip(entries, similarities):
+                similarity_percentage, is_match, confidence_level, confidence_description = object_confidence(similarity)
+                result = {
+                    'image_id': entry['image_id'],
+                    'similarity': float(np.round(similarity_percentage, 2)),
+                    'match': bool(is_match),
+                    'confidence_level': confidence_level,
+                    'interpretation': confidence_description
+                }
+                if 'index' in entry:
+                    result['index'] = entry['index']
+                results.append(result)
+        
+        results.sort(key=lambda r: r['similarity'], reverse=True)
+        
+        top_k = upload.number('top_k', 0, minimum=0)
+        if top_k:
+            results = results[:top_k]
+        
+        log.info(f"✅ Ranked {len(results)} candidates, {len(missing_ids)} unknown ids")
+        
+        return jsonify({
+            'status': 'success',
+            'probe_id': keys[0],
+            'results': results,
+            'missing_ids': missing_ids,
+            'analysis_details': {
+                'method': 'MobileNetV2 Deep Learning (batched)',
+                'candidates': len(entries),
+                'decode': decode_report(decoded)
+            },
+            'comparison_type': 'object_pet_comparison'
+        }), 200
+        
+    except UploadError as e:
+        return jsonify({"error": str(e), "status": "error"}), 400
+        
+    except TimeoutError as e:
+        return deadline_response(e)
+        
+    except (HTTPException, ModelNotReady):
+        raise
+        
+    except Exception as e:
+        log.error(f"❌ COMPARE MANY FAILED: {str(e)}")
+        return jsonify({"error": str(e), "status": "error"}), 500
+
+
+def face_json(index, face):
+    return {
+        'index': index,
+        'box': [round(float(v), 1) for v in face.box],
+        'detection_confidence': round(float(face.confidence), 4)
+    }
+
+
+@app.route('/match_faces', methods=['POST', 'OPTIONS'])
+def match_faces():
+    """
+    CROWD PHOTO MATCHING
+    Detects every face in 'image' (group and street shots), embeds all of
+    their aligned crops in one batch and scores them in one vectorized
+    step against the largest face of 'reference' (an image) or of the
+    enrolled photo 'reference_id'. With 'gallery' instead, every face is
+    searched against all enrolled faces. Faces come back ranked.
+    """
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 'ok'}), 200
+    
+    request_start = time.perf_counter()
+    try:
+        upload = Upload(request, raw_field='image')
+        image_data = upload.image('image')
+        reference_id = upload.get('reference_id')
+        reference_data = upload.image('reference') if reference_id is None else None
+        use_gallery = reference_id is None and reference_data is None and upload.flag('gallery')
+        
+        if image_data is None:
+            return jsonify({"error": "Missing image data", "status": "error"}), 400
+        if reference_id is None and reference_data is None and not use_gallery:
+            return jsonify({"error": "Missing reference, reference_id or gallery", "status": "error"}), 400
+        
+        enrolled = None
+        if reference_id is not None:
+            enrolled = gallery.get(str(reference_id))
+            if enrolled is None:
+                return jsonify({"error": "Unknown reference_id", "status": "error"}), 404
+        
+        size = image_size(image_data)
+        reference_size = (enrolled['width'], enrolled['height']) if enrolled else (
+            image_size(reference_data) if reference_data is not None else None
+        )
+        if size is None or (not use_gallery and reference_size is None):
+            return jsonify({"error": "Could not decode images", "status": "error"}), 400
+        
+        max_faces = min(upload.number('max_faces', CROWD_MAX_FACES, minimum=1), CROWD_MAX_FACES)
+        top_k = upload.number('top_k', 5, minimum=1)
+        
+        # The crowd photo and the reference go through detection together
+        timings = {}
+        decoded = request_decodes()
+        images_data = [image_data]
+        keys = [embedding_store.key(image_data)]
+        known_faces = [None]
+        if reference_data is not None:
+            images_data.append(reference_data)
+            keys.append(embedding_store.key(reference_data))
+            known_faces.append(None)
+        elif enrolled:
+            images_data.append(None)
+            keys.append(enrolled['image_id'])
+            known_faces.append(faces_from_json(enrolled['faces']))
+        
+        detected = timed(timings, 'faces', detect_faces, images_data, keys, known_faces, decoded)
+        faces = detected[0][:max_faces]
+        reference_faces = detected[1][:1] if len(detected) > 1 else []
+        if not use_gallery and not reference_faces:
+            return jsonify({"error": "No face found in the reference image", "status": "error"}), 400
+        
+        log.debug(f"👥 Match faces: {len(detected[0])} faces, scoring {len(faces)}")
+        
+        results = []
+        if faces:
+            # Every crowd face (and the reference face) in one forward pass
+            features = timed(
+                timings, 'embed_faces', get_faces_features, images_data, keys,
+                [faces] + ([reference_faces] if reference_faces else []),
+                [list(range(len(faces)))] + ([[0]] if reference_faces else []),
+                decoded
+            )
+            face_features = np.stack(features[0])
+            
+            check_deadline('scoring')
+            start = time.perf_counter()
+            if use_gallery:
+                for index, (face, matches) in enumerate(zip(faces, gallery_face_matrix.search_many(face_features, top_k))):
+                    ranked = []
+                    for gallery_id, cosine_similarity in matches:
+                        similarity = max(0, min(100, cosine_similarity * 100))
+                        is_match, confidence_level, confidence_description = face_confidence(similarity)
+                        ranked.append({
+                            'id': gallery_id,
+                            'similarity': float(np.round(similarity, 2)),
+                            'match': bool(is_match),
+                            'confidence_level': confidence_level,
+                            'interpretation': confidence_description
+                        })
+                    results.append(dict(
+                        face_json(index, face),
+                        similarity=ranked[0]['similarity'] if ranked else 0.0,
+                        match=bool(ranked and ranked[0]['match']),
+                        matches=ranked
+                    ))
+            else:
+                similarities, landmark_similarities, deep_similarities = score_faces(
+                    reference_faces[0], reference_size, features[1][0], faces, size, face_features
+                )
+                for index, face in enumerate(faces):
+                    is_match, confidence_level, confidence_description = face_confidence(similarities[index])
+                    landmark_sim = landmark_similarities[index]
+                    results.append(dict(
+                        face_json(index, face),
+                        similarity=float(np.round(similarities[index], 2)),
+                        landmark_similarity=None if np.isnan(landmark_sim) else float(np.round(landmark_sim, 2)),
+                        deep_learning_similarity=float(np.round(deep_similarities[index], 2)),
+                        match=bool(is_match),
+                        confidence_level=confidence_level,
+                        interpretation=confidence_description
+                    ))
+            record_stage(timings, 'score', start)
+            results.sort(key=lambda r: r['similarity'], reverse=True)
+        
+        timings['total'] = elapsed_ms(request_start)
+        matches = sum(1 for r in results if r['match'])
+        log.info(f"👥 Matched {len(results)} faces, {matches} matches")
+        
+        if use_gallery:
+            method = f'{face_backend.label} faces + TensorFlow aligned face crops vs enrolled faces (batched)'
+        else:
+            landmarks_used = any(r['landmark_similarity'] is not None for r in results)
+            method = face_method(landmarks_used, 'face crops') + ', all faces batched'
+        
+        return jsonify({
+            'status': 'success',
+            'faces_detected': len(detected[0]),
+            'faces': results,
+            'best_match': results[0] if results and results[0]['match'] else None,
+            'analysis_details': {
+                'method': method,
+                'reference': 'gallery' if use_gallery else 'enrolled' if enrolled else 'image',
+                'faces_scored': len(results),
+                **({'gallery_faces': len(gallery_face_matrix)} if use_gallery else {}),
+                **timing_details(timings),
+                'decode': decode_report(decoded)
+            },
+            'analysis_type': 'crowd_face_matching'
+        }), 200
+        
+    except UploadError as e:
+        return jsonify({"error": str(e), "status": "error"}), 400
+        
+    except StaleEnrollment as e:
+        return jsonify({"error": str(e), "status": "error"}), 409
+        
+    except TimeoutError as e:
+        return deadline_response(e)
+        
+    except (HTTPException, ModelNotReady):
+        raise
+        
+    except Exception as e:
+        log.exception(f"❌ MATCH FACES FAILED: {str(e)}")
+        return jsonify({"error": str(e), "status": "error"}), 500
+
+
+@app.route('/scan_video', methods=['POST', 'OPTIONS'])
+def scan_video():
+    """
+    VIDEO CLIP SCANNING
+    Streams 'video' to a temporary file and samples it frame by frame
+    (video_scan.py): sample_fps frames a second, minus near-duplicates of
+    the last kept frame. Surviving frames are embedded with MobileNetV2 in
+    batches and scored against 'reference' / 'reference_id' or, with
+    'gallery', every enrolled photo. Only the top_k timestamped matches
+    are kept, so memory doesn't grow with the clip.
+    """
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 'ok'}), 200
+    
+    request_start = time.perf_counter()
+    try:
+        # Clips are far bigger than photos
+        request.max_content_length = VIDEO_MAX_UPLOAD_MB * 1024 * 1024
+        upload = Upload(request, raw_field='video', buffer_raw=False)
+        reference_id = upload.get('reference_id')
+        reference_data = upload.image('reference') if reference_id is None else None
+        use_gallery = reference_id is None and reference_data is None and upload.flag('gallery')
+        
+        if reference_id is None and reference_data is None and not use_gallery:
+            return jsonify({"error": "Missing reference, reference_id or gallery", "status": "error"}), 400
+        
+        sample_fps = upload.number('sample_fps', VIDEO_SAMPLE_FPS, float)
+        dedup_distance = upload.number('dedup_distance', VIDEO_DEDUP_DISTANCE)
+        top_k = upload.number('top_k', 10, minimum=1)
+        if sample_fps <= 0:
+            return jsonify({"error": "sample_fps must be positive", "status": "error"}), 400
+        
+        timings = {}
+        reference_features = None
+        if reference_id is not None:
+            enrolled = gallery.get(str(reference_id))
+            if enrolled is None:
+                return jsonify({"error": "Unknown reference_id", "status": "error"}), 404
+            _, features = timed(timings, 'embed_reference', get_features_many, [None], None, [enrolled['image_id']])
+            reference_features = features[0]
+        elif reference_data is not None:
+            reference_features = timed(timings, 'embed_reference', get_features, reference_data)
+        
+        with tempfile.NamedTemporaryFile(prefix='scan_video_') as video_file:
+            start = time.perf_counter()
+            video_bytes = upload.save('video', video_file)
+            video_file.flush()
+            record_stage(timings, 'upload', start)
+            if not video_bytes:
+                return jsonify({"error": "Missing video data", "status": "error"}), 400
+            
+            # Min-heap of the best (similarity, frame, timestamp, gallery id) so far
+            best = []
+            frame_stats = {}
+            seconds = {'frames': 0.0, 'embed': 0.0, 'score': 0.0}
+            frames = sample_frames(
+                video_file.name, sample_fps, dedup_distance, VIDEO_MAX_FRAMES, IMAGE_SIZE, frame_stats
+            )
+            start = time.perf_counter()
+            for batch in batches(frames, BATCH_MAX_SIZE):
+                embed_start = time.perf_counter()
+                seconds['frames'] += embed_start - start
+                features = extract_features_batch([frame for _, _, frame in batch])
+                check_deadline('scoring')
+                
+                score_start = time.perf_counter()
+                seconds['embed'] += score_start - embed_start
+                if use_gallery:
+                    hits = [
+                        (similarity, index, timestamp, gallery_id)
+                        for (index, timestamp, _), matches in zip(batch, gallery_matrix.search_many(features, 1))
+                        for gallery_id, similarity in matches
+                    ]
+                else:
+                    hits = [
+                        (float(similarity), index, timestamp, None)
+                        for (index, timestamp, _), similarity in zip(batch, cosine_similarities(reference_features, features))
+                    ]
+                for hit in hits:
+                    if len(best) < top_k:
+                        heapq.heappush(best, hit)
+                    elif hit > best[0]:
+                        heapq.heapreplace(best, hit)
+                
+                start = time.perf_counter()
+                seconds['score'] += start - score_start
+            seconds['frames'] += time.perf_counter() - start
+        
+        for stage, stage_seconds in seconds.items():
+            STAGE_SECONDS.observe(stage_seconds, stage=stage)
+            timings[stage] = round(stage_seconds * 1000, 2)
+        timings['total'] = elapsed_ms(request_start)
+        
+        results = []
+        for similarity, index, timestamp, gallery_id in sorted(best, reverse=True):
+            similarity_percentage, is_match, confidence_level, confidence_description = object_confidence(similarity)
+            results.append({
+                **({'id': gallery_id} if use_gallery else {}),
+                'frame': index,
+                'timestamp_s': round(timestamp, 3),
+                'similarity': float(np.round(similarity_percentage, 2)),
+                'match': bool(is_match),
+                'confidence_level': confidence_level,
+                'interpretation': confidence_description
+            })
+        
+        log.info(
+            f"🎞️ Scanned {frame_stats.get('frames', 0)} frames: {frame_stats.get('kept', 0)} embedded, "
+            f"{frame_stats.get('duplicates', 0)} near-duplicates skipped, {sum(r['match'] for r in results)} matches"
+        )
+        
+        return jsonify({
+            'status': 'success',
+            'matches': results,
+            'best_match': results[0] if results and results[0]['match'] else None,
+            'analysis_details': {
+                'method': 'MobileNetV2 Deep Learning (sampled video frames, batched)',
+                'reference': 'gallery' if use_gallery else 'enrolled' if reference_id is not None else 'image',
+                'video_bytes': video_bytes,
+                'fps': round(frame_stats['fps'], 3),
+                'duration_s': round(frame_stats['frames'] / frame_stats['fps'], 3),
+                'frames_total': frame_stats['frames'],
+                'frames_sampled': frame_stats['sampled'],
+                'frames_skipped_duplicate': frame_stats['duplicates'],
+                'frames_embedded': frame_stats['kept'],
+                'truncated': frame_stats['truncated'],
+                'sample_fps': sample_fps,
+                'dedup_distance': dedup_distance,
+                **timing_details(timings)
+            },
+            'analysis_type': 'video_scan'
+        }), 200
+        
+    except (UploadError, ValueError) as e:
+        return jsonify({"error": str(e), "status": "error"}), 400
+        
+    except StaleEnrollment as e:
+        return jsonify({"error": str(e), "status": "error"}), 409
+        
+    except TimeoutError as e:
+        return deadline_response(e)
+        
+    except (HTTPException, ModelNotReady):
+        raise
+        
+    except Exception as e:
+        log.exception(f"❌ VIDEO SCAN FAILED: {str(e)}")
+        return jsonify({"error": str(e), "status": "error"}), 500
+
+
+@app.route('/enroll', methods=['POST', 'OPTIONS'])
+def enroll_image():
+    """
+    ENROLL A REPORT PHOTO
+    Embeds the photo (whole frame and largest face) once and records its
+    size and detected faces, so /compare can take image1_id instead of
+    the photo. Enrolling an existing id replaces it.
+    """
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 'ok'}), 200
+    
+    try:
+        upload = Upload(request, raw_field='image')
+        image_data = upload.image('image')
+        
+        if not upload.get('id') or image_data is None:
+            return jsonify({"error": "Missing id or image data", "status": "error"}), 400
+        
+        size = image_size(image_data)
+        if size is None:
+            return jsonify({"error": "Could not decode image", "status": "error"}), 400
+        
+        gallery_id = str(upload.get('id'))
+        image_id = embedding_store.key(image_data)
+        decoded = request_decodes()
+        phash = image_hash(image_data, image_id, decoded)
+        duplicates = [] if phash is None else [
+            {'id': other_id, 'hash_distance': distance}
+            for other_id, distance in gallery_hashes.query(phash) if other_id != gallery_id
+        ]
+        
+        faces = []
+        try:
+            faces = detect_faces([image_data], [image_id], None, decoded)[0]
+        except TimeoutError:
+            raise
+        except Exception as e:
+            log.warning(f"⚠️ Face detection skipped: {e}")
+        
+        features = get_features_many([image_data], decoded, [image_id])[1][0]
+        face_features = None
+        if faces:
+            face_features = get_face_features([image_data], [image_id], [faces], decoded)[0]
+        
+        entry = {
+            'id': gallery_id,
+            'image_id': image_id,
+            'width': size[0],
+            'height': size[1],
+            'faces': faces_to_json(faces),
+            'face_backend': face_backend.name if face_backend else None,
+            'embedding_namespace': EMBEDDING_NAMESPACE,
+            'phash': to_hex(phash) if phash is not None else None,
+            'enrolled_at': datetime.now().isoformat()
+        }
+        check_deadline('enrollment')
+        gallery.put(entry)
+        # Enrolled now: reindex.py rebuilds it from the gallery entry
+        indexed_reports.remove(gallery_id)
+        search_index.add(gallery_id, features)
+        if face_features is not None:
+            gallery_face_matrix.append([gallery_id], [face_features])
+        else:
+            gallery_face_matrix.remove(gallery_id)
+        if phash is not None:
+            gallery_hashes.add(gallery_id, phash)
+        else:
+            gallery_hashes.remove(gallery_id)
+        
+        log.info(f"🗂️ Enrolled {gallery_id} ({len(faces)} faces, {len(duplicates)} duplicates)")
+        
+        return jsonify({
+            'status': 'success',
+            'id': gallery_id,
+            'image_id': image_id,
+            'faces': len(faces),
+            'duplicates': duplicates
+        }), 200
+        
+    except UploadError as e:
+        return jsonify({"error": str(e), "status": "error"}), 400
+        
+    except TimeoutError as e:
+        return deadline_response(e)
+        
+    except (HTTPException, ModelNotReady):
+        raise
+        
+    except Exception as e:
+        return jsonify({"error": str(e), "status": "error"}), 500
+
+
+def remove_photo(photo_id):
+    """Drop an enrolled or indexed photo from the gallery and every index; False if unknown"""
+    removed = gallery.remove(photo_id)
+    removed = indexed_reports.remove(photo_id) or removed
+    removed = search_index.remove(photo_id) or removed
+    gallery_face_matrix.remove(photo_id)
+    gallery_hashes.remove(photo_id)
+    if removed:
+        log.info(f"🗑️ Removed {photo_id} from the gallery")
+    return removed
+
+
+@app.route('/gallery/<path:gallery_id>', methods=['GET', 'DELETE', 'OPTIONS'])
+def gallery_entry(gallery_id):
+    """Look up or remove an enrolled photo"""
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 'ok'}), 200
+    
+    if request.method == 'DELETE':
+        if not remove_photo(gallery_id):
+            return jsonify({"error": "Unknown gallery id", "status": "error"}), 404
+        return jsonify({'status': 'success', 'id': gallery_id}), 200
+    
+    entry = gallery.get(gallery_id)
+    if entry is None:
+        return jsonify({"error": "Unknown gallery id", "status": "error"}), 404
+    
+    return jsonify(dict(entry, status='success')), 200
+
+
+@app.route('/search/index', methods=['POST', 'OPTIONS'])
+def index_report():
+    """
+    Register (or replace) a report photo in the search index: its
+    whole-frame embedding goes into the gallery matrix, its dHash into
+    the gallery's hash index and its content hash into indexed_reports,
+    without /enroll's face detection
+    """
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 'ok'}), 200
+    
+    try:
+        upload = Upload(request, raw_field='image')
+        image_data = upload.image('image')
+        
+        if not upload.get('id') or image_data is None:
+            return jsonify({"error": "Missing id or image data", "status": "error"}), 400
+        
+        report_id = str(upload.get('id'))
+        image_id = embedding_store.key(image_data)
+        decoded = request_decodes()
+        features = get_features(image_data, decoded, image_id)
+        phash = image_hash(image_data, image_id, decoded)
+        
+        check_deadline('indexing')
+        # A different photo under an enrolled id makes its enrollment stale
+        entry = gallery.get(report_id)
+        if entry is not None and entry['image_id'] != image_id:
+            gallery.remove(report_id)
+            gallery_face_matrix.remove(report_id)
+        indexed_reports.put({
+            'id': report_id,
+            'image_id': image_id,
+            'phash': to_hex(phash) if phash is not None else None,
+            'indexed_at': datetime.now().isoformat()
+        })
+        search_index.add(report_id, features)
+        if phash is not None:
+            gallery_hashes.add(report_id, phash)
+        else:
+            gallery_hashes.remove(report_id)
+        
+        log.info(f"🗂️ Indexed report {report_id} ({len(search_index)} total)")
+        
+        return jsonify({
+            'status': 'success',
+            'id': report_id,
+            'image_id': image_id,
+            'index': search_index.stats()
+        }), 200
+        
+    except UploadError as e:
+        return jsonify({"error": str(e), "status": "error"}), 400
+        
+    except TimeoutError as e:
+        return deadline_response(e)
+        
+    except (HTTPException, ModelNotReady):
+        raise
+        
+    except Exception as e:
+        return jsonify({"error": str(e), "status": "error"}), 500
+
+
+@app.route('/search/index/<report_id>', methods=['DELETE', 'OPTIONS'])
+def unindex_report(report_id):
+    """Remove a report photo from the search index"""
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 'ok'}), 200
+    
+    if not remove_photo(report_id):
+        return jsonify({"error": "Unknown report id", "status": "error"}), 404
+    
+    return jsonify({'status': 'success', 'id': report_id, 'index': search_index.stats()}), 200
+
+
+@app.route('/search', methods=['POST', 'OPTIONS'])
+@app.route('/gallery/search', methods=['POST', 'OPTIONS'])
+def search_reports_by_image():
+    """
+    SEARCH ALL OPEN REPORTS
+    Copies of an indexed photo come straight out of the hash index;
+    otherwise the query image is embedded once and the top-k most similar
+    enrolled or indexed photos are returned, scored like /compare's
+    object path.
+    """
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 'ok'}), 200
+    
+    try:
+        upload = Upload(request, raw_field='image')
+        image_data = upload.image('image')
+        
+        if image_data is None:
+            return jsonify({"error": "Missing image data", "status": "error"}), 400
+        
+        top_k = upload.number('top_k', 10, minimum=1)
+        min_similarity = upload.number('min_similarity', 0.0, float)
+        exact = upload.flag('exact')
+        
+        timings = {}
+        key = embedding_store.key(image_data)
+        decoded = request_decodes()
+        # Hash neighbours only annotate hits the embedding already matched
+        hash_distances = {}
+        if upload.flag('fast_path', PHASH_FAST_PATH):
+            query_hash = timed(timings, 'phash', image_hash, image_data, key, decoded)
+            if query_hash is not None:
+                hash_distances = dict(gallery_hashes.query(query_hash))
+        
+        features = timed(timings, 'embed', get_features, image_data, decoded, key)
+        check_deadline('scoring')
+        hits = timed(timings, 'score', search_index.search, features, top_k, min_similarity / 100, exact)
+        
+        results = []
+        for report_id, similarity in hits:
+            similarity_percentage, is_match, confidence_level, confidence_description = object_confidence(similarity)
+            results.append({
+                'id': report_id,
+                'similarity': float(np.round(similarity_percentage, 2)),
+                'match': bool(is_match),
+                'confidence_level': confidence_level,
+                'interpretation': confidence_description,
+                **near_duplicate_details(hash_distances.get(report_id), is_match)
+            })
+        
+        log.info(f"🔎 Search: {len(results)} hits in {len(search_index)} reports ({search_index.mode})")
+        
+        return jsonify({
+            'status': 'success',
+            'results': results,
+            'fast_path': False,
+            'analysis_details': {
+                'method': 'MobileNetV2 Deep Learning (vector index)',
+                'index_mode': 'exact' if exact else search_index.mode,
+                'indexed_reports': len(search_index),
+                'matrix_dtype': gallery_matrix.dtype.name,
+                **timing_details(timings)
+            }
+        }), 200
+        
+    except UploadError as e:
+        return jsonify({"error": str(e), "status": "error"}), 400
+        
+    except TimeoutError as e:
+        return deadline_response(e)
+        
+    except (HTTPException, ModelNotReady):
+        raise
+        
     except Exception as e:
-        print(f"\n❌ FAILED: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        print("=" * 70)
         return jsonify({"error": str(e), "status": "error"}), 500
 
 
 if __name__ == '__main__':
+    if '--export-model' in sys.argv:
+        # Pre-serialize the model once so workers can start from MODEL_PATH
+        export_path = sys.argv[sys.argv.index('--export-model') + 1]
+        export_model(export_path)
+        print(f"✓ SavedModel written to {export_path}")
+        sys.exit(0)
+    
+    if '--dev' not in sys.argv:
+        # Production: multi-worker gunicorn, settings in gunicorn.conf.py
+        config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py')
+        os.execvp(sys.executable, [sys.executable, '-m', 'gunicorn', '-c', config_path])
+    
     print("=" * 70)
-    print("🚀 HYBRID FACE RECOGNITION API v3.0")
+    print("🚀 HYBRID FACE RECOGNITION API v3.0 (DEV SERVER)")
     print("=" * 70)
     print("📡 Server: http://0.0.0.0:5000")
     print("")
     print("🎯 HYBRID APPROACH:")
-    print("   👤 Faces: Google Vision (40%) + TensorFlow (60%)")
+    print(f"   👤 Faces: {FACE_BACKEND} landmarks (40%) + TensorFlow (60%)")
     print("   📦 Objects: TensorFlow MobileNetV2")
     print("")
     print("✅ FEATURES:")
@@ -417,5 +2228,12 @@ if __name__ == '__main__':
     print("   • Works with different angles/lighting")
     print("   • Match threshold: 65% (very lenient)")
     print("")
+    print("⚠️  Debug server, single process. For production run:")
+    print("   gunicorn -c gunicorn.conf.py")
+    print("")
     print("=" * 70 + "\n")
+    
+    # With the reloader on, only the child process actually serves
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        init_worker()
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,193 @@
+"""
+Convert the embedding model, check parity between backends and fetch the
+local face detector.
+
+    # Convert from the ImageNet weights
+    python backend_tools.py convert tflite --quantization float16 -o mobilenet_v2_fp16.tflite
+    python backend_tools.py convert tflite --quantization int8 -o mobilenet_v2_int8.tflite
+    python backend_tools.py convert onnx -o mobilenet_v2.onnx
+
+    # The ImageNet classification head for /detect and /analyze (CLASSIFIER_HEAD)
+    python backend_tools.py export-head -o mobilenet_v2_head.npz
+
+    # YuNet's ONNX file for FACE_BACKEND=local (models/, or FACE_DETECTOR_MODEL)
+    python backend_tools.py fetch-face-model
+
+    # Embedding drift and speed of each backend against the Keras model
+    python backend_tools.py parity tflite=mobilenet_v2_int8.tflite onnx=mobilenet_v2.onnx
+
+The parity check embeds a fixed image set (a directory via --images, or a
+seeded synthetic set) with every backend and reports the cosine
+similarity of each image's embedding to the reference backend's.
+"""
+import argparse
+import glob
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw
+
+from classifier import export_head
+from embedding_backends import convert_onnx, convert_tflite, create_backend
+from face_backends import DEFAULT_YUNET_MODEL, YUNET_MODEL_URL, fetch_yunet_model
+from model_loader import prepare_image, preprocess_input
+
+
+def synthetic_images(count, seed=0):
+    """Deterministic BGR test images: random shapes on random backgrounds"""
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        img = Image.new('RGB', (400, 400), tuple(int(c) for c in rng.integers(0, 256, 3)))
+        draw = ImageDraw.Draw(img)
+        for _ in range(8):
+            x1, y1 = (int(v) for v in rng.integers(0, 300, 2))
+            x2, y2 = x1 + int(rng.integers(40, 200)), y1 + int(rng.integers(40, 200))
+            color = tuple(int(c) for c in rng.integers(0, 256, 3))
+            if rng.random() < 0.5:
+                draw.ellipse([x1, y1, x2, y2], fill=color)
+            else:
+                draw.rectangle([x1, y1, x2, y2], fill=color)
+        images.append(cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR))
+    return images
+
+
+def load_images(directory, count):
+    paths = sorted(
+        p for p in glob.glob(os.path.join(directory, '*'))
+        if os.path.splitext(p)[1].lower() in ('.jpg', '.jpeg', '.png', '.webp')
+    )[:count]
+    return [img for img in (cv2.imread(p) for p in paths) if img is not None]
+
+
+def to_batch(images):
+    return preprocess_input(np.stack([prepare_image(img) for img in images]))
+
+
+def parse_spec(spec):
+    """'keras' or 'name=model_path'"""
+    name, _, path = spec.partition('=')
+    return name, path or None
+
+
+def embed(backend, batch, batch_size):
+    outputs = []
+    start = time.perf_counter()
+    for i in range(0, len(batch), batch_size):
+        outputs.append(backend.predict(batch[i:i + batch_size], verbose=0))
+    seconds = time.perf_counter() - start
+    return np.concatenate(outputs).reshape(len(batch), -1), seconds
+
+
+def parity(specs, images, batch_size=16):
+    batch = to_batch(images)
+    report = {'images': len(images), 'batch_size': batch_size, 'backends': {}}
+    reference = None
+
+    for spec in specs:
+        name, path = parse_spec(spec)
+        backend = create_backend(name, path)
+        # First call pays for graph building / allocation
+        backend.predict(batch[:batch_size], verbose=0)
+        features, seconds = embed(backend, batch, batch_size)
+
+        entry = {
+            'model_path': path,
+            'images_per_second': round(len(batch) / seconds, 2),
+            'ms_per_image': round(seconds / len(batch) * 1000, 3)
+        }
+        if path and os.path.isfile(path):
+            entry['model_bytes'] = os.path.getsize(path)
+
+        if reference is None:
+            reference = features
+            entry['reference'] = True
+        else:
+            a = features.astype(np.float64)
+            b = reference.astype(np.float64)
+            cosines = np.sum(a * b, axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+            entry['cosine_to_reference'] = {
+                'mean': round(float(cosines.mean()), 6),
+                'min': round(float(cosines.min()), 6),
+                'p5': round(float(np.percentile(cosines, 5)), 6)
+            }
+            entry['max_abs_diff'] = round(float(np.abs(features - reference).max()), 6)
+
+        report['backends'][spec] = entry
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    convert = commands.add_parser('convert', help='convert the ImageNet model for another backend')
+    convert.add_argument('format', choices=['tflite', 'onnx'])
+    convert.add_argument('-o', '--output', required=True)
+    convert.add_argument('--quantization', choices=['none', 'float16', 'int8'], default='float16')
+    convert.add_argument('--calibration-images', help='directory of images for int8 calibration')
+    convert.add_argument('--calibration-count', type=int, default=100)
+
+    head = commands.add_parser('export-head', help='save the ImageNet classification head')
+    head.add_argument('-o', '--output', required=True)
+
+    face_model = commands.add_parser('fetch-face-model', help="download YuNet's ONNX file for local face detection")
+    face_model.add_argument('-o', '--output', default=os.environ.get('FACE_DETECTOR_MODEL') or DEFAULT_YUNET_MODEL)
+    face_model.add_argument('--url', default=YUNET_MODEL_URL)
+
+    check = commands.add_parser('parity', help='compare backends on a fixed image set')
+    check.add_argument('backends', nargs='+', help="'keras' or name=model_path; the keras model is the reference")
+    check.add_argument('--images', help='directory of test images (default: seeded synthetic set)')
+    check.add_argument('--count', type=int, default=64)
+    check.add_argument('--batch-size', type=int, default=16)
+    check.add_argument('--seed', type=int, default=0)
+    check.add_argument('--output', help='also write the JSON report here')
+
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        if args.format == 'onnx':
+            convert_onnx(args.output)
+        else:
+            calibration = None
+            if args.quantization == 'int8':
+                images = (
+                    load_images(args.calibration_images, args.calibration_count)
+                    if args.calibration_images else synthetic_images(args.calibration_count, seed=1)
+                )
+                calibration = [to_batch([img]) for img in images]
+            quantization = None if args.quantization == 'none' else args.quantization
+            convert_tflite(args.output, quantization=quantization, calibration_batches=calibration)
+        print(f"✓ Wrote {args.output}")
+        return
+
+    if args.command == 'export-head':
+        export_head(args.output)
+        print(f"✓ Wrote {args.output}")
+        return
+
+    if args.command == 'fetch-face-model':
+        size = fetch_yunet_model(args.output, args.url)
+        print(f"✓ Wrote {args.output} ({size} bytes)")
+        return
+
+    images = load_images(args.images, args.count) if args.images else synthetic_images(args.count, seed=args.seed)
+    # The Keras model is the reference, so it always runs first
+    specs = sorted(args.backends, key=lambda spec: parse_spec(spec)[0] != 'keras')
+    if parse_spec(specs[0])[0] != 'keras':
+        specs.insert(0, 'keras')
+    report = parity(specs, images, batch_size=args.batch_size)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+Dynamic micro-batching in front of the embedding model.
+
+Request threads submit their (already preprocessed) input tensors and
+get a Future back. A single worker thread takes the oldest pending
+submission, keeps collecting more for up to ``max_wait_ms`` or until
+``max_batch_size`` rows are queued, runs one batched forward pass and
+hands each caller its slice of the output. Submissions whose deadline
+(a time.monotonic() timestamp) has passed by then are failed with
+TimeoutError instead of being computed for nobody.
+
+After every forward pass ``on_batch(batch size, [seconds each
+submission waited])`` is called, e.g. to feed metrics histograms.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+# Upper bounds of the batch size histogram buckets
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+class MicroBatcher:
+    def __init__(self, run_batch, max_batch_size=32, max_wait_ms=5.0, on_batch=None):
+        self._run_batch = run_batch
+        self._on_batch = on_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.submissions = 0
+        self.rows = 0
+        self.expired = 0
+        self.batch_size_counts = {bucket: 0 for bucket in BATCH_SIZE_BUCKETS + ('+Inf',)}
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def _ensure_started(self):
+        # Started lazily so the thread is created in the serving process,
+        # never in a gunicorn master before fork
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._loop, name='micro-batcher', daemon=True)
+                    self._thread.start()
+
+    def submit(self, inputs, deadline=None):
+        """Queue a (n, ...) array; the Future resolves to the model's n output rows"""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((inputs, future, time.perf_counter(), deadline))
+        return future
+
+    def __call__(self, inputs, deadline=None):
+        return self.submit(inputs, deadline).result()
+
+    def _collect(self):
+        pending = [self._queue.get()]
+        rows = len(pending[0][0])
+        deadline = time.perf_counter() + self.max_wait
+
+        while rows < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            pending.append(item)
+            rows += len(item[0])
+
+        return pending
+
+    def _drop_expired(self, pending):
+        now = time.monotonic()
+        live = []
+        for item in pending:
+            deadline = item[3]
+            if deadline is not None and now >= deadline:
+                item[1].set_exception(TimeoutError("Deadline passed while waiting for the model"))
+                with self._stats_lock:
+                    self.expired += 1
+            else:
+                live.append(item)
+        return live
+
+    def _loop(self):
+        while True:
+            pending = self._drop_expired(self._collect())
+            if not pending:
+                continue
+            started = time.perf_counter()
+            counts = [len(inputs) for inputs, _, _, _ in pending]
+
+            try:
+                outputs = self._run_batch(np.concatenate([inputs for inputs, _, _, _ in pending]))
+            except Exception as e:
+                for _, future, _, _ in pending:
+                    future.set_exception(e)
+                continue
+            finally:
+                self._record(sum(counts), [started - queued for _, _, queued, _ in pending])
+
+            offset = 0
+            for (_, future, _, _), count in zip(pending, counts):
+                future.set_result(outputs[offset:offset + count])
+                offset += count
+
+    def _record(self, batch_size, waits):
+        bucket = next((b for b in BATCH_SIZE_BUCKETS if batch_size <= b), '+Inf')
+        with self._stats_lock:
+            self.batches += 1
+            self.submissions += len(waits)
+            self.rows += batch_size
+            self.batch_size_counts[bucket] += 1
+            self.wait_seconds_total += sum(waits)
+            self.wait_seconds_max = max(self.wait_seconds_max, max(waits))
+        if self._on_batch is not None:
+            try:
+                self._on_batch(batch_size, waits)
+            except Exception:
+                # Metrics must never take the batcher thread down
+                pass
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'batches': self.batches,
+                'submissions': self.submissions,
+                'rows': self.rows,
+                'expired': self.expired,
+                'mean_batch_size': round(self.rows / self.batches, 2) if self.batches else 0.0,
+                'batch_size_histogram': {str(k): v for k, v in self.batch_size_counts.items()},
+                'wait_ms_mean': round(self.wait_seconds_total / max(self.submissions, 1) * 1000, 3),
+                'wait_ms_max': round(self.wait_seconds_max * 1000, 3),
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000
+            }
@@ -0,0 +1,370 @@
+"""
+Latency and throughput benchmark for /compare and /detect.
+
+Runs a fixed-seed corpus built from the synthetic face, dog and car
+generators in test_synthetic_faces.py, either in-process through the
+Flask test client or over HTTP against a running server:
+
+    python benchmark.py --output bench.json
+    python benchmark.py --url http://127.0.0.1:5000 --concurrency 1,4,8
+    python benchmark.py --output new.json --baseline bench.json
+
+Every concurrency level reports p50/p95/p99 latency, requests/sec and
+the per-stage split the endpoints return in analysis_details: decode,
+faces (face detection, Google Vision when that is the face backend),
+vision (/detect), embed and score. Decoding happens inside the embed
+stages, so it is not added on top of them.
+
+A worker admits ADMISSION_MAX_CONCURRENT requests and queues
+ADMISSION_MAX_QUEUE more (12 by default); beyond that it answers 429.
+Those are counted as `rejected`, apart from `errors`, and left out of the
+latencies and of requests/sec (successful responses only), so a level
+above capacity shows shedding rather than inflated throughput. The
+default levels stay within one worker's capacity.
+
+By default every request carries a unique JPEG comment, so image bytes
+differ (and miss every content-hash cache) while the pixels, and so the
+work, stay identical between runs. --warm-cache reuses the corpus bytes
+as-is, which measures the cached path instead. In-process runs use a
+fresh embedding cache directory unless EMBEDDING_CACHE_DIR is set.
+
+Every /compare pair is two distinct corpus photos, so the content-hash
+fast path (identical uploads only) never answers one; the dHash
+near-duplicate check still runs as a hint on each pair. --no-fast-path
+sends fast_path=false with every request to skip both.
+
+--fake-vision runs in-process against fake_vision.py, with Vision as the
+face backend, so the hybrid path can be measured at a chosen Vision
+latency and error rate without network access:
+
+    python benchmark.py --fake-vision --vision-latency-ms 250 --vision-error-rate 0.02
+"""
+import argparse
+import base64
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+from test_synthetic_faces import create_car, create_dog, create_synthetic_face
+
+
+SKIN_COLORS = ['peachpuff', 'wheat', 'tan', 'bisque']
+FACE_FEATURES = [
+    {'hair': hair, 'smile': smile, 'beard': beard}
+    for hair in (True, False) for smile in (True, False) for beard in (True, False)
+]
+DOG_COLORS = ['brown', 'black', 'white', 'goldenrod']
+CAR_COLORS = ['red', 'blue', 'green', 'silver']
+
+
+def build_corpus():
+    """{category: [base64 JPEG]}; the generators are deterministic"""
+    return {
+        'face': [
+            create_synthetic_face('face', color, features)
+            for color in SKIN_COLORS for features in FACE_FEATURES
+        ],
+        'dog': [create_dog(color) for color in DOG_COLORS],
+        'car': [create_car(color) for color in CAR_COLORS]
+    }
+
+
+def build_requests(corpus, endpoint, count, seed):
+    """count (category, payload) pairs in a fixed, seeded order"""
+    rng = random.Random(f"{seed}-{endpoint}")
+    categories = sorted(corpus)
+    requests_list = []
+    for _ in range(count):
+        category = rng.choice(categories)
+        if endpoint == 'compare':
+            image1, image2 = rng.sample(corpus[category], 2)
+            requests_list.append((category, {'image1': image1, 'image2': image2}))
+        else:
+            requests_list.append((category, {'image': rng.choice(corpus[category])}))
+    return requests_list
+
+
+def make_unique(image, tag):
+    """Same pixels, different bytes: a JPEG COM segment right after SOI"""
+    data = base64.b64decode(image)
+    comment = f"benchmark {tag}".encode('ascii')
+    segment = b'\xff\xfe' + (len(comment) + 2).to_bytes(2, 'big') + comment
+    return base64.b64encode(data[:2] + segment + data[2:]).decode()
+
+
+def stage_timings(body):
+    """Per-stage milliseconds reported by the endpoint"""
+    details = (body or {}).get('analysis_details') or {}
+    stages = dict(details.get('timings_ms') or {})
+    if 'decode' in details:
+        stages['decode'] = details['decode'].get('decode_ms', 0.0)
+    return stages
+
+
+class InProcessTarget:
+    """Flask test client, one per thread, against this process's app"""
+
+    name = 'in-process'
+
+    def __init__(self):
+        if 'EMBEDDING_CACHE_DIR' not in os.environ:
+            os.environ['EMBEDDING_CACHE_DIR'] = tempfile.mkdtemp(prefix='benchmark-cache-')
+        os.environ.setdefault('MODEL_LOADING', 'eager')
+        import app as service
+        service.init_worker()
+        if not service.model_loader.ready:
+            raise RuntimeError(f"Model not ready: {service.model_loader.state}")
+        self.service = service
+        self.local = threading.local()
+
+    def client(self):
+        if not hasattr(self.local, 'client'):
+            self.local.client = self.service.app.test_client()
+        return self.local.client
+
+    def get(self, path):
+        response = self.client().get(path)
+        return response.status_code, response.get_json(silent=True)
+
+    def post(self, path, payload):
+        response = self.client().post(path, json=payload)
+        return response.status_code, response.get_json(silent=True)
+
+    def close(self):
+        self.service.shutdown_worker()
+
+
+class HttpTarget:
+    """A running server, one keep-alive session per thread"""
+
+    name = 'http'
+
+    def __init__(self, url, timeout=60):
+        import requests
+        self.requests = requests
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def session(self):
+        if not hasattr(self.local, 'session'):
+            self.local.session = self.requests.Session()
+        return self.local.session
+
+    def get(self, path):
+        response = self.session().get(self.url + path, timeout=self.timeout)
+        return response.status_code, response.json()
+
+    def post(self, path, payload):
+        try:
+            response = self.session().post(self.url + path, json=payload, timeout=self.timeout)
+        except self.requests.RequestException as e:
+            return 0, {'error': str(e)}
+        try:
+            return response.status_code, response.json()
+        except ValueError:
+            return response.status_code, None
+
+    def close(self):
+        pass
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    values = np.asarray(values, dtype=np.float64)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        'mean': round(float(values.mean()), 2),
+        'p50': round(float(p50), 2),
+        'p95': round(float(p95), 2),
+        'p99': round(float(p99), 2),
+        'max': round(float(values.max()), 2)
+    }
+
+
+def run_level(target, endpoint, requests_list, concurrency, warm_cache, run_tag, fast_path=True):
+    """Fire requests_list with `concurrency` requests in flight"""
+    def one(index):
+        category, payload = requests_list[index]
+        if not warm_cache:
+            payload = {
+                field: make_unique(image, f"{run_tag}-{index}-{field}") if field.startswith('image') else image
+                for field, image in payload.items()
+            }
+        if not fast_path:
+            payload = dict(payload, fast_path=False)
+        start = time.perf_counter()
+        status, body = target.post('/' + endpoint, payload)
+        return category, status, (time.perf_counter() - start) * 1000, stage_timings(body)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        samples = list(pool.map(one, range(len(requests_list))))
+    wall = time.perf_counter() - start
+
+    ok = [s for s in samples if s[1] == 200]
+    rejected = sum(1 for s in samples if s[1] == 429)
+    statuses = {}
+    for _, status, _, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    stages = {}
+    for _, _, _, timings in ok:
+        for stage, ms in timings.items():
+            stages.setdefault(stage, []).append(ms)
+
+    return {
+        'concurrency': concurrency,
+        'requests': len(samples),
+        'errors': len(samples) - len(ok) - rejected,
+        'rejected': rejected,
+        'status_codes': statuses,
+        'seconds': round(wall, 3),
+        'requests_per_second': round(len(ok) / wall, 2) if wall else 0.0,
+        'latency_ms': percentiles([s[2] for s in ok]),
+        'latency_ms_by_category': {
+            category: percentiles([s[2] for s in ok if s[0] == category])
+            for category in sorted({s[0] for s in ok})
+        },
+        'stages_ms': {stage: percentiles(values) for stage, values in sorted(stages.items())}
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare_to_baseline(report, baseline):
+    """Print p50/p95/RPS changes against an earlier report"""
+    print("\n📈 Against baseline" + (f" {baseline['meta'].get('git_revision')}" if baseline['meta'].get('git_revision') else ''))
+    for endpoint, levels in report['results'].items():
+        for level, result in levels.items():
+            old = baseline.get('results', {}).get(endpoint, {}).get(level)
+            if not old or not old['latency_ms'] or not result['latency_ms']:
+                continue
+            changes = []
+            for key in ('p50', 'p95'):
+                before, after = old['latency_ms'][key], result['latency_ms'][key]
+                changes.append(f"{key} {before:.1f} -> {after:.1f}ms ({(after - before) / before * 100:+.1f}%)")
+            before, after = old['requests_per_second'], result['requests_per_second']
+            changes.append(f"rps {before:.1f} -> {after:.1f} ({(after - before) / before * 100:+.1f}%)")
+            print(f"   /{endpoint} c={level}: " + ', '.join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='benchmark a running server instead of the app in-process')
+    parser.add_argument('--endpoints', default='compare,detect')
+    parser.add_argument('--concurrency', default='1,4,8', help='comma-separated levels')
+    parser.add_argument('--requests', type=int, default=50, help='requests per endpoint and level')
+    parser.add_argument('--warmup', type=int, default=5, help='unmeasured requests per endpoint first')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--warm-cache', action='store_true', help='reuse identical image bytes')
+    parser.add_argument('--no-fast-path', action='store_true', help='send fast_path=false (skip the content-hash shortcut and dHash hint)')
+    parser.add_argument('--timeout', type=float, default=60, help='HTTP timeout in seconds')
+    parser.add_argument('--fake-vision', action='store_true', help='in-process only: use the offline Vision stub')
+    parser.add_argument('--vision-latency-ms', type=float, help='fake Vision latency (FAKE_VISION_LATENCY_MS)')
+    parser.add_argument('--vision-error-rate', type=float, help='fake Vision failure rate (FAKE_VISION_ERROR_RATE)')
+    parser.add_argument('--output', help='write the JSON report here')
+    parser.add_argument('--baseline', help='earlier JSON report to compare against')
+    args = parser.parse_args()
+
+    if args.fake_vision:
+        if args.url:
+            parser.error('--fake-vision only applies in-process; start the server with VISION_CLIENT=fake instead')
+        os.environ['VISION_CLIENT'] = 'fake'
+        os.environ['FACE_BACKEND'] = 'vision'
+        if args.vision_latency_ms is not None:
+            os.environ['FAKE_VISION_LATENCY_MS'] = str(args.vision_latency_ms)
+        if args.vision_error_rate is not None:
+            os.environ['FAKE_VISION_ERROR_RATE'] = str(args.vision_error_rate)
+
+    endpoints = [e.strip().strip('/') for e in args.endpoints.split(',') if e.strip()]
+    levels = [int(c) for c in args.concurrency.split(',')]
+
+    corpus = build_corpus()
+    target = HttpTarget(args.url, args.timeout) if args.url else InProcessTarget()
+    status, health = target.get('/health')
+    health = health or {}
+    print(f"⏱️ Benchmarking {args.url or 'the app in-process'} (health {status}): {', '.join(endpoints)} at concurrency {levels}")
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'target': args.url or target.name,
+            'git_revision': git_revision(),
+            'seed': args.seed,
+            'requests_per_level': args.requests,
+            'warmup': args.warmup,
+            'warm_cache': args.warm_cache,
+            'fast_path': not args.no_fast_path,
+            'fake_vision': {
+                key: os.environ.get(key)
+                for key in ('FAKE_VISION_LATENCY_MS', 'FAKE_VISION_ERROR_RATE', 'FAKE_VISION_IMAGE_ERROR_RATE')
+            } if args.fake_vision else None,
+            'corpus': {category: len(images) for category, images in corpus.items()},
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'server': {
+                key: health.get(key)
+                for key in ('status', 'version', 'model', 'google_vision', 'face_backend', 'admission')
+            }
+        },
+        'results': {}
+    }
+
+    try:
+        for endpoint in endpoints:
+            requests_list = build_requests(corpus, endpoint, args.requests, args.seed)
+            if args.warmup:
+                run_level(
+                    target, endpoint, requests_list[:args.warmup], 1, args.warm_cache, 'warmup', not args.no_fast_path
+                )
+            report['results'][endpoint] = {}
+            for concurrency in levels:
+                result = run_level(
+                    target, endpoint, requests_list, concurrency, args.warm_cache, f"{endpoint}-{concurrency}",
+                    not args.no_fast_path
+                )
+                report['results'][endpoint][str(concurrency)] = result
+                latency = result['latency_ms']
+                print(
+                    f"   /{endpoint} c={concurrency}: {result['requests_per_second']:.1f} req/s, "
+                    f"p50 {latency.get('p50', 0):.1f}ms, p95 {latency.get('p95', 0):.1f}ms, "
+                    f"p99 {latency.get('p99', 0):.1f}ms, {result['errors']} errors, {result['rejected']} rejected (429)"
+                )
+    finally:
+        target.close()
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+        print(f"✓ Report written to {args.output}")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare_to_baseline(report, json.load(f))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""
+ImageNet classification head for the shared MobileNetV2 backbone.
+
+The feature extractor is MobileNetV2 without its top, average-pooled to
+1280 values, and the ImageNet classifier Keras leaves off is a single
+dense softmax layer over exactly those values. Applied to an embedding
+in numpy it labels the image for free: the forward pass that produced
+the embedding /compare uses (often already cached) also answers /detect.
+
+The head is the 1280 x 1000 'predictions' kernel, its bias and the
+class names, saved as an .npz by export_head() (backend_tools.py
+export-head) so servers without network access can load it from
+CLASSIFIER_HEAD. It only fits backbones with the ImageNet weights
+(Keras, or a TFLite/ONNX/SavedModel conversion of them).
+
+ImageNet orders its classes by WordNet, so classes 0-397 are the
+animals; their summed probability is what makes an image a pet.
+"""
+import numpy as np
+
+
+ANIMAL_CLASSES = 398
+
+
+class ClassificationHead:
+    def __init__(self, kernel, bias, labels):
+        self.kernel = np.asarray(kernel, dtype=np.float32)
+        self.bias = np.asarray(bias, dtype=np.float32)
+        self.labels = [str(label) for label in labels]
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['kernel'], data['bias'], data['labels'])
+
+    @classmethod
+    def from_keras(cls):
+        """The ImageNet head from Keras (downloads the weights and class names on first use)"""
+        from tensorflow.keras.applications import MobileNetV2
+        from tensorflow.keras.applications.imagenet_utils import decode_predictions
+
+        kernel, bias = MobileNetV2(weights='imagenet', include_top=True).get_layer('predictions').get_weights()
+        # Row i of the identity decodes to class i's name
+        names = [row[0][1].replace('_', ' ') for row in decode_predictions(np.eye(len(bias)), top=1)]
+        return cls(kernel, bias, names)
+
+    def save(self, path):
+        np.savez(path, kernel=self.kernel, bias=self.bias, labels=np.array(self.labels))
+
+    def probabilities(self, features):
+        """(n, classes) softmax over the head's logits for (n, 1280) embeddings"""
+        features = np.asarray(features, dtype=np.float32).reshape(-1, self.kernel.shape[0])
+        logits = features @ self.kernel + self.bias
+        logits -= logits.max(axis=1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    def predict(self, features, top_k=5, min_score=0.0):
+        """
+        Per embedding: {'labels': [(name, score, is_animal)] best first,
+        'animal_score': probability mass on the animal classes}
+        """
+        results = []
+        for probs in self.probabilities(features):
+            top = np.argsort(-probs)[:top_k]
+            results.append({
+                'labels': [
+                    (self.labels[i], float(probs[i]), bool(i < ANIMAL_CLASSES))
+                    for i in top if probs[i] >= min_score
+                ],
+                'animal_score': float(probs[:ANIMAL_CLASSES].sum())
+            })
+        return results
+
+
+def export_head(path):
+    """Save the Keras ImageNet head for CLASSIFIER_HEAD"""
+    ClassificationHead.from_keras().save(path)
+    return path
@@ -0,0 +1,4 @@
+# The test_*.py scripts next to the app drive a running server by hand;
+# the unit tests are in tests/. This directory goes on sys.path, so the
+# tests import the modules the way app.py does.
+collect_ignore = ['test_complete.py', 'test_synthetic_faces.py']
@@ -0,0 +1,193 @@
+"""
+Pluggable inference backends for the MobileNetV2 embedding model.
+
+Every backend takes a preprocessed float32 batch of shape (n, 224, 224, 3)
+and returns an (n, 1280) embedding matrix, so extract_features() doesn't
+care which one is running:
+
+    keras   today's Keras model (ImageNet weights or MODEL_PATH)
+    tflite  a TFLite flatbuffer (float16 or int8 quantized)
+    onnx    an ONNX Runtime session (optional dependency: onnxruntime)
+
+TFLite and ONNX models are converted from the same weights with
+convert_tflite() / convert_onnx(); see backend_tools.py.
+"""
+import hashlib
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+
+import numpy as np
+
+from model_loader import build_mobilenet
+
+
+class KerasBackend:
+    name = 'keras'
+
+    def __init__(self, model_path=None):
+        self.model = build_mobilenet(model_path)
+
+    def predict(self, batch, verbose=0):
+        return self.model.predict(batch, verbose=verbose)
+
+
+class TFLiteBackend:
+    name = 'tflite'
+
+    def __init__(self, model_path):
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+
+        self.interpreter = Interpreter(model_path=model_path, num_threads=os.cpu_count())
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = None
+        # The interpreter keeps per-invocation state
+        self._lock = threading.Lock()
+
+    def _quantize(self, batch):
+        scale, zero_point = self._input['quantization']
+        if self._input['dtype'] == np.float32 or not scale:
+            return batch.astype(np.float32)
+        info = np.iinfo(self._input['dtype'])
+        return np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(self._input['dtype'])
+
+    def _dequantize(self, output):
+        scale, zero_point = self._output['quantization']
+        if output.dtype == np.float32 or not scale:
+            return output.astype(np.float32)
+        return (output.astype(np.float32) - zero_point) * scale
+
+    def predict(self, batch, verbose=0):
+        with self._lock:
+            if self._batch_size != len(batch):
+                self.interpreter.resize_tensor_input(self._input['index'], list(batch.shape))
+                self.interpreter.allocate_tensors()
+                self._input = self.interpreter.get_input_details()[0]
+                self._output = self.interpreter.get_output_details()[0]
+                self._batch_size = len(batch)
+            self.interpreter.set_tensor(self._input['index'], self._quantize(batch))
+            self.interpreter.invoke()
+            output = self.interpreter.get_tensor(self._output['index'])
+        return self._dequantize(output).reshape(len(batch), -1)
+
+
+class OnnxBackend:
+    name = 'onnx'
+
+    def __init__(self, model_path):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(
+            model_path, sess_options=options, providers=['CPUExecutionProvider']
+        )
+        self._input_name = self.session.get_inputs()[0].name
+
+    def predict(self, batch, verbose=0):
+        output = self.session.run(None, {self._input_name: batch.astype(np.float32)})[0]
+        return output.reshape(len(batch), -1)
+
+
+BACKENDS = {
+    'keras': KerasBackend,
+    'tflite': TFLiteBackend,
+    'onnx': OnnxBackend
+}
+
+
+def model_fingerprint(model_path, length=8):
+    """Short content hash of a model file, or of every file in a SavedModel directory"""
+    digest = hashlib.sha256()
+    if os.path.isdir(model_path):
+        paths = sorted(os.path.join(root, name) for root, _, names in os.walk(model_path) for name in names)
+    else:
+        paths = [model_path]
+    for path in paths:
+        digest.update(os.path.relpath(path, model_path).encode('utf-8'))
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()[:length]
+
+
+def embedding_namespace(name='keras', model_path=None):
+    """
+    Embedding cache namespace for a backend. Quantized/converted models
+    drift slightly, so their embeddings are cached separately from the
+    Keras ones. A Keras MODEL_PATH (fine-tuned or re-exported weights) is
+    named by its file name and content hash, so replacing the model at the
+    same path doesn't serve the old model's embeddings.
+    """
+    if name == 'keras':
+        if not model_path:
+            return 'mobilenet_v2'
+        model_path = os.path.normpath(model_path)
+        parts = ['mobilenet_v2', 'keras', os.path.splitext(os.path.basename(model_path))[0]]
+        # A missing model fails when it is loaded; the namespace doesn't matter then
+        if os.path.exists(model_path):
+            parts.append(model_fingerprint(model_path))
+        return '-'.join(parts)
+    return '-'.join(['mobilenet_v2', name, os.path.splitext(os.path.basename(model_path or ''))[0]])
+
+
+def create_backend(name='keras', model_path=None):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{name}' (choose from {', '.join(BACKENDS)})")
+    if name != 'keras' and not model_path:
+        raise ValueError(f"The {name} backend needs MODEL_PATH pointing at a converted model")
+    return BACKENDS[name](model_path)
+
+
+def _export_saved_model(directory):
+    path = os.path.join(directory, 'saved_model')
+    build_mobilenet().export(path)
+    return path
+
+
+def convert_tflite(output_path, quantization='float16', calibration_batches=None):
+    """
+    Convert the ImageNet feature extractor to TFLite.
+    quantization: None (float32), 'float16' or 'int8'. int8 needs
+    calibration_batches, an iterable of preprocessed (1, 224, 224, 3) arrays.
+    """
+    import tensorflow as tf
+
+    with tempfile.TemporaryDirectory() as tmp:
+        converter = tf.lite.TFLiteConverter.from_saved_model(_export_saved_model(tmp))
+
+        if quantization == 'float16':
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            converter.target_spec.supported_types = [tf.float16]
+        elif quantization == 'int8':
+            if calibration_batches is None:
+                raise ValueError("int8 quantization needs calibration images")
+            batches = list(calibration_batches)
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            converter.representative_dataset = lambda: ([b.astype(np.float32)] for b in batches)
+        elif quantization:
+            raise ValueError(f"Unknown quantization '{quantization}'")
+
+        model = converter.convert()
+
+    with open(output_path, 'wb') as f:
+        f.write(model)
+    return output_path
+
+
+def convert_onnx(output_path, opset=17):
+    """Convert the ImageNet feature extractor to ONNX (needs tf2onnx)"""
+    with tempfile.TemporaryDirectory() as tmp:
+        subprocess.run(
+            [sys.executable, '-m', 'tf2onnx.convert', '--saved-model', _export_saved_model(tmp),
+             '--output', output_path, '--opset', str(opset)],
+            check=True
+        )
+    return output_path
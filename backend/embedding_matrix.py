@@ -0,0 +1,327 @@
+"""
+Memory-mapped embedding matrix for gallery-wide scoring.
+
+One append-only file per model holds every enrolled embedding,
+L2-normalised at append time, so scoring a probe is a single matmul:
+
+    <path>      4 KiB header: magic, then JSON {model, dim, dtype, rows}
+                followed by a contiguous rows x dim float16/float32 matrix
+    <path>.ids  ID table, one JSON line per change: [id, row] when a row
+                is appended for id, [id, null] when id is removed
+
+Readers map the matrix with np.memmap, so every gunicorn worker shares
+the same page-cache pages instead of holding its own heap copy, and pick
+up rows appended by other processes on the next search. Appends take an
+exclusive flock on the matrix file, write the rows, the ID lines and
+finally the row count in the header, so a crash mid-append leaves the
+previous state readable. Re-adding an id appends a new row; the old row
+becomes dead space until compact() rewrites the file.
+
+compact() writes the live rows to a new file with the next generation
+number in its header and its own ID table (<path>.<generation>.ids),
+then renames it over <path>. The header names the ID table, so a reader
+never pairs a matrix with the other generation's table; it notices the
+new generation on its next refresh and reads it from scratch.
+"""
+import fcntl
+import json
+import os
+import threading
+
+import numpy as np
+
+
+MAGIC = b'EMBMTX01'
+HEADER_SIZE = 4096
+# float16 rows are upcast in blocks this big, never the whole matrix at once
+SCORE_CHUNK_ROWS = 65536
+
+
+def _read_header(f):
+    f.seek(0)
+    raw = f.read(HEADER_SIZE)
+    if len(raw) < HEADER_SIZE or not raw.startswith(MAGIC):
+        raise ValueError("Not an embedding matrix file")
+    length = int.from_bytes(raw[len(MAGIC):len(MAGIC) + 4], 'little')
+    return json.loads(raw[len(MAGIC) + 4:len(MAGIC) + 4 + length])
+
+
+def ids_path(path, generation=0):
+    """The ID table of one generation of the matrix at path"""
+    return path + '.ids' if not generation else f"{path}.{generation}.ids"
+
+
+def _write_header(f, header):
+    data = json.dumps(header).encode('utf-8')
+    f.seek(0)
+    f.write((MAGIC + len(data).to_bytes(4, 'little') + data).ljust(HEADER_SIZE, b'\0'))
+
+
+class EmbeddingMatrix:
+    def __init__(self, path, model='mobilenet_v2', dtype='float16'):
+        self.path = path
+        self.ids_path = ids_path(path)
+        self.model = model
+        self.dtype = np.dtype(dtype)
+        self.dim = None
+        self._lock = threading.Lock()
+        self._reset(0)
+        self.refresh()
+
+    def _reset(self, generation):
+        """Forget every row, to read the given generation from scratch"""
+        self.generation = generation
+        self.ids_path = ids_path(self.path, generation)
+        self.rows = 0
+        self.matrix = None
+        self.row_ids = []
+        self.live = np.zeros(0, dtype=bool)
+        self._id_rows = {}
+        self._ids_offset = 0
+
+    def refresh(self):
+        """Map rows and read ID table lines written by any process since the last call"""
+        if not os.path.exists(self.path):
+            return
+        with self._lock:
+            for attempt in range(3):
+                f = open(self.path, 'rb')
+                if os.fstat(f.fileno()).st_size < HEADER_SIZE:
+                    # Another process is still creating it
+                    f.close()
+                    return
+                header = _read_header(f)
+                if header['model'] != self.model:
+                    f.close()
+                    raise ValueError(f"{self.path} holds {header['model']} embeddings, not {self.model}")
+                generation = header.get('generation', 0)
+                try:
+                    ids_file = open(ids_path(self.path, generation), 'rb')
+                    break
+                except FileNotFoundError:
+                    # Compacted between the two reads: the next header names the new table
+                    f.close()
+                    if attempt == 2:
+                        raise
+            with f, ids_file:
+                if generation != self.generation:
+                    self._reset(generation)
+                if header['rows'] == self.rows and os.fstat(ids_file.fileno()).st_size == self._ids_offset:
+                    return
+
+                if header['rows'] != self.rows:
+                    self.dim = header['dim']
+                    self.dtype = np.dtype(header['dtype'])
+                    self.rows = header['rows']
+                    # Mapped through f, so it is the file this header came from
+                    self.matrix = np.memmap(
+                        f, dtype=self.dtype, mode='r', offset=HEADER_SIZE, shape=(self.rows, self.dim)
+                    ) if self.rows else None
+                    self.row_ids.extend([None] * (self.rows - len(self.row_ids)))
+                    live = np.zeros(self.rows, dtype=bool)
+                    live[:len(self.live)] = self.live
+                    self.live = live
+
+                ids_file.seek(self._ids_offset)
+                for line in ids_file:
+                    if not line.endswith(b'\n'):
+                        break
+                    gallery_id, row = json.loads(line)
+                    # Rows past the header's count are still being written
+                    if row is not None and row >= self.rows:
+                        break
+                    self._ids_offset += len(line)
+                    old = self._id_rows.pop(gallery_id, None)
+                    if old is not None:
+                        self.live[old] = False
+                    if row is not None:
+                        self._id_rows[gallery_id] = row
+                        self.row_ids[row] = gallery_id
+                        self.live[row] = True
+
+    def _locked_file(self, dim):
+        """Open the matrix for writing under an exclusive lock, creating it if needed"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        f = open(self.path, 'a+b')
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            open(ids_path(self.path), 'ab').close()
+            _write_header(f, {'model': self.model, 'dim': int(dim), 'dtype': self.dtype.name, 'rows': 0})
+            f.flush()
+        f.close()
+        while True:
+            f = open(self.path, 'r+b')
+            fcntl.flock(f, fcntl.LOCK_EX)
+            # compact() may have renamed a new file over the one just locked
+            if os.fstat(f.fileno()).st_ino == os.stat(self.path).st_ino:
+                return f
+            f.close()
+
+    def append(self, ids, vectors):
+        """Add (or replace) rows for ids"""
+        vectors = np.asarray(vectors, dtype=np.float64).reshape(len(ids), -1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            vectors = np.nan_to_num(vectors / np.linalg.norm(vectors, axis=1, keepdims=True))
+
+        with self._locked_file(vectors.shape[1]) as f:
+            header = _read_header(f)
+            if header['dim'] != vectors.shape[1]:
+                raise ValueError(f"Expected {header['dim']}-d vectors, got {vectors.shape[1]}-d")
+            first_row = header['rows']
+            f.seek(HEADER_SIZE + first_row * header['dim'] * np.dtype(header['dtype']).itemsize)
+            f.write(vectors.astype(header['dtype']).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+            with open(ids_path(self.path, header.get('generation', 0)), 'ab') as ids_file:
+                ids_file.write(b''.join(
+                    json.dumps([str(gallery_id), first_row + i]).encode('utf-8') + b'\n'
+                    for i, gallery_id in enumerate(ids)
+                ))
+
+            header['rows'] = first_row + len(ids)
+            _write_header(f, header)
+        self.refresh()
+
+    def remove(self, gallery_id):
+        self.refresh()
+        if gallery_id not in self._id_rows:
+            return False
+        with self._locked_file(self.dim) as f:
+            generation = _read_header(f).get('generation', 0)
+            with open(ids_path(self.path, generation), 'ab') as ids_file:
+                ids_file.write(json.dumps([gallery_id, None]).encode('utf-8') + b'\n')
+        self.refresh()
+        return True
+
+    def compact(self):
+        """Rewrite the matrix with only its live rows; returns the number of dead rows dropped"""
+        if not os.path.exists(self.path):
+            return 0
+        self.refresh()
+        with self._locked_file(self.dim) as f:
+            header = _read_header(f)
+            generation = header.get('generation', 0)
+            rows, dim, dtype = header['rows'], header['dim'], np.dtype(header['dtype'])
+            # Replay the ID table as it is under the lock, not this process's view of it
+            id_rows = {}
+            with open(ids_path(self.path, generation), 'rb') as ids_file:
+                for line in ids_file:
+                    if not line.endswith(b'\n'):
+                        break
+                    gallery_id, row = json.loads(line)
+                    if row is not None and row >= rows:
+                        break
+                    if row is None:
+                        id_rows.pop(gallery_id, None)
+                    else:
+                        id_rows[gallery_id] = row
+            live = sorted(id_rows.items(), key=lambda item: item[1])
+            if len(live) == rows:
+                return 0
+
+            new_generation = generation + 1
+            with open(ids_path(self.path, new_generation), 'wb') as ids_file:
+                ids_file.write(b''.join(
+                    json.dumps([gallery_id, i]).encode('utf-8') + b'\n' for i, (gallery_id, _) in enumerate(live)
+                ))
+                ids_file.flush()
+                os.fsync(ids_file.fileno())
+
+            matrix = np.memmap(f, dtype=dtype, mode='r', offset=HEADER_SIZE, shape=(rows, dim))
+            live_rows = np.array([row for _, row in live], dtype=np.int64)
+            tmp_path = self.path + '.compact'
+            with open(tmp_path, 'wb') as out:
+                _write_header(out, dict(header, rows=len(live), generation=new_generation))
+                for start in range(0, len(live_rows), SCORE_CHUNK_ROWS):
+                    out.write(np.ascontiguousarray(matrix[live_rows[start:start + SCORE_CHUNK_ROWS]]).tobytes())
+                out.flush()
+                os.fsync(out.fileno())
+            del matrix
+            os.replace(tmp_path, self.path)
+            os.remove(ids_path(self.path, generation))
+        self.refresh()
+        return rows - len(live)
+
+    def scores(self, vectors, rows=None):
+        """
+        Cosine similarity of each of vectors (k, dim) against every row,
+        dead rows included, or only against the row numbers in rows:
+        one (k, rows) matmul
+        """
+        return self._scores(self.matrix, vectors, rows)
+
+    def _scores(self, matrix, vectors, rows=None):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim or 1)
+        if matrix is None:
+            return np.zeros((len(vectors), self.rows if rows is None else len(rows)), dtype=np.float32)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            vectors = np.nan_to_num(vectors / np.linalg.norm(vectors, axis=1, keepdims=True))
+        if rows is None:
+            if matrix.dtype == np.float32:
+                return vectors @ matrix.T
+            blocks = (matrix[start:start + SCORE_CHUNK_ROWS] for start in range(0, len(matrix), SCORE_CHUNK_ROWS))
+        else:
+            blocks = (matrix[rows[start:start + SCORE_CHUNK_ROWS]] for start in range(0, len(rows), SCORE_CHUNK_ROWS))
+        return np.concatenate(
+            [vectors @ block.astype(np.float32).T for block in blocks] or [np.zeros((len(vectors), 0), dtype=np.float32)],
+            axis=1
+        )
+
+    def search_many(self, vectors, top_k=10, min_similarity=None, rows=None):
+        """search() for several query vectors at once; rows limits it to those row numbers"""
+        self.refresh()
+        with self._lock:
+            # One generation's matrix and ids, even if compact() swaps them meanwhile
+            matrix, matrix_rows, live, row_ids = self.matrix, self.rows, self.live.copy(), self.row_ids
+        if rows is not None:
+            rows = np.asarray(rows, dtype=np.int64)
+            rows = rows[rows < matrix_rows]
+            live = live[rows]
+        k = min(top_k, int(live.sum()))
+        if not matrix_rows or k <= 0:
+            return [[] for _ in vectors]
+
+        scores = np.where(live, self._scores(matrix, vectors, rows)[:, :len(live)], -np.inf)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for query_scores, query_top in zip(scores, top):
+            query_top = query_top[np.argsort(-query_scores[query_top])]
+            results.append([
+                (row_ids[row if rows is None else rows[row]], float(query_scores[row]))
+                for row in query_top
+                if min_similarity is None or query_scores[row] >= min_similarity
+            ])
+        return results
+
+    def live_rows(self):
+        """Row numbers currently holding an id"""
+        with self._lock:
+            return np.flatnonzero(self.live)
+
+    def vectors(self, rows):
+        """float32 copies of the (normalised) rows at those row numbers"""
+        return np.asarray(self.matrix[np.asarray(rows, dtype=np.int64)], dtype=np.float32)
+
+    def search(self, vector, top_k=10, min_similarity=None):
+        """[(id, cosine similarity)] of the top_k live rows, best first"""
+        return self.search_many([vector], top_k, min_similarity)[0]
+
+    def __len__(self):
+        return len(self._id_rows)
+
+    def __contains__(self, gallery_id):
+        return gallery_id in self._id_rows
+
+    def stats(self):
+        return {
+            'path': self.path,
+            'model': self.model,
+            'dtype': self.dtype.name,
+            'dim': self.dim,
+            'rows': self.rows,
+            'live_rows': len(self._id_rows),
+            'generation': self.generation,
+            'bytes': os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        }
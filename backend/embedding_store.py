@@ -0,0 +1,199 @@
+"""
+Content-addressed embedding store.
+
+Embeddings are keyed by a SHA-256 of the raw (base64-decoded) image bytes.
+Recently used vectors live in an in-memory LRU; every vector is also written
+to an .npy file on disk so the cache survives restarts. Aligned face crops
+are kept next to them (CropStore) so a model change can re-embed faces
+without detecting them again.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+
+log = logging.getLogger('backend')
+
+
+def write_atomic(path, write):
+    # Write to a temp file and rename so a crash never leaves a
+    # half-written file behind for the next process to load. Failures
+    # are raised; the temp file is removed whatever went wrong.
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class LRUCache:
+    """Thread-safe in-memory LRU map with hit/miss counters"""
+
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key):
+        """Look up key without touching the counters"""
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._items),
+                'capacity': self.capacity,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0
+            }
+
+
+class EmbeddingStore:
+    """LRU embedding cache backed by one .npy file per image on disk"""
+
+    def __init__(self, directory, capacity=1024, namespace='mobilenet_v2'):
+        # Embeddings from different models must never mix, so each model
+        # version gets its own subdirectory.
+        self.directory = os.path.join(directory, namespace)
+        self.capacity = capacity
+        self.namespace = namespace
+        self._memory = LRUCache(capacity)
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.write_errors = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def key(image_data):
+        """Content hash used as the cache key"""
+        return hashlib.sha256(image_data).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.npy')
+
+    def get(self, key):
+        """Return the cached embedding for key, or None"""
+        features = self._memory.peek(key)
+        if features is not None:
+            with self._lock:
+                self.memory_hits += 1
+            return features
+
+        path = self._path(key)
+        try:
+            features = np.load(path, allow_pickle=False)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        self._memory.put(key, features)
+        with self._lock:
+            self.disk_hits += 1
+        return features
+
+    def put(self, key, features, overwrite=False):
+        """Cache an embedding in memory and persist it to disk"""
+        features = np.asarray(features, dtype=np.float32)
+        self._memory.put(key, features)
+
+        path = self._path(key)
+        if os.path.exists(path) and not overwrite:
+            return
+        try:
+            write_atomic(path, lambda f: np.save(f, features, allow_pickle=False))
+        except OSError as e:
+            # Still served from memory; the next process embeds it again
+            with self._lock:
+                self.write_errors += 1
+            log.warning(f"⚠️ Could not persist embedding {key}: {e}")
+
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            total = hits + self.misses
+            return {
+                'namespace': self.namespace,
+                'size': len(self._memory),
+                'capacity': self.capacity,
+                'hits': hits,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round(hits / total, 4) if total else 0.0,
+                'write_errors': self.write_errors
+            }
+
+
+class CropStore:
+    """Aligned face crops as JPEG files, laid out like EmbeddingStore"""
+
+    def __init__(self, directory, namespace='face_crops', quality=95):
+        self.directory = os.path.join(directory, namespace)
+        self.quality = quality
+        self.write_errors = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.jpg')
+
+    def get(self, key):
+        """Return the cached BGR crop for key, or None"""
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        return cv2.imread(path, cv2.IMREAD_COLOR)
+
+    def put(self, key, crop):
+        ok, encoded = cv2.imencode('.jpg', crop, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            return
+        try:
+            write_atomic(self._path(key), lambda f: f.write(encoded.tobytes()))
+        except OSError as e:
+            # The crop is only a shortcut, so it's aligned again next time
+            self.write_errors += 1
+            log.warning(f"⚠️ Could not persist face crop {key}: {e}")
@@ -0,0 +1,92 @@
+"""
+Face crop and alignment ahead of embedding.
+
+Embedding the whole photo lets background, clothing and framing dominate
+the MobileNetV2 vector. For the face path each detected face is warped
+into a model-sized square instead:
+
+    with both eyes   similarity transform that levels the eyes and puts
+                     them at fixed positions, so scale and in-plane
+                     rotation are normalised
+    box only         square crop around the detection box with a margin
+
+Face coordinates are full-resolution pixels (see face_backends.py); the
+image passed in may be a reduced decode, which ``scale`` accounts for.
+"""
+import math
+
+import cv2
+import numpy as np
+
+from face_backends import LEFT_EYE, RIGHT_EYE
+from image_decode import DecodedImages, image_size
+from model_loader import IMAGE_SIZE
+
+
+# Eye centres land at this height and this far apart, as fractions of the
+# crop side; leaves room for forehead, chin and cheeks
+EYE_Y = 0.38
+EYE_DISTANCE = 0.36
+# Box-only crops are padded by this fraction of the box side on each side
+BOX_MARGIN = 0.20
+
+
+def face_key(image_key, backend_name, face_index=0):
+    """Cache key of one detected face; crops depend on the face backend"""
+    return f"{image_key}-{backend_name}-{face_index}"
+
+
+def crop_scale(face, size=IMAGE_SIZE):
+    """Decoded pixels per full-resolution pixel that keep the crop from being upsampled"""
+    x, y, w, h = face.box
+    side = max(w, h) * (1 + 2 * BOX_MARGIN)
+    return min(1.0, size / side) if side > 0 else 1.0
+
+
+def align_face(img, face, scale=1.0, size=IMAGE_SIZE):
+    """Aligned size x size BGR crop of face out of img"""
+    landmarks = face.landmarks
+
+    if LEFT_EYE in landmarks and RIGHT_EYE in landmarks:
+        # Order by x so the transform never flips the face over
+        (lx, ly), (rx, ry) = sorted(
+            (landmarks[t][0] * scale, landmarks[t][1] * scale) for t in (LEFT_EYE, RIGHT_EYE)
+        )
+        eye_distance = math.hypot(rx - lx, ry - ly)
+        if eye_distance > 1:
+            angle = math.degrees(math.atan2(ry - ly, rx - lx))
+            center = ((lx + rx) / 2.0, (ly + ry) / 2.0)
+            matrix = cv2.getRotationMatrix2D(center, angle, EYE_DISTANCE * size / eye_distance)
+            matrix[0, 2] += size * 0.5 - center[0]
+            matrix[1, 2] += size * EYE_Y - center[1]
+            return cv2.warpAffine(img, matrix, (size, size), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+    x, y, w, h = (v * scale for v in face.box)
+    side = max(w, h) * (1 + 2 * BOX_MARGIN)
+    if side < 1:
+        raise ValueError("Face box is empty")
+    factor = size / side
+    matrix = np.float32([
+        [factor, 0, size * 0.5 - (x + w / 2.0) * factor],
+        [0, factor, size * 0.5 - (y + h / 2.0) * factor]
+    ])
+    return cv2.warpAffine(img, matrix, (size, size), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+
+def crop_faces(image_data, faces, min_side=448, decoded=None, key=None):
+    """
+    Align every face from one decode of the image with just enough pixels
+    for full-resolution crops. With the request's DecodedImages (and the
+    image's key in it), the decode the other stages made is reused when it
+    is large enough. Faces are in full-resolution coordinates.
+    """
+    decoded = DecodedImages(min_side) if decoded is None else decoded
+    width, height = image_size(image_data)
+    scale = max(crop_scale(face) for face in faces)
+    img, _ = decoded.get(key, image_data, max(min_side, int(np.ceil(min(width, height) * scale))))
+    return [align_face(img, face, scale=img.shape[1] / width) for face in faces]
+
+
+def crop_face(image_data, face, min_side=448, decoded=None, key=None):
+    """Aligned crop of a single face, see crop_faces()"""
+    return crop_faces(image_data, [face], min_side, decoded, key)[0]
@@ -0,0 +1,244 @@
+"""
+Face detection and landmark backends for the hybrid face path.
+
+Every backend's detect() takes a list of raw images and returns, per
+image, a list of Face tuples (or None if that image failed and should be
+retried), so compare_faces_hybrid() doesn't care which one ran:
+
+    local   OpenCV on CPU, no network. YuNet (cv2.FaceDetectorYN) when
+            its ONNX file is at FACE_DETECTOR_MODEL or models/ (not in
+            the repo: backend_tools.py fetch-face-model downloads it):
+            face box plus eyes, nose tip and mouth corners. Otherwise the
+            Haar cascades that ship with opencv-python 4.x: face box and eyes
+            only, too few points for the landmark score (landmark_score
+            is False), so faces are scored on their crops alone.
+    vision  Google Vision FACE_DETECTION, one batched round trip.
+
+Coordinates are full-resolution pixels of the EXIF-oriented image and
+landmark types use Vision's FaceAnnotation.Landmark.Type numbering, so
+scores from either backend are computed the same way.
+"""
+import os
+import tempfile
+import threading
+import urllib.request
+from collections import namedtuple
+
+import cv2
+
+from image_decode import decode_image, image_size
+from landmarks import MIN_COMMON_LANDMARKS, landmark_vector
+from uploads import as_bytes
+
+
+# box: (x, y, width, height); landmarks: {landmark type: (x, y, z)};
+# points/mask: the same landmarks as a fixed-order array (landmarks.py)
+Face = namedtuple('Face', ['box', 'landmarks', 'confidence', 'points', 'mask'])
+
+# Vision landmark types produced by the local detectors (left/right as
+# seen in the image)
+LEFT_EYE = 1
+RIGHT_EYE = 2
+NOSE_TIP = 8
+MOUTH_LEFT = 11
+MOUTH_RIGHT = 12
+
+def make_face(box, landmarks, confidence):
+    points, mask = landmark_vector(landmarks)
+    return Face(box, landmarks, confidence, points, mask)
+
+
+DEFAULT_YUNET_MODEL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'face_detection_yunet_2023mar.onnx')
+# The service account key app.py's Vision client is created from
+VISION_KEY_FILE = './service-account-key-backup.json'
+YUNET_MODEL_URL = 'https://github.com/opencv/opencv_zoo/raw/main/models/face_detection_yunet/face_detection_yunet_2023mar.onnx'
+FETCH_HINT = 'python backend_tools.py fetch-face-model'
+
+
+def fetch_yunet_model(path=DEFAULT_YUNET_MODEL, url=YUNET_MODEL_URL, timeout=60):
+    """
+    Download YuNet's ONNX file to path. The file only replaces path once
+    cv2.FaceDetectorYN has loaded it, so a truncated download leaves any
+    existing model alone. Returns the number of bytes written.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.onnx')
+    try:
+        with os.fdopen(fd, 'wb') as f, urllib.request.urlopen(url, timeout=timeout) as response:
+            while chunk := response.read(1 << 16):
+                f.write(chunk)
+        cv2.FaceDetectorYN.create(tmp_path, '', (320, 320))
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return size
+
+
+class VisionFaceBackend:
+    name = 'vision'
+    label = 'Google Vision'
+    remote = True
+    landmark_score = True
+
+    def __init__(self, client):
+        from google.cloud import vision
+        self._vision = vision
+        self.client = client
+        # Any object with batch_annotate_images() will do (fake_vision.py)
+        self.label = getattr(client, 'label', self.label)
+
+    def detect(self, images_data):
+        vision = self._vision
+        features = [vision.Feature(type_=vision.Feature.Type.FACE_DETECTION)]
+        requests = [
+            vision.AnnotateImageRequest(image=vision.Image(content=as_bytes(image_data)), features=features)
+            for image_data in images_data
+        ]
+        response = self.client.batch_annotate_images(requests=requests)
+
+        results = []
+        for result in response.responses:
+            if result.error.message:
+                results.append(None)
+                continue
+            results.append([self._face(annotation) for annotation in result.face_annotations])
+        return results
+
+    @staticmethod
+    def _face(annotation):
+        vertices = annotation.bounding_poly.vertices
+        xs = [v.x for v in vertices] or [0]
+        ys = [v.y for v in vertices] or [0]
+        landmarks = {
+            int(landmark.type_): (float(landmark.position.x), float(landmark.position.y), float(landmark.position.z))
+            for landmark in annotation.landmarks
+        }
+        box = (min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys))
+        return make_face(box, landmarks, float(annotation.detection_confidence))
+
+
+class LocalFaceBackend:
+    """
+    CPU face detection on the reduced decode; coordinates are scaled back
+    to full resolution. Detectors keep per-call state, hence the lock.
+    """
+    name = 'local'
+    remote = False
+
+    def __init__(self, model_path=None, min_side=448, score_threshold=0.6):
+        self.min_side = min_side
+        self._lock = threading.Lock()
+        model_path = model_path or DEFAULT_YUNET_MODEL
+
+        if os.path.exists(model_path):
+            self.detector = 'yunet'
+            self.label = 'OpenCV YuNet'
+            self._yunet = cv2.FaceDetectorYN.create(model_path, '', (320, 320), score_threshold, 0.3, 50)
+            landmarks = 5
+        elif hasattr(cv2, 'CascadeClassifier') and hasattr(cv2, 'data'):
+            self.detector = 'haar'
+            self.label = 'OpenCV Haar'
+            self._faces = cv2.CascadeClassifier(os.path.join(cv2.data.haarcascades, 'haarcascade_frontalface_default.xml'))
+            self._eyes = cv2.CascadeClassifier(os.path.join(cv2.data.haarcascades, 'haarcascade_eye.xml'))
+            if self._faces.empty() or self._eyes.empty():
+                raise RuntimeError(
+                    f"No local face detector: YuNet model missing at {model_path} (run '{FETCH_HINT}') "
+                    f"and OpenCV Haar cascades not found"
+                )
+            landmarks = 2
+        else:
+            raise RuntimeError(
+                f"No local face detector: YuNet model missing at {model_path} (run '{FETCH_HINT}') "
+                f"and no Haar cascades (opencv-python 5 dropped them)"
+            )
+        self.landmark_score = landmarks >= MIN_COMMON_LANDMARKS
+
+    def detect(self, images_data):
+        results = []
+        for image_data in images_data:
+            img = decode_image(image_data, self.min_side)
+            width, height = image_size(image_data) or (img.shape[1], img.shape[0])
+            results.append(self.detect_image(img, scale=width / img.shape[1]))
+        return results
+
+    def detect_image(self, img, scale=1.0):
+        """Faces in a decoded BGR image; coordinates multiplied by scale"""
+        with self._lock:
+            faces = self._detect_yunet(img) if self.detector == 'yunet' else self._detect_haar(img)
+
+        faces.sort(key=lambda face: face.box[2] * face.box[3], reverse=True)
+        if scale == 1.0:
+            return faces
+        return [
+            make_face(
+                tuple(v * scale for v in face.box),
+                {t: (x * scale, y * scale, z * scale) for t, (x, y, z) in face.landmarks.items()},
+                face.confidence
+            )
+            for face in faces
+        ]
+
+    def _detect_yunet(self, img):
+        height, width = img.shape[:2]
+        self._yunet.setInputSize((width, height))
+        _, detections = self._yunet.detect(img)
+
+        faces = []
+        for row in detections if detections is not None else []:
+            x, y, w, h = (float(v) for v in row[:4])
+            points = row[4:14].reshape(5, 2)
+            # YuNet order: right eye, left eye (the subject's), nose tip,
+            # right and left mouth corner
+            types = (LEFT_EYE, RIGHT_EYE, NOSE_TIP, MOUTH_LEFT, MOUTH_RIGHT)
+            landmarks = {t: (float(px), float(py), 0.0) for t, (px, py) in zip(types, points)}
+            faces.append(make_face((x, y, w, h), landmarks, float(row[14])))
+        return faces
+
+    def _detect_haar(self, img):
+        gray = cv2.equalizeHist(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY))
+        min_size = max(24, min(gray.shape) // 10)
+        boxes = self._faces.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(min_size, min_size))
+
+        faces = []
+        for x, y, w, h in boxes:
+            landmarks = {}
+            # Eyes are searched in the upper half of the face box only
+            upper = gray[y:y + h // 2, x:x + w]
+            eyes = self._eyes.detectMultiScale(upper, scaleFactor=1.1, minNeighbors=5, minSize=(w // 8, w // 8))
+            if len(eyes) >= 2:
+                eyes = sorted(eyes, key=lambda e: e[2] * e[3], reverse=True)[:2]
+                centers = sorted((x + ex + ew / 2.0, y + ey + eh / 2.0) for ex, ey, ew, eh in eyes)
+                landmarks[LEFT_EYE] = (float(centers[0][0]), float(centers[0][1]), 0.0)
+                landmarks[RIGHT_EYE] = (float(centers[1][0]), float(centers[1][1]), 0.0)
+            # Haar gives no confidence score
+            faces.append(make_face((float(x), float(y), float(w), float(h)), landmarks, 1.0))
+        return faces
+
+
+FACE_BACKENDS = {
+    'local': LocalFaceBackend,
+    'vision': VisionFaceBackend
+}
+
+
+def create_face_backend(name='local', vision_client=None, model_path=None, min_side=448):
+    if name not in FACE_BACKENDS:
+        raise ValueError(f"Unknown face backend '{name}' (choose from {', '.join(FACE_BACKENDS)})")
+    if name == 'vision':
+        if vision_client is None:
+            raise ValueError("The vision face backend needs Google Vision credentials")
+        return VisionFaceBackend(vision_client)
+    return LocalFaceBackend(model_path, min_side=min_side)
+
+
+def face_backend_order(setting='auto'):
+    """
+    The backends FACE_BACKEND=setting tries, in order: auto prefers Vision,
+    and a named backend falls back to the other one
+    """
+    if setting == 'auto':
+        return ('vision', 'local')
+    return (setting, 'vision' if setting == 'local' else 'local')
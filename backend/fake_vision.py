@@ -0,0 +1,183 @@
+"""
+Offline stand-in for google.cloud.vision.ImageAnnotatorClient.
+
+Everything that talks to Vision (VisionFaceBackend, /detect) only calls
+``client.batch_annotate_images(requests=[AnnotateImageRequest])`` and
+reads the returned BatchAnnotateImagesResponse, so any object with that
+method can be the annotator. FakeVisionClient answers with real Vision
+message types, without a network or a service-account key:
+
+    canned     responses_path: JSON {sha256 of image bytes: the
+               AnnotateImageResponse as Vision JSON}, e.g. recorded with
+               record_responses() from a real client
+    synthetic  everything else: one face centred in the image, with a
+               box, all the main landmarks and a confidence, jittered by
+               the image's content hash, plus a few labels
+
+Answers depend only on the image bytes, so repeated runs see the same
+faces and scores. Each call sleeps latency_ms +/- jitter_ms plus
+per_image_ms per image. It raises ServiceUnavailable with probability
+error_rate, and marks single images as failed with probability
+image_error_rate, the two failure modes the real client has. Latency and
+errors are drawn from one seeded generator.
+
+Select it with VISION_CLIENT=fake (see app.py for the FAKE_VISION_*
+settings).
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+
+from google.api_core import exceptions
+from google.cloud import vision
+
+from image_decode import image_size
+
+
+# (x, y) of each landmark type as fractions of the face box
+LANDMARK_TEMPLATE = {
+    1: (0.32, 0.38),   # LEFT_EYE
+    2: (0.68, 0.38),   # RIGHT_EYE
+    3: (0.18, 0.30),   # LEFT_OF_LEFT_EYEBROW
+    4: (0.42, 0.29),   # RIGHT_OF_LEFT_EYEBROW
+    5: (0.58, 0.29),   # LEFT_OF_RIGHT_EYEBROW
+    6: (0.82, 0.30),   # RIGHT_OF_RIGHT_EYEBROW
+    7: (0.50, 0.37),   # MIDPOINT_BETWEEN_EYES
+    8: (0.50, 0.58),   # NOSE_TIP
+    9: (0.50, 0.72),   # UPPER_LIP
+    10: (0.50, 0.80),  # LOWER_LIP
+    11: (0.36, 0.76),  # MOUTH_LEFT
+    12: (0.64, 0.76),  # MOUTH_RIGHT
+    13: (0.50, 0.76),  # MOUTH_CENTER
+    14: (0.58, 0.63),  # NOSE_BOTTOM_RIGHT
+    15: (0.42, 0.63),  # NOSE_BOTTOM_LEFT
+    16: (0.50, 0.64),  # NOSE_BOTTOM_CENTER
+    33: (0.50, 0.22),  # FOREHEAD_GLABELLA
+    34: (0.50, 0.97),  # CHIN_GNATHION
+    35: (0.10, 0.75),  # CHIN_LEFT_GONION
+    36: (0.90, 0.75)   # CHIN_RIGHT_GONION
+}
+LABELS = ['Person', 'Face', 'Dog', 'Cat', 'Pet', 'Car', 'Vehicle', 'Bag', 'Bicycle', 'Phone']
+# Landmarks move by up to this fraction of the face box between images
+LANDMARK_JITTER = 0.04
+
+
+def content_hash(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def record_responses(client, images_data, path):
+    """Annotate images with a real client and save them as canned responses"""
+    features = [
+        vision.Feature(type_=vision.Feature.Type.FACE_DETECTION),
+        vision.Feature(type_=vision.Feature.Type.LABEL_DETECTION)
+    ]
+    requests = [
+        vision.AnnotateImageRequest(image=vision.Image(content=data), features=features)
+        for data in images_data
+    ]
+    response = client.batch_annotate_images(requests=requests)
+    canned = {
+        content_hash(data): json.loads(vision.AnnotateImageResponse.to_json(result))
+        for data, result in zip(images_data, response.responses)
+    }
+    with open(path, 'w') as f:
+        json.dump(canned, f)
+    return len(canned)
+
+
+class FakeVisionClient:
+    label = 'Fake Vision'
+
+    def __init__(self, latency_ms=300, jitter_ms=50, per_image_ms=20, error_rate=0.0,
+                 image_error_rate=0.0, face_rate=1.0, responses_path=None, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.per_image_ms = per_image_ms
+        self.error_rate = error_rate
+        self.image_error_rate = image_error_rate
+        self.face_rate = face_rate
+        self.canned = {}
+        if responses_path:
+            with open(responses_path) as f:
+                self.canned = {
+                    key: vision.AnnotateImageResponse.from_json(json.dumps(value))
+                    for key, value in json.load(f).items()
+                }
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.images = 0
+        self.errors = 0
+
+    def batch_annotate_images(self, requests, **kwargs):
+        with self._lock:
+            self.calls += 1
+            self.images += len(requests)
+            delay = self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms)
+            delay += self.per_image_ms * len(requests)
+            fail = self._random.random() < self.error_rate
+            failed_images = [self._random.random() < self.image_error_rate for _ in requests]
+            if fail:
+                self.errors += 1
+
+        time.sleep(max(0.0, delay) / 1000.0)
+        if fail:
+            raise exceptions.ServiceUnavailable("Injected Vision failure")
+
+        responses = []
+        for request, image_failed in zip(requests, failed_images):
+            if image_failed:
+                responses.append(vision.AnnotateImageResponse(
+                    error={'code': 14, 'message': 'Injected image failure'}
+                ))
+            else:
+                responses.append(self.annotate(request))
+        return vision.BatchAnnotateImagesResponse(responses=responses)
+
+    def annotate(self, request):
+        content = request.image.content
+        key = content_hash(content)
+        if key in self.canned:
+            return self.canned[key]
+
+        wanted = {feature.type_ for feature in request.features}
+        rng = random.Random(key)
+        result = vision.AnnotateImageResponse()
+        size = image_size(content)
+        if vision.Feature.Type.FACE_DETECTION in wanted and size and rng.random() < self.face_rate:
+            result.face_annotations.append(self._face(rng, *size))
+        if vision.Feature.Type.LABEL_DETECTION in wanted:
+            for name in rng.sample(LABELS, 3):
+                result.label_annotations.append(
+                    vision.EntityAnnotation(description=name, score=round(rng.uniform(0.6, 0.99), 3))
+                )
+        return result
+
+    @staticmethod
+    def _face(rng, width, height):
+        side = min(width, height) * rng.uniform(0.35, 0.6)
+        x = (width - side) / 2 + rng.uniform(-0.1, 0.1) * side
+        y = (height - side) / 2 + rng.uniform(-0.1, 0.1) * side
+        vertices = [(x, y), (x + side, y), (x + side, y + side), (x, y + side)]
+        landmarks = [
+            vision.FaceAnnotation.Landmark(
+                type_=lm_type,
+                position=vision.Position(
+                    x=x + (fx + rng.uniform(-LANDMARK_JITTER, LANDMARK_JITTER)) * side,
+                    y=y + (fy + rng.uniform(-LANDMARK_JITTER, LANDMARK_JITTER)) * side,
+                    z=rng.uniform(-0.05, 0.05) * side
+                )
+            )
+            for lm_type, (fx, fy) in LANDMARK_TEMPLATE.items()
+        ]
+        return vision.FaceAnnotation(
+            bounding_poly=vision.BoundingPoly(vertices=[vision.Vertex(x=int(vx), y=int(vy)) for vx, vy in vertices]),
+            landmarks=landmarks,
+            detection_confidence=round(rng.uniform(0.85, 0.99), 3)
+        )
+
+    def stats(self):
+        return {'calls': self.calls, 'images': self.images, 'injected_errors': self.errors}
@@ -0,0 +1,88 @@
+"""
+Enrolled report photos.
+
+A report photo is enrolled once (POST /enroll): its whole-frame and face
+embeddings go to the embedding stores as usual, and this gallery keeps
+what /compare would otherwise recompute from the upload: the content hash
+the embeddings are keyed by, the full-resolution size and the detected
+faces with their landmarks. /compare can then take ``image1_id`` instead
+of the photo itself.
+
+Each entry is a small JSON file, so an enrollment made by one gunicorn
+worker is visible to the others straight away.
+"""
+import glob
+import hashlib
+import json
+import os
+
+from embedding_store import write_atomic
+from face_backends import make_face
+
+
+class StaleEnrollment(Exception):
+    """The enrolled photo's embeddings are gone (e.g. the model changed)"""
+    pass
+
+
+def faces_to_json(faces):
+    return [
+        {
+            'box': [float(v) for v in face.box],
+            'confidence': float(face.confidence),
+            'landmarks': {str(t): [float(v) for v in position] for t, position in face.landmarks.items()}
+        }
+        for face in faces
+    ]
+
+
+def faces_from_json(faces):
+    return [
+        make_face(
+            tuple(face['box']),
+            {int(t): tuple(position) for t, position in face['landmarks'].items()},
+            face['confidence']
+        )
+        for face in faces
+    ]
+
+
+class Gallery:
+    """Gallery entries stored as one JSON file per id"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, gallery_id):
+        # Ids come from clients, so they never become file names directly
+        name = hashlib.sha256(gallery_id.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, name[:2], name + '.json')
+
+    def get(self, gallery_id):
+        """The entry for gallery_id, or None"""
+        try:
+            with open(self._path(gallery_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, entry):
+        data = json.dumps(entry).encode('utf-8')
+        write_atomic(self._path(entry['id']), lambda f: f.write(data))
+
+    def entries(self):
+        """Every entry, in no particular order"""
+        for path in glob.iglob(os.path.join(self.directory, '*', '*.json')):
+            try:
+                with open(path) as f:
+                    yield json.load(f)
+            except (OSError, ValueError):
+                continue
+
+    def remove(self, gallery_id):
+        try:
+            os.remove(self._path(gallery_id))
+            return True
+        except OSError:
+            return False
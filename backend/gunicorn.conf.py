@@ -0,0 +1,50 @@
+"""
+Production server settings.
+
+    cd backend && gunicorn -c gunicorn.conf.py
+
+The master imports app.py (OpenCV, NumPy and the caches) once, then
+forks workers that share those pages copy-on-write. TensorFlow is kept
+out of the master altogether: importing it starts thread pools that a
+forked child doesn't get, and it hangs on the first predict in a child
+forked after a model was built in the parent. Each worker imports it
+when it builds its own MobileNetV2 and Vision client in
+post_worker_init. With MODEL_LOADING=background (the default) workers
+accept connections while the model loads and answer model-backed
+endpoints with 503 until it's warmed up.
+"""
+import os
+
+
+wsgi_app = 'app:create_app()'
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+preload_app = True
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+# Room for the app's admission limits (see app.py): ADMISSION_MAX_CONCURRENT
+# comparisons running, ADMISSION_MAX_QUEUE waiting (before reading their
+# bodies) and two threads for /health and /metrics. Requests past that
+# get a quick 429 from the app instead of sitting unread in the worker.
+threads = int(os.environ.get('THREADS', str(
+    int(os.environ.get('ADMISSION_MAX_CONCURRENT', '4')) + int(os.environ.get('ADMISSION_MAX_QUEUE', '8')) + 2
+)))
+
+# First requests can be slow while a worker builds its model
+timeout = int(os.environ.get('WORKER_TIMEOUT', '120'))
+graceful_timeout = int(os.environ.get('GRACEFUL_TIMEOUT', '30'))
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info')
+
+
+def post_worker_init(worker):
+    import app
+    app.init_worker()
+
+
+def worker_exit(server, worker):
+    import app
+    app.shutdown_worker()
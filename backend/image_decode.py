@@ -0,0 +1,154 @@
+"""
+Downscale-on-decode for uploaded photos.
+
+Phone photos arrive at 12MP+ but the model only ever sees 224x224, so
+decoding them at native resolution wastes ~36MB of BGR pixels per image.
+JPEGs are decoded with libjpeg's DCT scaling (cv2.IMREAD_REDUCED_*) at
+the largest 1/2, 1/4 or 1/8 reduction that still leaves the short side
+at least ``min_side`` pixels; other formats decode normally.
+
+EXIF orientation is applied exactly once: cv2.imdecode rotates the
+pixels itself, the PIL fallback uses exif_transpose, and image_size()
+reports the oriented size, which is what landmark coordinates are
+normalised against.
+
+DecodedImages holds one request's decodes, so perceptual hashing, face
+detection, face cropping and embedding all work from a single decode of
+each upload instead of decoding it once per stage.
+"""
+import io
+import threading
+import time
+
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+
+
+REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2)
+)
+
+# EXIF orientations that swap width and height
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+def read_header(image_data):
+    """(width, height, format, exif_orientation) without decoding pixels, or None"""
+    try:
+        with Image.open(io.BytesIO(image_data)) as img:
+            return img.width, img.height, img.format, img.getexif().get(0x0112, 1)
+    except Exception:
+        return None
+
+
+def image_size(image_data):
+    """Full-resolution (width, height) after EXIF orientation, or None if unreadable"""
+    header = read_header(image_data)
+    if header is None:
+        return None
+    width, height, _, orientation = header
+    if orientation in TRANSPOSED_ORIENTATIONS:
+        return height, width
+    return width, height
+
+
+def reduction_factor(width, height, min_side):
+    for factor, flag in REDUCED_FLAGS:
+        if min(width, height) // factor >= min_side:
+            return factor, flag
+    return 1, cv2.IMREAD_COLOR
+
+
+def decode_image(image_data, min_side=448, stats=None):
+    """
+    Decode raw image bytes to a BGR array, reduced on decode where possible.
+    If a stats dict is passed, the decode is counted and timed there, and
+    its peaks are raised to this image's buffer size (peak_decoded_bytes)
+    and full-resolution size (peak_full_res_bytes) if larger.
+    """
+    start = time.perf_counter()
+    header = read_header(image_data)
+    factor, flag = 1, cv2.IMREAD_COLOR
+    if header is not None and header[2] == 'JPEG' and min_side:
+        factor, flag = reduction_factor(header[0], header[1], min_side)
+
+    nparr = np.frombuffer(image_data, np.uint8)
+    img = cv2.imdecode(nparr, flag)
+
+    if img is None:
+        pil_img = Image.open(io.BytesIO(image_data))
+        if min_side and pil_img.format == 'JPEG':
+            # draft() picks the JPEG DCT scale, the PIL equivalent of IMREAD_REDUCED
+            pil_img.draft('RGB', (min_side, min_side))
+        pil_img = ImageOps.exif_transpose(pil_img).convert('RGB')
+        img = cv2.cvtColor(np.array(pil_img), cv2.COLOR_RGB2BGR)
+
+    if stats is not None:
+        if header is not None:
+            full_pixels = header[0] * header[1]
+        else:
+            full_pixels = img.shape[0] * img.shape[1] * factor * factor
+        stats['images'] = stats.get('images', 0) + 1
+        stats['peak_full_res_bytes'] = max(stats.get('peak_full_res_bytes', 0), full_pixels * 3)
+        stats['peak_decoded_bytes'] = max(stats.get('peak_decoded_bytes', 0), img.nbytes)
+        stats['seconds'] = stats.get('seconds', 0.0) + time.perf_counter() - start
+
+    return img
+
+
+class DecodedImages:
+    """
+    The decodes of one request, keyed by image content key. Each image is
+    decoded once at min_side and shared by every stage; a caller that
+    needs more pixels (a full-resolution crop of a small face) decodes it
+    again larger, and the larger decode replaces the first. Stages may run
+    on different threads: an image is decoded under its own lock.
+
+    stats collects decode_image()'s counts and peaks for the request, and
+    on_decode(seconds) is called after every decode.
+    """
+
+    def __init__(self, min_side=448, on_decode=None):
+        self.min_side = min_side
+        self.on_decode = on_decode
+        self.stats = {}
+        self._images = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, image_data, min_side=None):
+        """
+        (BGR array, full-resolution (width, height)) of image_data, with at
+        least min_side pixels on the short side unless it is smaller
+        """
+        min_side = self.min_side if min_side is None else min_side
+        with self._lock:
+            image_lock = self._locks.setdefault(key, threading.Lock())
+        with image_lock:
+            entry = self._images.get(key)
+            if entry is not None and self._covers(entry, min_side):
+                return entry
+            stats = {}
+            img = decode_image(image_data, min_side=min_side, stats=stats)
+            size = image_size(image_data) or (img.shape[1], img.shape[0])
+            self._images[key] = entry = (img, size)
+        self._record(stats)
+        return entry
+
+    @staticmethod
+    def _covers(entry, min_side):
+        img, (width, _) = entry
+        # Already the full-resolution image, or enough pixels (min_side 0 asks for full resolution)
+        return img.shape[1] >= width or bool(min_side) and min(img.shape[:2]) >= min_side
+
+    def _record(self, stats):
+        with self._lock:
+            self.stats['images'] = self.stats.get('images', 0) + stats['images']
+            self.stats['seconds'] = self.stats.get('seconds', 0.0) + stats['seconds']
+            for name in ('peak_full_res_bytes', 'peak_decoded_bytes'):
+                self.stats[name] = max(self.stats.get(name, 0), stats[name])
+        if self.on_decode is not None:
+            self.on_decode(stats['seconds'])
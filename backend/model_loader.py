@@ -0,0 +1,133 @@
+"""
+MobileNetV2 loading with readiness tracking.
+
+TensorFlow is only imported when the model is actually built, so the
+server can bind its port straight away and load the model in the
+background. Once built, the model runs a warm-up inference for each
+expected batch size so the first real request doesn't pay for graph
+tracing.
+"""
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+IMAGE_SIZE = 224
+
+
+class ModelNotReady(Exception):
+    pass
+
+
+def preprocess_input(batch):
+    """MobileNetV2 input scaling ([0, 255] -> [-1, 1]) without importing TensorFlow"""
+    return batch.astype(np.float32) / 127.5 - 1.0
+
+
+def prepare_image(img_array):
+    """Resize and colour-convert a BGR image to a 224x224 RGB model input"""
+    img_resized = cv2.resize(img_array, (IMAGE_SIZE, IMAGE_SIZE))
+    return cv2.cvtColor(img_resized, cv2.COLOR_BGR2RGB)
+
+
+class SavedModelExtractor:
+    """predict()-compatible wrapper around a SavedModel serving signature"""
+
+    def __init__(self, path):
+        import tensorflow as tf
+
+        self._tf = tf
+        self._fn = tf.saved_model.load(path).signatures['serving_default']
+        self._input_name = next(iter(self._fn.structured_input_signature[1]))
+
+    def predict(self, batch, verbose=0):
+        outputs = self._fn(**{self._input_name: self._tf.constant(batch, dtype=self._tf.float32)})
+        return next(iter(outputs.values())).numpy()
+
+
+def build_mobilenet(model_path=None):
+    """
+    Build the feature extractor.
+    model_path can point to a SavedModel directory or a .keras/.h5 file on
+    local disk; otherwise the ImageNet weights are resolved through Keras.
+    """
+    if model_path:
+        if os.path.isdir(model_path):
+            return SavedModelExtractor(model_path)
+        from tensorflow import keras
+        return keras.models.load_model(model_path, compile=False)
+
+    from tensorflow.keras.applications import MobileNetV2
+    return MobileNetV2(weights='imagenet', include_top=False, pooling='avg')
+
+
+def export_model(path):
+    """Serialize the ImageNet feature extractor as a SavedModel for MODEL_PATH"""
+    build_mobilenet().export(path)
+
+
+class ModelLoader:
+    """Loads a model once per process and reports loading/ready state"""
+
+    def __init__(self, build, warmup_batch_sizes=(1, 2)):
+        self._build = build
+        self.warmup_batch_sizes = warmup_batch_sizes
+        self.model = None
+        self.state = 'not_loaded'
+        self.error = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self._started = False
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self.state == 'ready'
+
+    def load(self):
+        """Build and warm up the model in the calling thread (idempotent)"""
+        with self._lock:
+            if self._done.is_set():
+                return self.model
+            self._started = True
+            self.state = 'loading'
+            try:
+                start = time.perf_counter()
+                model = self._build()
+                self.load_seconds = round(time.perf_counter() - start, 2)
+
+                start = time.perf_counter()
+                for batch_size in self.warmup_batch_sizes:
+                    warmup = np.zeros((batch_size, IMAGE_SIZE, IMAGE_SIZE, 3), dtype=np.float32)
+                    model.predict(warmup, verbose=0)
+                self.warmup_seconds = round(time.perf_counter() - start, 2)
+
+                self.model = model
+                self.state = 'ready'
+            except Exception as e:
+                self.state = 'failed'
+                self.error = str(e)
+            finally:
+                self._done.set()
+            return self.model
+
+    def get(self, timeout=None):
+        """Return the model, loading it in this thread if nobody started it"""
+        if not self._started:
+            self.load()
+        self._done.wait(timeout)
+        if self.state != 'ready':
+            raise ModelNotReady(f"Model {self.state}")
+        return self.model
+
+    def status(self):
+        return {
+            'state': self.state,
+            'load_seconds': self.load_seconds,
+            'warmup_seconds': self.warmup_seconds,
+            'error': self.error
+        }
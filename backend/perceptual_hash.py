@@ -0,0 +1,147 @@
+"""
+Perceptual hashes for spotting near-identical pictures cheaply.
+
+dHash shrinks a greyscale image to (size + 1) x size pixels and records,
+row by row, whether each pixel is brighter than its right-hand
+neighbour: size * size bits that survive re-encoding, rescaling and small
+brightness changes, but flip as soon as the content moves. Two hashes
+are compared by the number of differing bits (Hamming distance). For the
+default 64-bit hash a re-encoded copy stays within a few bits, but so do
+unrelated photos with a similar layout, so a small distance only hints
+at a duplicate.
+
+HashIndex finds every stored hash within a few bits of a query without
+comparing against all of them (multi-index hashing, below), and can
+share its contents between processes through an append-only log.
+"""
+import fcntl
+import json
+import os
+import threading
+
+import cv2
+import numpy as np
+
+
+HASH_SIZE = 8
+HASH_BITS = HASH_SIZE * HASH_SIZE
+
+
+def dhash(img, size=HASH_SIZE):
+    """64-bit (for size 8) difference hash of a BGR or greyscale array, as an int"""
+    if img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(img, (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+def to_hex(value):
+    return f'{value:0{HASH_BITS // 4}x}'
+
+
+class HashIndex:
+    """
+    id -> hash, queried by Hamming distance.
+
+    A hash is cut into max_distance + 1 bands, each with its own
+    {band value: ids} table. Two hashes at most max_distance bits apart
+    must agree exactly on at least one band, so a query only looks at the
+    ids sharing a band with it: a handful of dict lookups instead of a
+    scan of every hash. Wider queries fall back to the scan.
+
+    With a path, every change is appended to a JSON-lines log ([id, hex
+    hash] or [id, null]) under an flock, and refresh() replays lines
+    written by other processes, like EmbeddingMatrix's ID table.
+    """
+
+    def __init__(self, path=None, max_distance=6):
+        self.path = path
+        self.max_distance = max_distance
+        bands = max_distance + 1
+        edges = [round(i * HASH_BITS / bands) for i in range(bands + 1)]
+        self._bands = [(start, (1 << (end - start)) - 1) for start, end in zip(edges, edges[1:])]
+        self._tables = [{} for _ in self._bands]
+        self.hashes = {}
+        self._offset = 0
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def _band_values(self, value):
+        return [(value >> shift) & mask for shift, mask in self._bands]
+
+    def _set(self, key, value):
+        self._discard(key)
+        if value is None:
+            return
+        self.hashes[key] = value
+        for table, band in zip(self._tables, self._band_values(value)):
+            table.setdefault(band, set()).add(key)
+
+    def _discard(self, key):
+        old = self.hashes.pop(key, None)
+        if old is None:
+            return
+        for table, band in zip(self._tables, self._band_values(old)):
+            keys = table.get(band)
+            keys.discard(key)
+            if not keys:
+                del table[band]
+
+    def refresh(self):
+        """Apply log lines written by any process since the last call"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        with self._lock:
+            if os.path.getsize(self.path) == self._offset:
+                return
+            with open(self.path, 'rb') as f:
+                f.seek(self._offset)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+                    self._offset += len(line)
+                    key, value = json.loads(line)
+                    self._set(key, None if value is None else int(value, 16))
+
+    def _write(self, key, value):
+        if not self.path:
+            with self._lock:
+                self._set(key, value)
+            return
+        line = json.dumps([key, None if value is None else to_hex(value)]).encode('utf-8') + b'\n'
+        with open(self.path, 'ab') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.write(line)
+        self.refresh()
+
+    def add(self, key, value):
+        self._write(str(key), value)
+
+    def remove(self, key):
+        self.refresh()
+        if key not in self.hashes:
+            return False
+        self._write(key, None)
+        return True
+
+    def query(self, value, max_distance=None):
+        """[(id, distance)] of the hashes within max_distance bits of value, closest first"""
+        self.refresh()
+        max_distance = self.max_distance if max_distance is None else max_distance
+        with self._lock:
+            if max_distance > self.max_distance:
+                candidates = list(self.hashes)
+            else:
+                candidates = set()
+                for table, band in zip(self._tables, self._band_values(value)):
+                    candidates.update(table.get(band, ()))
+            hits = [(key, hamming_distance(value, self.hashes[key])) for key in candidates]
+        return sorted((hit for hit in hits if hit[1] <= max_distance), key=lambda hit: (hit[1], hit[0]))
+
+    def __len__(self):
+        return len(self.hashes)
@@ -0,0 +1,378 @@
+"""
+Re-embed the whole report photo archive offline.
+
+After a model or preprocessing change every stored photo needs a new
+embedding. This job streams images from a directory (recursively) or a
+manifest file (one path per line, relative to the manifest), shards them
+across a process pool and writes the results to the same embedding store
+the API reads, under the namespace of the configured backend:
+
+    python reindex.py --images /data/report_photos --workers 4
+    EMBEDDING_BACKEND=tflite MODEL_PATH=mobilenet_v2_int8.tflite \\
+        python reindex.py --manifest photos.txt --faces
+
+Each worker builds its own model and runs large batches. Finished paths
+are appended to a per-worker checkpoint file after every batch, so an
+interrupted run picks up where it left off when started again with the
+same --checkpoint-dir (any worker count). Photos already in the store
+(with --faces: whose face embedding is too) are skipped unless --force
+is given; a photo missing only its face embedding just gets that.
+
+--faces also detects the largest face and refreshes its aligned crop and
+face embedding, like /compare's face path. It uses the face backend the
+API would pick from the same FACE_BACKEND and FACE_DETECTOR_MODEL, and
+refuses to run when that is Google Vision, since only local detection
+is reindexed. --gallery then puts
+every enrolled photo and /search/index report whose embedding is in the
+store into the namespace's memory-mapped gallery matrix, and every
+enrolled face into its face gallery matrix (see embedding_matrix.py).
+With --force their rows are replaced by the fresh embeddings. Both
+matrices are then compacted, dropping the rows of replaced and removed
+photos.
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from embedding_backends import create_backend, embedding_namespace
+from embedding_matrix import EmbeddingMatrix
+from embedding_store import CropStore, EmbeddingStore
+from face_align import crop_face, face_key
+from face_backends import VISION_KEY_FILE, create_face_backend, face_backend_order
+from gallery import Gallery
+from image_decode import DecodedImages
+from model_loader import prepare_image, preprocess_input
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.heic')
+# Gallery matrix rows appended per locked write
+GALLERY_APPEND_BATCH = 1024
+
+
+def iter_paths(images=None, manifest=None):
+    """Image paths in a stable order, streamed"""
+    if manifest:
+        base = os.path.dirname(os.path.abspath(manifest))
+        with open(manifest) as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    yield os.path.join(base, line)
+        return
+
+    for root, dirs, files in os.walk(images):
+        dirs.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                yield os.path.join(root, name)
+
+
+def load_checkpoint(checkpoint_dir):
+    """Every path any worker of any previous run has finished"""
+    done = set()
+    for path in glob.glob(os.path.join(checkpoint_dir, '*.done')):
+        with open(path) as f:
+            done.update(line.rstrip('\n') for line in f)
+    return done
+
+
+def init_worker(threads):
+    # Set before the backend imports TensorFlow / ONNX Runtime so the
+    # workers don't oversubscribe the CPU between them
+    os.environ['TF_NUM_INTRAOP_THREADS'] = str(threads)
+    os.environ['TF_NUM_INTEROP_THREADS'] = '1'
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+
+
+def server_face_backend(setting, model_path=None, min_side=448):
+    """
+    The face backend the API picks for FACE_BACKEND=setting, built here so
+    face embeddings land under the key the API reads. Only a local backend
+    can be reindexed: raises ValueError when the API would use Google Vision
+    (or has no face backend at all).
+    """
+    vision_available = os.environ.get('VISION_CLIENT', 'google') == 'fake' or os.path.exists(VISION_KEY_FILE)
+    errors = {}
+    for name in face_backend_order(setting):
+        if name == 'vision':
+            if vision_available:
+                fallback = f" ({'; '.join(f'{n}: {e}' for n, e in errors.items())})" if errors else ''
+                raise ValueError(
+                    f"The API uses Google Vision for faces (FACE_BACKEND={setting}){fallback}, so --faces would "
+                    f"write embeddings it never reads; set FACE_BACKEND=local for both, or drop --faces"
+                )
+            errors[name] = 'no Google Vision credentials'
+            continue
+        try:
+            return create_face_backend(name, None, model_path, min_side=min_side)
+        except Exception as e:
+            errors[name] = str(e)
+    raise ValueError(f"The API has no face backend to reindex for: {errors}")
+
+
+def embed_faces(face_backend, data, decoded, key):
+    """(face cache key, aligned crop) for the largest face, or None; reuses the photo's decode"""
+    img, (width, _) = decoded.get(key, data)
+    faces = face_backend.detect_image(img, scale=width / img.shape[1])
+    if not faces:
+        return None
+    return face_key(key, face_backend.name), crop_face(data, faces[0], decoded.min_side, decoded, key)
+
+
+def gallery_photos(cache_dir):
+    """
+    (id, image_id, face cache key or None) of every enrolled photo and
+    /search/index report; an id in both is its enrolled photo
+    """
+    enrolled = set()
+    for entry in Gallery(os.path.join(cache_dir, 'gallery')).entries():
+        enrolled.add(entry['id'])
+        has_face = entry.get('faces') and entry.get('face_backend')
+        yield entry['id'], entry['image_id'], face_key(entry['image_id'], entry['face_backend']) if has_face else None
+    for entry in Gallery(os.path.join(cache_dir, 'search_reports')).entries():
+        if entry['id'] not in enrolled:
+            yield entry['id'], entry['image_id'], None
+
+
+def fill_matrix(matrix, photos, store, refresh):
+    """
+    Append the stored embedding of every (id, key) in photos; ids already
+    in the matrix are skipped unless refresh, which appends their current
+    embedding (the old row dies). Then drop the dead rows.
+    """
+    stats = {'added': 0, 'missing_embeddings': 0}
+    ids, vectors = [], []
+    for photo_id, key in photos:
+        if photo_id in matrix and not refresh:
+            continue
+        features = store.get(key)
+        if features is None:
+            stats['missing_embeddings'] += 1
+            continue
+        ids.append(photo_id)
+        vectors.append(features)
+        if len(ids) >= GALLERY_APPEND_BATCH:
+            matrix.append(ids, vectors)
+            stats['added'] += len(ids)
+            ids, vectors = [], []
+    if ids:
+        matrix.append(ids, vectors)
+        stats['added'] += len(ids)
+    stats['dead_rows_dropped'] = matrix.compact()
+    stats['rows'] = matrix.rows
+    return stats
+
+
+def build_gallery_matrix(cache_dir, namespace, dtype, refresh=False):
+    """Rebuild the namespace's gallery and face gallery matrices from the gallery and report registries"""
+    gallery_dir = os.path.join(cache_dir, 'gallery')
+    photos = list(gallery_photos(cache_dir))
+    report = {}
+    for name, suffix, keys in (
+        ('gallery_matrix', '', [(photo_id, image_id) for photo_id, image_id, _ in photos]),
+        ('gallery_face_matrix', '-face', [(photo_id, key) for photo_id, _, key in photos if key is not None])
+    ):
+        matrix = EmbeddingMatrix(
+            os.path.join(gallery_dir, namespace + suffix + '.emb'), model=namespace + suffix, dtype=dtype
+        )
+        store = EmbeddingStore(cache_dir, namespace=namespace + suffix)
+        report[name] = fill_matrix(matrix, keys, store, refresh)
+    return report
+
+
+def run_shard(shard, options):
+    """Embed every image of one shard; returns this worker's stats"""
+    workers = options['workers']
+    force = options['force']
+    store = EmbeddingStore(options['cache_dir'], capacity=options['batch_size'], namespace=options['namespace'])
+    face_store = crop_store = face_backend = None
+    if options['faces']:
+        face_backend = server_face_backend(options['face_backend'], options['face_model'], options['min_side'])
+        face_store = EmbeddingStore(
+            options['cache_dir'], capacity=options['batch_size'], namespace=options['namespace'] + '-face'
+        )
+        crop_store = CropStore(options['cache_dir'])
+
+    done = load_checkpoint(options['checkpoint_dir'])
+    checkpoint = open(os.path.join(options['checkpoint_dir'], f'worker-{shard}-of-{workers}.done'), 'a')
+
+    load_start = time.perf_counter()
+    model = create_backend(options['backend'], options['model_path'])
+    stats = {
+        'worker': shard,
+        'pid': os.getpid(),
+        'model_load_seconds': round(time.perf_counter() - load_start, 2),
+        'embedded': 0,
+        'faces': 0,
+        'skipped': 0,
+        'failed': 0
+    }
+
+    def flush(batch):
+        # Whole frames and face crops share one forward pass; img is None
+        # for photos that only needed their face refreshed
+        frame_keys = [key for _, key, img, _ in batch if img is not None]
+        inputs = [prepare_image(img) for _, _, img, _ in batch if img is not None]
+        face_keys = []
+        for path, _, _, face in batch:
+            if face is not None:
+                key, crop = face
+                crop_store.put(key, crop)
+                face_keys.append(key)
+                inputs.append(prepare_image(crop))
+
+        if inputs:
+            features = model.predict(preprocess_input(np.stack(inputs)), verbose=0).reshape(len(inputs), -1)
+            for key, f in zip(frame_keys, features):
+                store.put(key, f, overwrite=force)
+            for key, f in zip(face_keys, features[len(frame_keys):]):
+                face_store.put(key, f, overwrite=force)
+
+        checkpoint.write(''.join(path + '\n' for path, _, _, _ in batch))
+        checkpoint.flush()
+        stats['embedded'] += len(frame_keys)
+        stats['faces'] += len(face_keys)
+
+    batch = []
+    start = time.perf_counter()
+    last_report = start
+    for index, path in enumerate(iter_paths(options['images'], options['manifest'])):
+        if index % workers != shard or path in done:
+            continue
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            key = EmbeddingStore.key(data)
+            # An already embedded photo may still be missing its face
+            # embedding (first --faces run, or a new face backend)
+            need_frame = force or store.get(key) is None
+            need_face = face_backend is not None and (
+                force or face_store.get(face_key(key, face_backend.name)) is None
+            )
+            if not need_frame and not need_face:
+                stats['skipped'] += 1
+                checkpoint.write(path + '\n')
+                continue
+            decoded = DecodedImages(options['min_side'])
+            img, _ = decoded.get(key, data)
+            face = None
+            if need_face:
+                face = embed_faces(face_backend, data, decoded, key)
+            batch.append((path, key, img if need_frame else None, face))
+        except Exception as e:
+            stats['failed'] += 1
+            print(f"⚠️ [{shard}] Could not process {path}: {e}")
+            continue
+
+        if len(batch) >= options['batch_size']:
+            flush(batch)
+            batch = []
+            now = time.perf_counter()
+            if now - last_report >= 30:
+                last_report = now
+                print(f"   [{shard}] {stats['embedded']} images, {stats['embedded'] / (now - start):.1f} imgs/sec")
+
+    if batch:
+        flush(batch)
+    checkpoint.close()
+
+    seconds = time.perf_counter() - start
+    stats['seconds'] = round(seconds, 2)
+    stats['images_per_second'] = round(stats['embedded'] / seconds, 2) if seconds else 0.0
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--images', help='directory of photos (searched recursively)')
+    source.add_argument('--manifest', help='file listing one photo path per line')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--cache-dir', default=os.environ.get(
+        'EMBEDDING_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'embedding_cache')
+    ))
+    parser.add_argument('--checkpoint-dir', help='default: <cache dir>/reindex-<namespace>')
+    parser.add_argument('--decode-min-side', type=int, default=int(os.environ.get('DECODE_MIN_SIDE', '448')))
+    parser.add_argument('--faces', action='store_true', help='also refresh aligned face crops and face embeddings')
+    parser.add_argument('--force', action='store_true', help='re-embed photos already in the store')
+    parser.add_argument('--gallery', action='store_true', help='then rebuild and compact the gallery matrices')
+    parser.add_argument('--output', help='also write the JSON report here')
+    args = parser.parse_args()
+
+    backend = os.environ.get('EMBEDDING_BACKEND', 'keras')
+    model_path = os.environ.get('MODEL_PATH')
+    namespace = embedding_namespace(backend, model_path)
+    # A --faces run keeps its own checkpoint, or it would skip every photo
+    # an earlier whole-frame run finished
+    suffix = '-faces' if args.faces else ''
+    checkpoint_dir = args.checkpoint_dir or os.path.join(args.cache_dir, f'reindex-{namespace}{suffix}')
+    os.makedirs(checkpoint_dir, exist_ok=True)
+
+    options = {
+        'images': args.images,
+        'manifest': args.manifest,
+        'workers': args.workers,
+        'batch_size': args.batch_size,
+        'cache_dir': args.cache_dir,
+        'checkpoint_dir': checkpoint_dir,
+        'namespace': namespace,
+        'backend': backend,
+        'model_path': model_path,
+        'min_side': args.decode_min_side,
+        'faces': args.faces,
+        'face_backend': os.environ.get('FACE_BACKEND', 'auto'),
+        'face_model': os.environ.get('FACE_DETECTOR_MODEL'),
+        'force': args.force
+    }
+
+    if args.faces:
+        # Checked up front so a mismatch fails before any worker starts
+        try:
+            face_backend = server_face_backend(options['face_backend'], options['face_model'], options['min_side'])
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"👤 Face backend: {face_backend.label}")
+
+    print(f"📦 Re-indexing into {os.path.join(args.cache_dir, namespace)} with {args.workers} workers")
+    start = time.perf_counter()
+    threads = max(1, (os.cpu_count() or 1) // args.workers)
+    # spawn: each worker starts clean and builds its own model
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(args.workers, mp_context=context, initializer=init_worker, initargs=(threads,)) as pool:
+        futures = [pool.submit(run_shard, shard, options) for shard in range(args.workers)]
+        workers = [future.result() for future in futures]
+    seconds = time.perf_counter() - start
+
+    embedded = sum(w['embedded'] for w in workers)
+    report = {
+        'namespace': namespace,
+        'checkpoint_dir': checkpoint_dir,
+        'embedded': embedded,
+        'faces': sum(w['faces'] for w in workers),
+        'skipped': sum(w['skipped'] for w in workers),
+        'failed': sum(w['failed'] for w in workers),
+        'seconds': round(seconds, 2),
+        'images_per_second': round(embedded / seconds, 2) if seconds else 0.0,
+        'workers': workers
+    }
+    if args.gallery:
+        report.update(build_gallery_matrix(
+            args.cache_dir, namespace, os.environ.get('GALLERY_MATRIX_DTYPE', 'float16'), refresh=args.force
+        ))
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
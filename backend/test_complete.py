@@ -15,7 +15,7 @@ try:
     response = requests.get('http://127.0.0.1:5000/health')
     health = response.json()
     print(f"✓ Status: {health['status']}")
-    print(f"✓ Vision API: {health['vision_api']}\n")
+    print(f"✓ Vision API: {health['google_vision']}\n")
 except Exception as e:
     print(f"❌ Connection failed: {e}\n")
     exit()
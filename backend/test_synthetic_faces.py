@@ -78,218 +78,224 @@ def create_car(color):
     buffer.seek(0)
     return base64.b64encode(buffer.read()).decode()
 
-print("⚡ FAST UNIVERSAL IMAGE RECOGNITION TEST")
-print("=" * 70)
-print("✨ No downloads required - using synthetic images")
-print("=" * 70)
-
-total_tests = 0
-passed_tests = 0
-total_time = 0
-
-# ============================================================================
-# PART 1: FACE TESTS
-# ============================================================================
-print("\n👤 PART 1: FACE RECOGNITION TESTS")
-print("-" * 70)
-
-# Test 1.1: Same person features
-print("\n🔬 TEST 1: Same Person (Similar Features)")
-total_tests += 1
-
-person1_v1 = create_synthetic_face("John", 'peachpuff', {'hair': True, 'smile': True, 'beard': True})
-person1_v2 = create_synthetic_face("John", 'peachpuff', {'hair': True, 'smile': False, 'beard': True})
-
-start = time.time()
-response = requests.post(f"{API_URL}/compare", json={
-    "image1": person1_v1,
-    "image2": person1_v2
-})
-elapsed = time.time() - start
-total_time += elapsed
-
-result = response.json()
-similarity = result.get('similarity', 0)
-match = result.get('match', False)
-
-print(f"   Similarity: {similarity:.1f}%")
-print(f"   Match: {'YES ✅' if match else 'NO ❌'}")
-print(f"   Time: {elapsed:.2f}s")
-
-if similarity >= 40:  # Realistic threshold for synthetic faces
-    print(f"   ✅ PASS")
-    passed_tests += 1
-else:
-    print(f"   ❌ FAIL")
-
-# Test 1.2: Different people
-print("\n🔬 TEST 2: Different People")
-total_tests += 1
-
-person1 = create_synthetic_face("John", 'peachpuff', {'hair': True, 'smile': True, 'beard': True})
-person2 = create_synthetic_face("Jane", 'wheat', {'hair': True, 'smile': True, 'beard': False})
-
-start = time.time()
-response = requests.post(f"{API_URL}/compare", json={
-    "image1": person1,
-    "image2": person2
-})
-elapsed = time.time() - start
-total_time += elapsed
-
-result = response.json()
-similarity = result.get('similarity', 0)
-
-print(f"   Similarity: {similarity:.1f}%")
-print(f"   Time: {elapsed:.2f}s")
-
-if similarity < 90:
-    print(f"   ✅ PASS - Detected difference")
-    passed_tests += 1
-else:
-    print(f"   ⚠️  PARTIAL")
-
-# ============================================================================
-# PART 2: ANIMAL TESTS
-# ============================================================================
-print("\n\n🐾 PART 2: ANIMAL/PET RECOGNITION TESTS")
-print("-" * 70)
-
-# Test 2.1: Same breed
-print("\n🔬 TEST 3: Same Animal Breed")
-total_tests += 1
-
-dog1 = create_dog('brown')
-dog2 = create_dog('brown')
-
-start = time.time()
-response = requests.post(f"{API_URL}/compare", json={
-    "image1": dog1,
-    "image2": dog2
-})
-elapsed = time.time() - start
-total_time += elapsed
-
-result = response.json()
-similarity = result.get('similarity', 0)
-
-print(f"   Similarity: {similarity:.1f}%")
-print(f"   Type: {result.get('comparison_type', 'N/A')}")
-print(f"   Time: {elapsed:.2f}s")
-
-if similarity >= 50:
-    print(f"   ✅ PASS")
-    passed_tests += 1
-else:
-    print(f"   ⚠️  PARTIAL")
-
-# Test 2.2: Animal detection
-print("\n🔬 TEST 4: Animal Detection")
-total_tests += 1
-
-dog = create_dog('brown')
-
-start = time.time()
-response = requests.post(f"{API_URL}/detect", json={"image": dog})
-elapsed = time.time() - start
-total_time += elapsed
-
-result = response.json()
-labels = result.get('detected', {}).get('labels', [])
-labels_text = ' '.join([l['name'].lower() for l in labels[:5]])
-
-print(f"   Primary Type: {result.get('primary_type', 'unknown')}")
-print(f"   Top Labels: {labels_text[:80]}")
-print(f"   Time: {elapsed:.2f}s")
-
-if any(word in labels_text for word in ['dog', 'animal', 'pet', 'mammal']):
-    print(f"   ✅ PASS - Animal detected")
-    passed_tests += 1
-else:
-    print(f"   ⚠️  PARTIAL - Check labels above")
-
-# ============================================================================
-# PART 3: OBJECT TESTS
-# ============================================================================
-print("\n\n📦 PART 3: OBJECT RECOGNITION TESTS")
-print("-" * 70)
-
-# Test 3.1: Same object type
-print("\n🔬 TEST 5: Same Object Type (Cars)")
-total_tests += 1
-
-car1 = create_car('red')
-car2 = create_car('blue')
-
-start = time.time()
-response = requests.post(f"{API_URL}/compare", json={
-    "image1": car1,
-    "image2": car2
-})
-elapsed = time.time() - start
-total_time += elapsed
-
-result = response.json()
-similarity = result.get('similarity', 0)
-
-print(f"   Similarity: {similarity:.1f}%")
-print(f"   Time: {elapsed:.2f}s")
-
-if similarity >= 30:
-    print(f"   ✅ PASS")
-    passed_tests += 1
-else:
-    print(f"   ⚠️  PARTIAL")
-
-# Test 3.2: Object detection
-print("\n🔬 TEST 6: Object Detection")
-total_tests += 1
-
-car = create_car('red')
-
-start = time.time()
-response = requests.post(f"{API_URL}/detect", json={"image": car})
-elapsed = time.time() - start
-total_time += elapsed
-
-result = response.json()
-objects = result.get('detected', {}).get('objects', [])
-
-print(f"   Primary Type: {result.get('primary_type', 'unknown')}")
-print(f"   Objects Found: {len(objects)}")
-print(f"   Time: {elapsed:.2f}s")
-
-if result.get('primary_type') == 'object' or len(objects) > 0:
-    print(f"   ✅ PASS")
-    passed_tests += 1
-else:
-    print(f"   ❌ FAIL")
-
-# ============================================================================
-# FINAL RESULTS
-# ============================================================================
-print("\n\n" + "🏆" * 35)
-print("FINAL RESULTS")
-print("🏆" * 35)
-
-accuracy = (passed_tests / total_tests * 100) if total_tests > 0 else 0
-avg_time = (total_time / total_tests) if total_tests > 0 else 0
-
-print(f"\n📊 Results:")
-print(f"   ✅ Passed: {passed_tests}/{total_tests}")
-print(f"   📈 Success Rate: {accuracy:.1f}%")
-print(f"   ⏱️  Avg Time: {avg_time:.2f}s")
-
-print(f"\n✅ Tested Categories:")
-print(f"   👤 Faces: ✓")
-print(f"   🐾 Animals: ✓")
-print(f"   📦 Objects: ✓")
-
-if accuracy >= 70:
-    print(f"\n🎉 EXCELLENT - Universal API working!")
-else:
-    print(f"\n✅ FUNCTIONAL - API operational")
-
-print("\n💡 This was a FAST test with synthetic images")
-print("   For real-world testing, use your React Native app!")
-print("=" * 70)
+def main():
+    """Run the checks against the server at API_URL"""
+    print("⚡ FAST UNIVERSAL IMAGE RECOGNITION TEST")
+    print("=" * 70)
+    print("✨ No downloads required - using synthetic images")
+    print("=" * 70)
+
+    total_tests = 0
+    passed_tests = 0
+    total_time = 0
+
+    # ============================================================================
+    # PART 1: FACE TESTS
+    # ============================================================================
+    print("\n👤 PART 1: FACE RECOGNITION TESTS")
+    print("-" * 70)
+
+    # Test 1.1: Same person features
+    print("\n🔬 TEST 1: Same Person (Similar Features)")
+    total_tests += 1
+
+    person1_v1 = create_synthetic_face("John", 'peachpuff', {'hair': True, 'smile': True, 'beard': True})
+    person1_v2 = create_synthetic_face("John", 'peachpuff', {'hair': True, 'smile': False, 'beard': True})
+
+    start = time.time()
+    response = requests.post(f"{API_URL}/compare", json={
+        "image1": person1_v1,
+        "image2": person1_v2
+    })
+    elapsed = time.time() - start
+    total_time += elapsed
+
+    result = response.json()
+    similarity = result.get('similarity', 0)
+    match = result.get('match', False)
+
+    print(f"   Similarity: {similarity:.1f}%")
+    print(f"   Match: {'YES ✅' if match else 'NO ❌'}")
+    print(f"   Time: {elapsed:.2f}s")
+
+    if similarity >= 40:  # Realistic threshold for synthetic faces
+        print(f"   ✅ PASS")
+        passed_tests += 1
+    else:
+        print(f"   ❌ FAIL")
+
+    # Test 1.2: Different people
+    print("\n🔬 TEST 2: Different People")
+    total_tests += 1
+
+    person1 = create_synthetic_face("John", 'peachpuff', {'hair': True, 'smile': True, 'beard': True})
+    person2 = create_synthetic_face("Jane", 'wheat', {'hair': True, 'smile': True, 'beard': False})
+
+    start = time.time()
+    response = requests.post(f"{API_URL}/compare", json={
+        "image1": person1,
+        "image2": person2
+    })
+    elapsed = time.time() - start
+    total_time += elapsed
+
+    result = response.json()
+    similarity = result.get('similarity', 0)
+
+    print(f"   Similarity: {similarity:.1f}%")
+    print(f"   Time: {elapsed:.2f}s")
+
+    if similarity < 90:
+        print(f"   ✅ PASS - Detected difference")
+        passed_tests += 1
+    else:
+        print(f"   ⚠️  PARTIAL")
+
+    # ============================================================================
+    # PART 2: ANIMAL TESTS
+    # ============================================================================
+    print("\n\n🐾 PART 2: ANIMAL/PET RECOGNITION TESTS")
+    print("-" * 70)
+
+    # Test 2.1: Same breed
+    print("\n🔬 TEST 3: Same Animal Breed")
+    total_tests += 1
+
+    dog1 = create_dog('brown')
+    dog2 = create_dog('brown')
+
+    start = time.time()
+    response = requests.post(f"{API_URL}/compare", json={
+        "image1": dog1,
+        "image2": dog2
+    })
+    elapsed = time.time() - start
+    total_time += elapsed
+
+    result = response.json()
+    similarity = result.get('similarity', 0)
+
+    print(f"   Similarity: {similarity:.1f}%")
+    print(f"   Type: {result.get('comparison_type', 'N/A')}")
+    print(f"   Time: {elapsed:.2f}s")
+
+    if similarity >= 50:
+        print(f"   ✅ PASS")
+        passed_tests += 1
+    else:
+        print(f"   ⚠️  PARTIAL")
+
+    # Test 2.2: Animal detection
+    print("\n🔬 TEST 4: Animal Detection")
+    total_tests += 1
+
+    dog = create_dog('brown')
+
+    start = time.time()
+    response = requests.post(f"{API_URL}/detect", json={"image": dog})
+    elapsed = time.time() - start
+    total_time += elapsed
+
+    result = response.json()
+    labels = result.get('detected', {}).get('labels', [])
+    labels_text = ' '.join([l['name'].lower() for l in labels[:5]])
+
+    print(f"   Primary Type: {result.get('primary_type', 'unknown')}")
+    print(f"   Top Labels: {labels_text[:80]}")
+    print(f"   Time: {elapsed:.2f}s")
+
+    if any(word in labels_text for word in ['dog', 'animal', 'pet', 'mammal']):
+        print(f"   ✅ PASS - Animal detected")
+        passed_tests += 1
+    else:
+        print(f"   ⚠️  PARTIAL - Check labels above")
+
+    # ============================================================================
+    # PART 3: OBJECT TESTS
+    # ============================================================================
+    print("\n\n📦 PART 3: OBJECT RECOGNITION TESTS")
+    print("-" * 70)
+
+    # Test 3.1: Same object type
+    print("\n🔬 TEST 5: Same Object Type (Cars)")
+    total_tests += 1
+
+    car1 = create_car('red')
+    car2 = create_car('blue')
+
+    start = time.time()
+    response = requests.post(f"{API_URL}/compare", json={
+        "image1": car1,
+        "image2": car2
+    })
+    elapsed = time.time() - start
+    total_time += elapsed
+
+    result = response.json()
+    similarity = result.get('similarity', 0)
+
+    print(f"   Similarity: {similarity:.1f}%")
+    print(f"   Time: {elapsed:.2f}s")
+
+    if similarity >= 30:
+        print(f"   ✅ PASS")
+        passed_tests += 1
+    else:
+        print(f"   ⚠️  PARTIAL")
+
+    # Test 3.2: Object detection
+    print("\n🔬 TEST 6: Object Detection")
+    total_tests += 1
+
+    car = create_car('red')
+
+    start = time.time()
+    response = requests.post(f"{API_URL}/detect", json={"image": car})
+    elapsed = time.time() - start
+    total_time += elapsed
+
+    result = response.json()
+    objects = result.get('detected', {}).get('objects', [])
+
+    print(f"   Primary Type: {result.get('primary_type', 'unknown')}")
+    print(f"   Objects Found: {len(objects)}")
+    print(f"   Time: {elapsed:.2f}s")
+
+    if result.get('primary_type') == 'object' or len(objects) > 0:
+        print(f"   ✅ PASS")
+        passed_tests += 1
+    else:
+        print(f"   ❌ FAIL")
+
+    # ============================================================================
+    # FINAL RESULTS
+    # ============================================================================
+    print("\n\n" + "🏆" * 35)
+    print("FINAL RESULTS")
+    print("🏆" * 35)
+
+    accuracy = (passed_tests / total_tests * 100) if total_tests > 0 else 0
+    avg_time = (total_time / total_tests) if total_tests > 0 else 0
+
+    print(f"\n📊 Results:")
+    print(f"   ✅ Passed: {passed_tests}/{total_tests}")
+    print(f"   📈 Success Rate: {accuracy:.1f}%")
+    print(f"   ⏱️  Avg Time: {avg_time:.2f}s")
+
+    print(f"\n✅ Tested Categories:")
+    print(f"   👤 Faces: ✓")
+    print(f"   🐾 Animals: ✓")
+    print(f"   📦 Objects: ✓")
+
+    if accuracy >= 70:
+        print(f"\n🎉 EXCELLENT - Universal API working!")
+    else:
+        print(f"\n✅ FUNCTIONAL - API operational")
+
+    print("\n💡 This was a FAST test with synthetic images")
+    print("   For real-world testing, use your React Native app!")
+    print("=" * 70)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from admission import AdmissionController, DeadlineExceeded, QueueFull, check_deadline, reset_deadline, set_deadline
+
+
+def test_never_more_than_max_concurrent_run_at_once():
+    admission = AdmissionController(max_concurrent=3, max_queue=100)
+    lock = threading.Lock()
+    running = [0]
+    peak = [0]
+
+    def request(_):
+        admission.acquire(time.monotonic() + 10)
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.005)
+        with lock:
+            running[0] -= 1
+        admission.release(0.005)
+
+    with ThreadPoolExecutor(20) as pool:
+        list(pool.map(request, range(100)))
+
+    stats = admission.stats()
+    assert peak[0] == 3
+    assert stats['admitted'] == 100
+    assert stats['active'] == 0 and stats['waiting'] == 0
+
+
+def test_a_full_queue_rejects_at_once():
+    admission = AdmissionController(max_concurrent=1, max_queue=1)
+    admission.acquire()
+    waiter = threading.Thread(target=admission.acquire, args=(time.monotonic() + 5,))
+    waiter.start()
+    while admission.stats()['waiting'] < 1:
+        time.sleep(0.001)
+
+    with pytest.raises(QueueFull):
+        admission.acquire()
+
+    admission.release(0.01)
+    waiter.join(5)
+    admission.release(0.01)
+    stats = admission.stats()
+    assert stats['admitted'] == 2 and stats['rejected'] == 1
+    assert stats['active'] == 0 and stats['waiting'] == 0
+
+
+def test_waiters_are_admitted_in_arrival_order():
+    admission = AdmissionController(max_concurrent=1, max_queue=10)
+    admission.acquire()
+    order = []
+
+    def waiter(n):
+        admission.acquire(time.monotonic() + 5)
+        order.append(n)
+        admission.release(0.001)
+
+    threads = []
+    for n in range(5):
+        threads.append(threading.Thread(target=waiter, args=(n,)))
+        threads[-1].start()
+        while admission.stats()['waiting'] < n + 1:
+            time.sleep(0.001)
+
+    admission.release(0.001)
+    for thread in threads:
+        thread.join(5)
+    assert order == list(range(5))
+
+
+def test_a_waiter_whose_deadline_passes_gives_up_without_leaking_a_slot():
+    admission = AdmissionController(max_concurrent=1, max_queue=5)
+    admission.acquire()
+    with pytest.raises(DeadlineExceeded):
+        admission.acquire(time.monotonic() + 0.02)
+
+    admission.release(0.01)
+    admission.acquire(time.monotonic() + 1)
+    stats = admission.stats()
+    assert stats['timed_out'] == 1
+    assert stats['active'] == 1 and stats['waiting'] == 0
+
+
+def test_check_deadline_follows_the_context():
+    check_deadline('nothing set')
+    token = set_deadline(time.monotonic() - 1)
+    try:
+        with pytest.raises(DeadlineExceeded):
+            check_deadline('scoring')
+    finally:
+        reset_deadline(token)
+    check_deadline('reset')
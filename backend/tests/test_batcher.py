@@ -0,0 +1,84 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from batcher import MicroBatcher
+
+
+def test_concurrent_submissions_share_batches_and_get_their_own_rows():
+    calls = []
+
+    def run_batch(batch):
+        calls.append(len(batch))
+        time.sleep(0.01)
+        return batch * 2
+
+    batcher = MicroBatcher(run_batch, max_batch_size=16, max_wait_ms=20)
+
+    def submit(i):
+        rows = np.full((1 + i % 3, 4), i, dtype=np.float32)
+        return i, rows, batcher(rows)
+
+    with ThreadPoolExecutor(16) as pool:
+        results = list(pool.map(submit, range(64)))
+
+    for i, rows, output in results:
+        np.testing.assert_array_equal(output, rows * 2)
+    stats = batcher.stats()
+    assert stats['submissions'] == 64
+    assert stats['rows'] == sum(len(rows) for _, rows, _ in results) == sum(calls)
+    assert stats['batches'] == len(calls) < 64
+    # Collection stops once max_batch_size rows are queued, so the last
+    # submission (up to 3 rows here) can overshoot it
+    assert max(calls) <= 16 + 2
+
+
+def test_expired_submissions_are_dropped_before_the_forward_pass():
+    started = threading.Event()
+    release = threading.Event()
+    seen = []
+
+    def run_batch(batch):
+        seen.append(batch.copy())
+        started.set()
+        release.wait(5)
+        return batch
+
+    batcher = MicroBatcher(run_batch, max_batch_size=1, max_wait_ms=0)
+    blocker = batcher.submit(np.zeros((1, 2)))
+    started.wait(5)
+    expired = batcher.submit(np.ones((1, 2)), deadline=time.monotonic() + 0.01)
+    time.sleep(0.05)
+    release.set()
+
+    blocker.result(5)
+    with pytest.raises(TimeoutError):
+        expired.result(5)
+    assert len(seen) == 1
+    assert batcher.stats()['expired'] == 1
+
+
+def test_a_failed_batch_fails_its_callers_and_the_batcher_keeps_going():
+    fail = [True]
+
+    def run_batch(batch):
+        if fail[0]:
+            fail[0] = False
+            raise RuntimeError("model crashed")
+        return batch
+
+    batcher = MicroBatcher(run_batch, max_batch_size=8, max_wait_ms=0)
+    with pytest.raises(RuntimeError):
+        batcher(np.zeros((1, 2)))
+    np.testing.assert_array_equal(batcher(np.ones((1, 2))), np.ones((1, 2)))
+
+
+def test_on_batch_gets_batch_sizes_and_waits():
+    recorded = []
+    batcher = MicroBatcher(lambda batch: batch, max_wait_ms=0, on_batch=lambda size, waits: recorded.append((size, waits)))
+    batcher(np.zeros((3, 2)))
+    assert recorded[0][0] == 3
+    assert len(recorded[0][1]) == 1 and recorded[0][1][0] >= 0
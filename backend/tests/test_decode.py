@@ -0,0 +1,51 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from image_decode import DecodedImages
+
+
+def jpeg(width, height, seed=0):
+    pixels = np.random.default_rng(seed).integers(0, 255, (height, width, 3), dtype=np.uint8)
+    return cv2.imencode('.jpg', pixels)[1].tobytes()
+
+
+def test_each_image_is_decoded_once_and_shared():
+    decoded = DecodedImages(min_side=448)
+    data = jpeg(2400, 1800)
+
+    img, size = decoded.get('a', data)
+    assert size == (2400, 1800)
+    assert img.shape[:2] == (450, 600)
+    assert decoded.get('a', data)[0] is img
+    # Fewer pixels than the first decode kept are served from it too
+    assert decoded.get('a', data, 100)[0] is img
+    assert decoded.stats['images'] == 1
+
+
+def test_a_larger_decode_replaces_the_first():
+    decoded = DecodedImages(min_side=448)
+    data = jpeg(2400, 1800)
+
+    decoded.get('a', data)
+    img, _ = decoded.get('a', data, 900)
+    assert img.shape[:2] == (900, 1200)
+    assert decoded.get('a', data)[0] is img
+    assert decoded.get('a', data, 0)[0].shape[:2] == (1800, 2400)
+    assert decoded.stats['images'] == 3
+    assert decoded.stats['peak_decoded_bytes'] == 1800 * 2400 * 3
+
+
+def test_concurrent_stages_share_one_decode():
+    seconds = []
+    decoded = DecodedImages(min_side=448, on_decode=seconds.append)
+    images = {key: jpeg(1600, 1200, seed) for seed, key in enumerate('abc')}
+
+    with ThreadPoolExecutor(12) as pool:
+        results = list(pool.map(lambda key: (key, decoded.get(key, images[key])[0]), list(images) * 8))
+
+    for key, img in results:
+        assert img is decoded.get(key, images[key])[0]
+    assert decoded.stats['images'] == 3
+    assert len(seconds) == 3
@@ -0,0 +1,26 @@
+from embedding_backends import embedding_namespace
+
+
+def test_keras_namespaces_follow_the_model_contents(tmp_path):
+    assert embedding_namespace('keras') == 'mobilenet_v2'
+
+    model = tmp_path / 'finetuned.keras'
+    model.write_bytes(b'weights v1')
+    first = embedding_namespace('keras', str(model))
+    assert first.startswith('mobilenet_v2-keras-finetuned-')
+    assert embedding_namespace('keras', str(model)) == first
+
+    model.write_bytes(b'weights v2')
+    assert embedding_namespace('keras', str(model)) != first
+
+
+def test_saved_model_directories_are_hashed_file_by_file(tmp_path):
+    saved_model = tmp_path / 'export'
+    (saved_model / 'variables').mkdir(parents=True)
+    (saved_model / 'saved_model.pb').write_bytes(b'graph')
+    (saved_model / 'variables' / 'variables.index').write_bytes(b'index v1')
+    first = embedding_namespace('keras', str(saved_model) + '/')
+    assert first.startswith('mobilenet_v2-keras-export-')
+
+    (saved_model / 'variables' / 'variables.index').write_bytes(b'index v2')
+    assert embedding_namespace('keras', str(saved_model)) != first
@@ -0,0 +1,104 @@
+"""EmbeddingMatrix written to by several processes at once"""
+import multiprocessing
+import os
+
+import numpy as np
+
+from embedding_matrix import EmbeddingMatrix
+
+
+def append_rows(path, worker, count):
+    matrix = EmbeddingMatrix(path, model='test', dtype='float32')
+    for i in range(count):
+        vector = np.zeros(8)
+        vector[worker] = 1.0
+        vector[7] = i
+        matrix.append([f'{worker}-{i}'], [vector])
+
+
+def run_workers(target, path, workers=4, count=25):
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=target, args=(path, worker, count)) for worker in range(workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(30)
+        assert process.exitcode == 0
+
+
+def test_concurrent_matrix_appends_keep_every_row(tmp_path):
+    path = os.path.join(tmp_path, 'gallery', 'test.emb')
+    run_workers(append_rows, path)
+
+    matrix = EmbeddingMatrix(path, model='test', dtype='float32')
+    assert len(matrix) == matrix.rows == 100
+    for worker in range(4):
+        for i in (0, 24):
+            vector = np.zeros(8)
+            vector[worker] = 1.0
+            vector[7] = i
+            assert matrix.search(vector, 1)[0][0] == f'{worker}-{i}'
+
+
+def test_a_reader_picks_up_other_processes_appends_and_removals(tmp_path):
+    path = os.path.join(tmp_path, 'test.emb')
+    reader = EmbeddingMatrix(path, model='test', dtype='float32')
+    writer = EmbeddingMatrix(path, model='test', dtype='float32')
+    writer.append(['a', 'b'], np.eye(2, 8))
+    assert [hit[0] for hit in reader.search(np.eye(1, 8)[0], 5)] == ['a', 'b']
+
+    writer.remove('a')
+    writer.append(['b'], [np.eye(1, 8)[0]])
+    assert reader.search(np.eye(1, 8)[0], 5) == [('b', 1.0)]
+    assert len(reader) == 1
+
+
+def compact_repeatedly(path, worker, count):
+    matrix = EmbeddingMatrix(path, model='test', dtype='float32')
+    for _ in range(count):
+        # Replacing 'seed' leaves a dead row, so every pass rewrites the file
+        matrix.append(['seed'], np.eye(1, 8))
+        assert matrix.compact() >= 1
+
+
+def test_compaction_drops_dead_rows_and_readers_follow_it(tmp_path):
+    path = os.path.join(tmp_path, 'test.emb')
+    reader = EmbeddingMatrix(path, model='test', dtype='float32')
+    writer = EmbeddingMatrix(path, model='test', dtype='float32')
+    writer.append(['a', 'b', 'c'], np.eye(3, 8))
+    writer.append(['b'], [np.eye(1, 8, 1)[0] + np.eye(1, 8, 7)[0]])
+    writer.remove('c')
+    assert reader.search(np.eye(1, 8)[0], 1) == [('a', 1.0)]
+
+    assert writer.compact() == 2
+    assert writer.compact() == 0
+    assert not os.path.exists(path + '.ids')
+    assert reader.search(np.eye(1, 8, 1)[0], 5)[0][0] == 'b'
+    assert reader.rows == 2 and len(reader) == 2 and reader.generation == 1
+    assert reader.search(np.eye(1, 8)[0], 1) == [('a', 1.0)]
+
+    writer.append(['d'], np.eye(1, 8, 3))
+    assert reader.search(np.eye(1, 8, 3)[0], 1) == [('d', 1.0)]
+
+
+def test_appends_during_compaction_are_kept(tmp_path):
+    path = os.path.join(tmp_path, 'gallery', 'test.emb')
+    EmbeddingMatrix(path, model='test', dtype='float32').append(['seed'], np.eye(1, 8))
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=append_rows, args=(path, worker, 25)) for worker in range(3)]
+    processes.append(context.Process(target=compact_repeatedly, args=(path, 3, 25)))
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(30)
+        assert process.exitcode == 0
+
+    matrix = EmbeddingMatrix(path, model='test', dtype='float32')
+    assert len(matrix) == 76 and matrix.generation == 25
+    matrix.compact()
+    assert matrix.rows == len(matrix) == 76
+    for worker in range(3):
+        vector = np.zeros(8)
+        vector[worker] = 1.0
+        vector[7] = 24
+        assert matrix.search(vector, 1)[0][0] == f'{worker}-24'
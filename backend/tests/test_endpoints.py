@@ -0,0 +1,252 @@
+"""
+The HTTP endpoints through Flask's test client, with a stub embedding
+model and FakeVisionClient as the face backend, so nothing needs
+TensorFlow, a network or Vision credentials.
+"""
+import base64
+import importlib
+import io
+
+import cv2
+import numpy as np
+import pytest
+
+from classifier import ClassificationHead
+from embedding_store import CropStore, EmbeddingStore
+from model_loader import ModelLoader
+
+
+class StubModel:
+    """
+    predict()-compatible stand-in for MobileNetV2: a 16x16 colour
+    thumbnail, non-negative like MobileNetV2's pooled ReLU features and
+    zero-padded to 1280-d
+    """
+
+    def predict(self, batch, verbose=0):
+        n = len(batch)
+        thumbnails = np.asarray(batch, dtype=np.float32).reshape(n, 16, 14, 16, 14, 3).mean(axis=(2, 4)) + 1
+        return np.concatenate([thumbnails.reshape(n, -1), np.zeros((n, 1280 - 768), dtype=np.float32)], axis=1)
+
+
+def photo(seed, size=(320, 240), quality=90):
+    """A deterministic JPEG of coloured blocks, base64-encoded"""
+    rng = np.random.default_rng(seed)
+    blocks = rng.integers(0, 256, (6, 8, 3), dtype=np.uint8)
+    img = cv2.resize(blocks, size, interpolation=cv2.INTER_NEAREST)
+    return base64.b64encode(cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()).decode()
+
+
+def video(path, seeds, frames_per_photo=10, fps=10):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'MJPG'), fps, (320, 240))
+    for seed in seeds:
+        frame = cv2.imdecode(np.frombuffer(base64.b64decode(photo(seed)), np.uint8), cv2.IMREAD_COLOR)
+        for _ in range(frames_per_photo):
+            writer.write(frame)
+    writer.release()
+    return path.read_bytes()
+
+
+@pytest.fixture(scope='module')
+def app_module(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('endpoints')
+    head_path = str(directory / 'head.npz')
+    rng = np.random.default_rng(0)
+    labels = [f'class {i}' for i in range(1000)]
+    ClassificationHead(rng.normal(size=(1280, 1000)), np.zeros(1000), labels).save(head_path)
+
+    with pytest.MonkeyPatch.context() as env:
+        env.setenv('EMBEDDING_CACHE_DIR', str(directory / 'cache'))
+        env.setenv('VISION_CLIENT', 'fake')
+        env.setenv('FAKE_VISION_LATENCY_MS', '0')
+        env.setenv('FAKE_VISION_JITTER_MS', '0')
+        env.setenv('FAKE_VISION_PER_IMAGE_MS', '0')
+        env.setenv('FACE_BACKEND', 'vision')
+        env.setenv('DETECT_BACKEND', 'local')
+        env.setenv('CLASSIFIER_HEAD', head_path)
+        app = importlib.import_module('app')
+
+    app.model_loader = ModelLoader(StubModel)
+    app.model_loader.load()
+    app.init_vision_client()
+    app.init_face_backend()
+    assert app.face_backend.name == 'vision'
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+def test_identical_uploads_are_answered_from_the_content_hash(client):
+    image = photo(1)
+    fast = client.post('/compare', json={'image1': image, 'image2': image}).get_json()
+    assert fast['fast_path'] is True and fast['match'] is True
+    assert fast['analysis_details']['method'] == 'Content hash'
+
+    full = client.post('/compare', json={'image1': image, 'image2': image, 'fast_path': False}).get_json()
+    assert full['fast_path'] is False
+    assert full['analysis_type'] == 'face_recognition'
+    assert 'hash_distance' not in full['analysis_details']
+
+
+def test_a_near_duplicate_is_only_a_hint(client):
+    # The same photo re-encoded: different bytes, (nearly) the same dHash
+    response = client.post('/compare', json={'image1': photo(2), 'image2': photo(2, quality=60)})
+    result = response.get_json()
+    assert response.status_code == 200
+    assert result['fast_path'] is False
+    assert result['analysis_type'] == 'face_recognition'
+    details = result['analysis_details']
+    assert details['hash_distance'] <= 4
+    assert details['near_duplicate'] is result['match']
+
+
+def test_photos_without_faces_take_the_object_path(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module.vision_client, 'face_rate', 0.0)
+    result = client.post('/compare', json={'image1': photo(3), 'image2': photo(4)}).get_json()
+    assert result['analysis_type'] == 'object_pet_comparison'
+    assert result['fast_path'] is False
+
+
+def test_enroll_then_look_up_and_delete_the_gallery_entry(client):
+    image = photo(5)
+    enrolled = client.post('/enroll', json={'id': 'gallery-1', 'image': image})
+    assert enrolled.status_code == 200
+    assert enrolled.get_json()['faces'] == 1
+
+    entry = client.get('/gallery/gallery-1').get_json()
+    assert entry['id'] == 'gallery-1' and len(entry['faces']) == 1 and entry['phash']
+
+    assert client.delete('/gallery/gallery-1').status_code == 200
+    assert client.get('/gallery/gallery-1').status_code == 404
+    assert client.delete('/gallery/gallery-1').status_code == 404
+
+
+def test_compare_against_an_enrolled_photo_and_re_enroll_when_stale(client, app_module, monkeypatch, tmp_path):
+    # The flow DetailsScreen.jsx relies on: 404 or 409 means enroll, then compare again
+    reference, report = photo(6), photo(7)
+    unknown = client.post('/compare', json={'image1_id': 'gallery-2', 'image2': report})
+    assert unknown.status_code == 404
+
+    assert client.post('/enroll', json={'id': 'gallery-2', 'image': reference}).status_code == 200
+    by_id = client.post('/compare', json={'image1_id': 'gallery-2', 'image2': report})
+    by_upload = client.post('/compare', json={'image1': reference, 'image2': report, 'fast_path': False})
+    assert by_id.status_code == 200
+    assert by_id.get_json()['similarity'] == by_upload.get_json()['similarity']
+
+    # A model change leaves the enrolled photo without embeddings or crops
+    namespace = app_module.EMBEDDING_NAMESPACE + '-new'
+    face_store = EmbeddingStore(str(tmp_path), namespace=namespace + '-face')
+    monkeypatch.setattr(app_module, 'embedding_store', EmbeddingStore(str(tmp_path), namespace=namespace))
+    monkeypatch.setattr(app_module, 'face_embedding_store', face_store)
+    monkeypatch.setattr(app_module, 'face_crop_store', CropStore(str(tmp_path)))
+    stale = client.post('/compare', json={'image1_id': 'gallery-2', 'image2': report})
+    assert stale.status_code == 409
+
+    assert client.post('/enroll', json={'id': 'gallery-2', 'image': reference}).status_code == 200
+    assert client.post('/compare', json={'image1_id': 'gallery-2', 'image2': report}).status_code == 200
+
+
+def test_index_search_and_unindex_reports(client, app_module):
+    report, other = photo(8), photo(9)
+    indexed = client.post('/search/index', json={'id': 'report-1', 'image': report})
+    assert indexed.status_code == 200
+    assert client.post('/search/index', json={'id': 'report-2', 'image': other}).status_code == 200
+    assert app_module.indexed_reports.get('report-1')['image_id'] == indexed.get_json()['image_id']
+
+    result = client.post('/search', json={'image': report, 'top_k': 50}).get_json()
+    assert result['fast_path'] is False
+    best = result['results'][0]
+    assert best['id'] == 'report-1' and best['similarity'] == 100.0
+    assert best['hash_distance'] == 0 and best['near_duplicate'] is True
+    # The old route name answers the same
+    assert client.post('/gallery/search', json={'image': report}).get_json()['results'][0]['id'] == 'report-1'
+
+    assert client.delete('/search/index/report-1').status_code == 200
+    assert app_module.indexed_reports.get('report-1') is None
+    ids = [hit['id'] for hit in client.post('/search', json={'image': report, 'top_k': 50}).get_json()['results']]
+    assert 'report-1' not in ids and 'report-2' in ids
+    assert client.delete('/search/index/report-1').status_code == 404
+
+
+def test_search_rejects_non_numeric_parameters(client):
+    response = client.post('/search', json={'image': photo(8), 'top_k': 'ten'})
+    assert response.status_code == 400
+
+
+def test_match_faces_against_a_reference_and_the_gallery(client):
+    crowd, reference = photo(10), photo(11)
+    result = client.post('/match_faces', json={'image': crowd, 'reference': reference}).get_json()
+    assert result['status'] == 'success'
+    assert len(result['faces']) == 1
+
+    assert client.post('/enroll', json={'id': 'gallery-3', 'image': crowd}).status_code == 200
+    result = client.post('/match_faces', json={'image': crowd, 'gallery': True}).get_json()
+    assert result['status'] == 'success'
+    assert result['analysis_details']['gallery_faces'] >= 1
+
+    unknown = client.post('/match_faces', json={'image': crowd, 'reference_id': 'nobody'})
+    assert unknown.status_code == 404
+
+
+def test_scan_video_finds_the_reference(client, tmp_path):
+    clip = video(tmp_path / 'clip.avi', [12, 13, 14])
+    response = client.post(
+        '/scan_video',
+        data={'video': (io.BytesIO(clip), 'clip.avi'), 'reference': photo(13), 'sample_fps': '2'},
+        content_type='multipart/form-data'
+    )
+    result = response.get_json()
+    assert response.status_code == 200, result
+    best = result['matches'][0]
+    assert best['match'] and 1.0 <= best['timestamp_s'] < 2.0
+
+
+def test_analyze_labels_and_compares_in_one_request(client):
+    image = photo(15)
+    result = client.post('/analyze', json={'image': image, 'reference': photo(16)}).get_json()
+    assert result['status'] == 'success'
+    assert result['primary_type'] == 'human_face'
+    assert result['comparison']['comparison_type'] == 'face_recognition'
+
+
+def test_compare_many_ranks_candidates(client):
+    probe = photo(17)
+    candidates = [photo(18), probe, photo(19)]
+    result = client.post('/compare_many', json={
+        'probe': probe, 'candidates': candidates, 'candidate_ids': ['unknown'], 'top_k': 2
+    }).get_json()
+    assert [r['index'] for r in result['results']][0] == 1
+    assert len(result['results']) == 2
+    assert result['missing_ids'] == ['unknown']
+
+
+def test_a_model_that_fails_to_load_gets_503_with_retry_after(client, app_module, monkeypatch):
+    def broken():
+        raise RuntimeError("no weights")
+
+    # Not loaded yet, so the request gets as far as the forward pass
+    monkeypatch.setattr(app_module, 'model_loader', ModelLoader(broken))
+    response = client.post('/search', json={'image': photo(21)})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '5'
+    assert response.get_json()['model'] == 'failed'
+    # ... and from then on it is turned away before the body is read
+    assert client.post('/compare_many', json={'probe': photo(22), 'candidates': [photo(23)]}).status_code == 503
+
+
+def test_oversized_uploads_get_413(client, app_module, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'MAX_CONTENT_LENGTH', 1024)
+    big = photo(20, size=(640, 480))
+    json_body = client.post('/enroll', json={'id': 'too-big', 'image': big})
+    form_body = client.post(
+        '/compare',
+        data={'image1': (io.BytesIO(base64.b64decode(big)), 'a.jpg'), 'image2': (io.BytesIO(b'x'), 'b.jpg')},
+        content_type='multipart/form-data'
+    )
+    raw_body = client.post('/search', data=base64.b64decode(big), content_type='application/octet-stream')
+    for response in (json_body, form_body, raw_body):
+        assert response.status_code == 413
+        assert response.get_json()['status'] == 'error'
@@ -0,0 +1,35 @@
+"""HashIndex written to by several processes at once"""
+import multiprocessing
+import os
+
+from perceptual_hash import HashIndex
+
+
+def add_hashes(path, worker, count):
+    index = HashIndex(path, max_distance=4)
+    for i in range(count):
+        index.add(f'{worker}-{i}', (worker << 32) | i)
+
+
+def run_workers(target, path, workers=4, count=25):
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=target, args=(path, worker, count)) for worker in range(workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(30)
+        assert process.exitcode == 0
+
+
+def test_concurrent_hash_index_writers_share_one_log(tmp_path):
+    path = os.path.join(tmp_path, 'phash.log')
+    run_workers(add_hashes, path)
+
+    index = HashIndex(path, max_distance=4)
+    assert len(index) == 100
+    assert index.query((2 << 32) | 7, 0) == [('2-7', 0)]
+    assert [key for key, _ in index.query((2 << 32) | 7)][:1] == ['2-7']
+
+    index.remove('2-7')
+    assert index.query((2 << 32) | 7, 0) == []
+    assert len(HashIndex(path, max_distance=4)) == 99
@@ -0,0 +1,89 @@
+"""
+The fixed-order landmark arrays must score exactly like the
+per-landmark dict arithmetic compare_faces_hybrid() used before them.
+"""
+import random
+
+import numpy as np
+
+from face_backends import make_face
+from landmarks import (
+    MIN_COMMON_LANDMARKS, landmark_similarity, mean_distance, normalize_points, one_vs_many
+)
+
+
+def dict_score(landmarks1, size1, landmarks2, size2):
+    """The old dict-based landmark score, verbatim: (avg_dist, number of common landmarks)"""
+    img1_width, img1_height = size1
+    img2_width, img2_height = size2
+    normalized1 = {
+        t: (x / img1_width, y / img1_height, z / max(img1_width, img1_height))
+        for t, (x, y, z) in landmarks1.items()
+    }
+    normalized2 = {
+        t: (x / img2_width, y / img2_height, z / max(img2_width, img2_height))
+        for t, (x, y, z) in landmarks2.items()
+    }
+    common = set(normalized1.keys()) & set(normalized2.keys())
+    distances = []
+    for lm_type in common:
+        x1, y1, z1 = normalized1[lm_type]
+        x2, y2, z2 = normalized2[lm_type]
+        distances.append(np.sqrt((x2 - x1)**2 + (y2 - y1)**2 + (z2 - z1)**2))
+    return (np.mean(distances) if distances else float('nan')), len(common)
+
+
+def random_face(rng, size):
+    """
+    A face with a random subset of landmarks at float32 positions, like
+    Vision's. Every backend (and the gallery's JSON) lists landmarks in
+    type order, which the old code's set iteration order depended on.
+    """
+    width, height = size
+    types = sorted(rng.sample(range(1, 37), rng.randint(0, 36)))
+    landmarks = {
+        t: tuple(float(np.float32(v)) for v in (rng.uniform(0, width), rng.uniform(0, height), rng.uniform(-50, 50)))
+        for t in types
+    }
+    return make_face((0.0, 0.0, 1.0, 1.0), landmarks, 1.0)
+
+
+def test_mean_distance_matches_dict_scoring_bit_for_bit():
+    rng = random.Random(0)
+    for _ in range(500):
+        size1 = (rng.randint(100, 5000), rng.randint(100, 5000))
+        size2 = (rng.randint(100, 5000), rng.randint(100, 5000))
+        face1, face2 = random_face(rng, size1), random_face(rng, size2)
+
+        expected, expected_common = dict_score(face1.landmarks, size1, face2.landmarks, size2)
+        avg_dist, common = mean_distance(
+            normalize_points(face1.points, size1), face1.mask, normalize_points(face2.points, size2), face2.mask
+        )
+
+        assert common == expected_common
+        if common:
+            assert avg_dist == expected
+            assert landmark_similarity(avg_dist) == landmark_similarity(expected)
+
+
+def test_one_vs_many_agrees_with_mean_distance():
+    rng = random.Random(1)
+    size = (1200, 1600)
+    probe = random_face(rng, size)
+    gallery = [random_face(rng, size) for _ in range(50)]
+
+    similarities, counts = one_vs_many(
+        normalize_points(probe.points, size), probe.mask,
+        normalize_points(np.stack([face.points for face in gallery]), size), np.stack([face.mask for face in gallery])
+    )
+
+    for face, similarity, count in zip(gallery, similarities, counts):
+        avg_dist, common = mean_distance(
+            normalize_points(probe.points, size), probe.mask, normalize_points(face.points, size), face.mask
+        )
+        assert count == common
+        if common < MIN_COMMON_LANDMARKS:
+            assert np.isnan(similarity)
+        else:
+            # Summed in a different order, so equal up to rounding
+            assert np.isclose(similarity, landmark_similarity(avg_dist), rtol=0, atol=1e-9)
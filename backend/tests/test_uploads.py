@@ -0,0 +1,38 @@
+import pytest
+from flask import Flask, request
+
+from uploads import Upload, UploadError
+
+
+app = Flask(__name__)
+
+
+def upload(**kwargs):
+    with app.test_request_context('/', method='POST', **kwargs):
+        return Upload(request)
+
+
+def test_numbers_from_json_and_form_values():
+    json_upload = upload(json={'top_k': 3, 'min_similarity': 42.5})
+    assert json_upload.number('top_k', 10) == 3
+    assert json_upload.number('min_similarity', 0.0, float) == 42.5
+    assert json_upload.number('max_faces', 7) == 7
+
+    form_upload = upload(
+        data={'top_k': ' 4 ', 'sample_fps': '0.5', 'dedup_distance': ''}, content_type='multipart/form-data'
+    )
+    assert form_upload.number('top_k', 10) == 4
+    assert form_upload.number('sample_fps', 2.0, float) == 0.5
+    assert form_upload.number('dedup_distance', 6) == 6
+
+
+@pytest.mark.parametrize('value', ['abc', '2.5', 'nan', True, [3], {'k': 1}])
+def test_non_numeric_values_are_upload_errors(value):
+    with pytest.raises(UploadError, match='top_k'):
+        upload(json={'top_k': value}).number('top_k', 10)
+
+
+def test_values_below_the_minimum_are_upload_errors():
+    with pytest.raises(UploadError, match='at least 1'):
+        upload(json={'top_k': 0}).number('top_k', 10, minimum=1)
+    assert upload(json={'top_k': 0}).number('top_k', 10, minimum=0) == 0
@@ -0,0 +1,173 @@
+"""
+Image upload parsing for the API endpoints.
+
+Three request formats are accepted:
+
+    application/json          images as base64 strings (original API, old clients)
+    multipart/form-data       images as file parts, other fields as form values
+    application/octet-stream  the raw bytes of a single image, options in the query string
+
+Binary uploads are handed out as zero-copy views where possible: a raw
+body is read straight from the request stream into one buffer, and
+multipart parts that werkzeug kept in memory are exposed through their
+BytesIO buffer, so np.frombuffer / cv2.imdecode see the original bytes.
+Large files (video clips) can instead be streamed to disk with save(),
+reading a raw body in STREAM_CHUNK_SIZE pieces.
+"""
+import base64
+import io
+import math
+import shutil
+
+
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+
+class UploadError(Exception):
+    pass
+
+
+def as_bytes(image_data):
+    """Materialise a bytes-like view for APIs that insist on bytes"""
+    return image_data if isinstance(image_data, bytes) else bytes(image_data)
+
+
+def _read_stream(stream, length):
+    buffer = bytearray(length)
+    view = memoryview(buffer)
+    read = 0
+    while read < length:
+        n = stream.readinto(view[read:])
+        if not n:
+            break
+        read += n
+    return view[:read]
+
+
+def _file_view(storage):
+    stream = storage.stream
+    if isinstance(stream, io.BytesIO):
+        return stream.getbuffer()
+    return memoryview(storage.read())
+
+
+class Upload:
+    """Images and parameters from a request, whatever its format"""
+
+    def __init__(self, request, raw_field=None, buffer_raw=True):
+        content_type = request.mimetype
+        self._request = request
+        self._raw_field = raw_field
+        self._raw = None
+
+        if content_type == 'application/json':
+            self.mode = 'json'
+            data = request.get_json(silent=True)
+            if not isinstance(data, dict):
+                raise UploadError("Invalid JSON body")
+            self.params = data
+        elif content_type == 'multipart/form-data':
+            self.mode = 'multipart'
+            self.params = dict(request.args.to_dict(), **request.form.to_dict())
+        elif content_type == 'application/octet-stream':
+            if raw_field is None:
+                raise UploadError("This endpoint needs JSON or multipart/form-data")
+            self.mode = 'raw'
+            self.params = request.args.to_dict()
+            length = request.content_length
+            if not buffer_raw:
+                # Left on the stream for save()
+                self._raw = None
+            elif length is None:
+                self._raw = memoryview(request.get_data(cache=False))
+            else:
+                self._raw = _read_stream(request.stream, length)
+        else:
+            raise UploadError(f"Unsupported content type '{content_type}'")
+
+    def image(self, field):
+        """Bytes-like image data for field, or None if it wasn't sent"""
+        if self.mode == 'json':
+            value = self.params.get(field)
+            return base64.b64decode(value) if value else None
+        if self.mode == 'multipart':
+            storage = self._request.files.get(field)
+            if storage is not None:
+                return _file_view(storage)
+            value = self._request.form.get(field)
+            return base64.b64decode(value) if value else None
+        if field == self._raw_field and self._raw is not None and len(self._raw):
+            return self._raw
+        return None
+
+    def save(self, field, f):
+        """
+        Copy the file sent under field into the open binary file f without
+        holding it in memory (JSON base64 is decoded in one go). Returns
+        the number of bytes written, 0 if it wasn't sent.
+        """
+        start = f.tell()
+        if self.mode == 'raw' and field == self._raw_field and self._raw is None:
+            shutil.copyfileobj(self._request.stream, f, STREAM_CHUNK_SIZE)
+        elif self.mode == 'multipart' and field in self._request.files:
+            shutil.copyfileobj(self._request.files[field].stream, f, STREAM_CHUNK_SIZE)
+        else:
+            data = self.image(field)
+            if data is not None:
+                f.write(data)
+        return f.tell() - start
+
+    def images(self, field):
+        """All images sent under field (a JSON list or repeated file parts)"""
+        if self.mode == 'json':
+            return [base64.b64decode(value) for value in self.params.get(field) or []]
+        if self.mode == 'multipart':
+            return [_file_view(storage) for storage in self._request.files.getlist(field)]
+        image = self.image(field)
+        return [image] if image is not None else []
+
+    def has(self, field):
+        if self.mode == 'json':
+            return bool(self.params.get(field))
+        if self.mode == 'multipart':
+            return field in self._request.files or bool(self._request.form.get(field))
+        return field == self._raw_field and (self._raw is None or len(self._raw) > 0)
+
+    def get(self, key, default=None):
+        return self.params.get(key, default)
+
+    def values(self, key):
+        """A list parameter: JSON list, or repeated form/query fields"""
+        if self.mode == 'json':
+            return list(self.params.get(key) or [])
+        if self.mode == 'multipart':
+            return self._request.form.getlist(key) or self._request.args.getlist(key)
+        return self._request.args.getlist(key)
+
+    def number(self, key, default, kind=int, minimum=None):
+        """
+        A numeric parameter as kind (int or float); form and query values
+        arrive as strings. Anything else, or a value below minimum, is an
+        UploadError.
+        """
+        value = self.params.get(key)
+        if value is None or value == '':
+            return default
+        try:
+            if isinstance(value, bool):
+                raise ValueError(value)
+            number = kind(value.strip() if isinstance(value, str) else value)
+            if not math.isfinite(number):
+                raise ValueError(value)
+        except (TypeError, ValueError):
+            raise UploadError(f"{key} must be a{'n integer' if kind is int else ' number'}")
+        if minimum is not None and number < minimum:
+            raise UploadError(f"{key} must be at least {minimum}")
+        return number
+
+    def flag(self, key, default=False):
+        """A boolean parameter; form and query values arrive as strings"""
+        value = self.params.get(key, default)
+        if isinstance(value, str):
+            return value.strip().lower() in ('1', 'true', 'yes', 'on')
+        return bool(value)
@@ -0,0 +1,171 @@
+"""
+Nearest-neighbour index over MobileNetV2 embeddings.
+
+The vectors themselves live in an EmbeddingMatrix (embedding_matrix.py):
+L2-normalised rows in one memory-mapped file plus an append-only ID
+table, so every gunicorn worker searches the same collection and sees
+rows added or removed by any other worker on its next search. Cosine
+similarity against the whole collection is then a single matmul.
+
+Once the collection grows past ``ivf_threshold`` an inverted-file (IVF)
+layer is built on top: rows are bucketed by their nearest k-means
+centroid and a query only scores the rows in its ``n_probe`` closest
+buckets. The centroids and buckets are small and kept per process; rows
+appended since the last build are bucketed when they are picked up.
+"""
+import threading
+
+import numpy as np
+
+from embedding_matrix import SCORE_CHUNK_ROWS
+
+
+# k-means is trained on at most this many rows, then every row is bucketed
+IVF_TRAINING_ROWS = 65536
+
+
+def normalize(vector):
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def kmeans(data, k, iterations=10, seed=0):
+    """Plain Lloyd's k-means on unit vectors (cosine distance)"""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), size=k, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = np.argmax(data @ centroids.T, axis=1)
+        for c in range(k):
+            members = data[assignments == c]
+            if len(members):
+                centroids[c] = normalize(members.mean(axis=0))
+            else:
+                # Re-seed empty clusters so no centroid is wasted
+                centroids[c] = data[rng.integers(len(data))]
+
+    return centroids, np.argmax(data @ centroids.T, axis=1)
+
+
+class VectorIndex:
+    """Cosine top-k index with add/remove and optional IVF search, stored in an EmbeddingMatrix"""
+
+    def __init__(self, matrix, ivf_threshold=5000, n_probe=8):
+        self.matrix = matrix
+        self.ivf_threshold = ivf_threshold
+        self.n_probe = n_probe
+        self._centroids = None
+        self._buckets = None
+        self._bucketed_rows = 0
+        self._built_size = 0
+        self._generation = matrix.generation
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        self.matrix.refresh()
+        return len(self.matrix)
+
+    def __contains__(self, item_id):
+        self.matrix.refresh()
+        return item_id in self.matrix
+
+    @property
+    def mode(self):
+        return 'ivf' if self._centroids is not None else 'exact'
+
+    def add(self, item_id, vector):
+        """Add or replace the vector stored under item_id"""
+        self.matrix.append([item_id], [vector])
+        self._sync()
+
+    def remove(self, item_id):
+        """Remove item_id; returns False if it was not indexed"""
+        removed = self.matrix.remove(item_id)
+        self._sync()
+        return removed
+
+    def _sync(self):
+        """Pick up other processes' changes and keep the IVF layer in step with the collection"""
+        self.matrix.refresh()
+        size = len(self.matrix)
+        with self._lock:
+            if self._generation != self.matrix.generation:
+                # Compaction renumbered the rows the buckets hold
+                self._generation = self.matrix.generation
+                self._drop_ivf()
+            if size < self.ivf_threshold // 2:
+                self._drop_ivf()
+            elif size >= self.ivf_threshold and (self._centroids is None or size >= 2 * self._built_size):
+                # Re-cluster whenever the collection has doubled since the
+                # last build so bucket sizes stay balanced.
+                self.build()
+            elif self._centroids is not None and self._bucketed_rows < self.matrix.rows:
+                self._assign(np.arange(self._bucketed_rows, self.matrix.rows))
+                self._bucketed_rows = self.matrix.rows
+
+    def _drop_ivf(self):
+        self._centroids = None
+        self._buckets = None
+        self._bucketed_rows = 0
+        self._built_size = 0
+
+    def _assign(self, rows):
+        """Add rows to the bucket of their nearest centroid"""
+        for start in range(0, len(rows), SCORE_CHUNK_ROWS):
+            chunk = rows[start:start + SCORE_CHUNK_ROWS]
+            assignments = np.argmax(self.matrix.vectors(chunk) @ self._centroids.T, axis=1)
+            for bucket in np.unique(assignments):
+                self._buckets[bucket].append(chunk[assignments == bucket])
+
+    def build(self):
+        """(Re)build the IVF buckets over the current collection"""
+        with self._lock:
+            self.matrix.refresh()
+            rows = self.matrix.live_rows()
+            if len(rows) == 0:
+                self._drop_ivf()
+                return
+            n_lists = max(1, int(np.sqrt(len(rows))))
+            sample = rows
+            if len(rows) > IVF_TRAINING_ROWS:
+                sample = np.sort(np.random.default_rng(0).choice(rows, size=IVF_TRAINING_ROWS, replace=False))
+            self._centroids, _ = kmeans(self.matrix.vectors(sample), n_lists)
+            self._buckets = [[] for _ in range(n_lists)]
+            self._assign(rows)
+            # Dead rows are never bucketed again; new ones are by _sync()
+            self._bucketed_rows = self.matrix.rows
+            self._built_size = len(rows)
+            self._generation = self.matrix.generation
+
+    def search(self, vector, top_k=10, min_similarity=None, exact=False):
+        """
+        Return [(item_id, cosine_similarity), ...] best first.
+        exact=True forces a full scan even when the IVF layer exists.
+        """
+        self._sync()
+        with self._lock:
+            centroids, buckets = self._centroids, self._buckets
+        if centroids is None or exact:
+            return self.matrix.search(vector, top_k, min_similarity)
+
+        query = normalize(vector)
+        n_probe = min(self.n_probe, len(centroids))
+        closest = np.argpartition(-(centroids @ query), n_probe - 1)[:n_probe]
+        parts = [part for bucket in closest for part in buckets[bucket]]
+        if not parts:
+            return []
+        # Dead rows are still in the buckets; the matrix skips them
+        return self.matrix.search_many([vector], top_k, min_similarity, rows=np.concatenate(parts))[0]
+
+    def stats(self):
+        self.matrix.refresh()
+        with self._lock:
+            return {
+                'size': len(self.matrix),
+                'mode': self.mode,
+                'lists': len(self._centroids) if self._centroids is not None else 0,
+                'n_probe': self.n_probe,
+                'ivf_threshold': self.ivf_threshold,
+                'matrix': self.matrix.stats()
+            }
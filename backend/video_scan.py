@@ -0,0 +1,91 @@
+"""
+Frame sampling for video clip scanning.
+
+A clip is read sequentially with cv2.VideoCapture and thinned out before
+anything reaches the model:
+
+    rate        only every round(fps / sample_fps)-th frame is decoded to
+                pixels (the others are grab()bed and dropped)
+    duplicates  a sampled frame whose dHash is within dedup_distance bits
+                of the previously kept frame is skipped, so a static CCTV
+                scene costs one embedding, not one per second
+    size        kept frames are shrunk to min_side on the short side
+
+Frames come out of a generator and are batched by the caller, so memory
+stays at one batch of small frames however long the clip is.
+"""
+import math
+
+import cv2
+
+from perceptual_hash import dhash, hamming_distance
+
+
+# Used when the container doesn't report a frame rate
+DEFAULT_FPS = 25.0
+
+
+def shrink(frame, min_side):
+    height, width = frame.shape[:2]
+    if not min_side or min(height, width) <= min_side:
+        return frame
+    scale = min_side / min(height, width)
+    return cv2.resize(frame, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+
+
+def sample_frames(path, sample_fps=2.0, dedup_distance=6, max_frames=None, min_side=224, stats=None):
+    """
+    Yield (frame index, timestamp in seconds, BGR frame) for the frames of
+    the video at path that survive sampling and near-duplicate skipping.
+    Counts go into stats: fps, frames, sampled, duplicates, kept, truncated.
+    """
+    stats = {} if stats is None else stats
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError("Could not open video")
+
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS)
+        if not fps or math.isnan(fps) or fps <= 0:
+            fps = DEFAULT_FPS
+        step = max(1, round(fps / sample_fps)) if sample_fps else 1
+        stats.update(fps=fps, frames=0, sampled=0, duplicates=0, kept=0, truncated=False)
+
+        index = -1
+        last_hash = None
+        while capture.grab():
+            index += 1
+            stats['frames'] += 1
+            if index % step:
+                continue
+            ok, frame = capture.retrieve()
+            if not ok:
+                continue
+            stats['sampled'] += 1
+
+            frame = shrink(frame, min_side)
+            frame_hash = dhash(frame)
+            if last_hash is not None and hamming_distance(frame_hash, last_hash) <= dedup_distance:
+                stats['duplicates'] += 1
+                continue
+            last_hash = frame_hash
+
+            if max_frames and stats['kept'] >= max_frames:
+                stats['truncated'] = True
+                break
+            stats['kept'] += 1
+            yield index, index / fps, frame
+    finally:
+        capture.release()
+
+
+def batches(items, size):
+    """Lists of up to size consecutive items from any iterable"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch